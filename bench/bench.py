@@ -0,0 +1,442 @@
+"""
+Benchmark end-to-end senzor -> edge -> cloud, totul într-un singur proces:
+cloud/app.py servit de uvicorn pe loopback cu o bază SQLite temporară, edge/app.py cu thread-urile
+lui reale (paho, parse workers, spool, posters) conectat la un broker MQTT minimal din memorie.
+
+    python bench/bench.py generate --messages 200000 -o bench/workload.jsonl
+    python bench/bench.py run --workload bench/workload.jsonl --scales 1000000,10000000 -o results.json
+    python bench/bench.py compare results-old.json results-new.json
+
+`run` măsoară:
+  * pipeline: rânduri/s ingerate și latența senzor->cloud (ingest_ms - ts) / senzor->edge, p50/p99;
+    `ts` e re-ștampilat la publicare, deci workload-ul înregistrat se poate refolosi;
+  * queries: /recent, /last, /latest_gps după ce baza e umplută (prin POST /ingest, în formatul
+    negociat de edge) până la fiecare prag din --scales; „cold” = cache-ul de răspunsuri invalidat
+    înainte de fiecare cerere (drumul prin SQLite), „warm” = servit din cache;
+  * RSS-ul de vârf al procesului.
+Rezultatul e un JSON (cu commit-ul git), comparabil între commit-uri cu `compare`.
+Necesită dependențele din cloud/requirements.txt și edge/requirements.txt.
+"""
+import argparse, asyncio, importlib.util, json, os, platform, resource, socket, sqlite3, subprocess
+import sys, tempfile, threading, time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sensor_sim import make_devices, now_iso, percentiles  # noqa: E402
+
+# -------------------------- Broker MQTT în memorie --------------------------
+def _remaining_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        n, digit = divmod(n, 128)
+        out.append(digit | (128 if n else 0))
+        if not n:
+            return bytes(out)
+
+def _topic_matches(flt: str, topic: str) -> bool:
+    f, t = flt.split("/"), topic.split("/")
+    for i, part in enumerate(f):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(f) == len(t)
+
+class InMemoryBroker:
+    """
+    Stand-in MQTT 3.1.1, doar QoS 0: CONNECT/SUBSCRIBE/PUBLISH/PINGREQ/DISCONNECT, rutare în memorie.
+    Rulează pe loopback, ca edge-ul să-și folosească clientul paho neschimbat.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.subs: List[Tuple[str, asyncio.StreamWriter]] = []
+        self.port = 0
+
+    def start(self) -> int:
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            server = self.loop.run_until_complete(asyncio.start_server(self._client, "127.0.0.1", 0))
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self.port
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, mult = 0, 1
+                while True:
+                    b = (await reader.readexactly(1))[0]
+                    length += (b & 127) * mult
+                    mult *= 128
+                    if not b & 128:
+                        break
+                body = await reader.readexactly(length)
+                kind = header >> 4
+                if kind == 1:                                        # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == 8:                                      # SUBSCRIBE
+                    pos, granted = 2, bytearray()
+                    while pos < len(body):
+                        n = int.from_bytes(body[pos:pos + 2], "big")
+                        self.subs.append((body[pos + 2:pos + 2 + n].decode(), writer))
+                        pos += 3 + n
+                        granted.append(0)
+                    writer.write(b"\x90" + _remaining_length(2 + len(granted)) + body[:2] + bytes(granted))
+                elif kind == 3:                                      # PUBLISH (de la alți clienți)
+                    n = int.from_bytes(body[:2], "big")
+                    qos = (header >> 1) & 3
+                    topic = body[2:2 + n].decode()
+                    payload = body[2 + n + (2 if qos else 0):]
+                    if qos == 1:
+                        writer.write(b"\x40\x02" + body[2 + n:4 + n])
+                    self._route([(topic, payload)])
+                elif kind == 12:                                     # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14:                                     # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.subs = [(f, w) for f, w in self.subs if w is not writer]
+            writer.close()
+
+    def _route(self, messages: List[Tuple[str, bytes]]) -> List[asyncio.StreamWriter]:
+        touched = []
+        for topic, payload in messages:
+            t = topic.encode()
+            packet = None
+            for flt, writer in self.subs:
+                if _topic_matches(flt, topic):
+                    if packet is None:
+                        body = len(t).to_bytes(2, "big") + t + payload
+                        packet = b"\x30" + _remaining_length(len(body)) + body
+                    writer.write(packet)
+                    touched.append(writer)
+        return touched
+
+    async def _publish(self, messages: List[Tuple[str, bytes]]):
+        for writer in set(self._route(messages)):
+            await writer.drain()                 # backpressure: subscriberul lent încetinește publicarea
+
+    def publish_many(self, messages: List[Tuple[str, bytes]]) -> None:
+        asyncio.run_coroutine_threadsafe(self._publish(messages), self.loop).result()
+
+    def subscribers(self) -> int:
+        return len(self.subs)
+
+# -------------------------- Utilitare --------------------------
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)   # Linux: KiB
+
+def git_info() -> Dict[str, Any]:
+    try:
+        commit = subprocess.check_output(["git", "-C", ROOT, "rev-parse", "HEAD"], text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "-C", ROOT, "status", "--porcelain", "-uno"], text=True).strip())
+        return {"commit": commit, "dirty": dirty}
+    except Exception:
+        return {"commit": None, "dirty": None}
+
+def wait_for(cond, timeout: float, interval: float = 0.05) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(interval)
+    return False
+
+def generate_workload(messages: int, devices: int, products: int, seed: int, rate: float) -> Iterator[Dict[str, Any]]:
+    """Mesaje {"topic", "payload"} de la dispozitivele din sensor_sim, în ordinea round-robin a simulatorului."""
+    fleet = make_devices(devices, products, seed)
+    for k in range(messages):
+        dev = fleet[k % len(fleet)]
+        yield {"topic": dev.topic, "payload": dev.payload(k / rate)}
+
+def read_workload(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# -------------------------- Faze --------------------------
+class Harness:
+    def __init__(self, workdir: str):
+        os.environ["DB_PATH"] = self.db_path = os.path.join(workdir, "cloud.db")
+        self.cloud = load_module("bench_cloud_app", os.path.join(ROOT, "cloud", "app.py"))
+        port = free_port()
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(self.cloud.app, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=self.server.run, daemon=True).start()
+        wait_for(lambda: self.server.started, 15)
+        self.cloud_url = f"http://127.0.0.1:{port}"
+
+        self.broker = InMemoryBroker()
+        os.environ.update({
+            "MQTT_HOST": "127.0.0.1",
+            "MQTT_PORT": str(self.broker.start()),
+            "CLOUD_INGEST_URL": self.cloud_url + "/ingest",
+            "SPOOL_DIR": os.path.join(workdir, "spool"),
+        })
+        self.edge = load_module("bench_edge_app", os.path.join(ROOT, "edge", "app.py"))
+        self.edge.start_background()         # fără uvicorn: thread-urile nu pornesc din lifespan
+        if not wait_for(lambda: self.broker.subscribers() > 0, 15):
+            raise RuntimeError("edge did not subscribe to the broker stand-in")
+
+        import requests
+        self.http = requests.Session()
+
+    def db(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+
+    def row_count(self) -> int:
+        with self.db() as con:
+            return con.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0]
+
+    def drained(self, published: int) -> bool:
+        edge, cloud = self.edge, self.cloud
+        return (edge.metrics["messages_in"] >= published and len(edge.inbox) == 0
+                and edge.spool.active is None and edge.spool.stats()["segments"] == 0
+                and cloud.ingest_queue.empty())
+
+    def settled(self, published: int, quiet_sec: float = 0.5) -> bool:
+        """Golit și fără rânduri noi timp de `quiet_sec` (un worker poate fi încă în mijlocul unei bucăți)."""
+        if not self.drained(published):
+            return False
+        before = self.row_count()
+        time.sleep(quiet_sec)
+        return self.drained(published) and self.row_count() == before
+
+    def pipeline(self, workload: Iterator[Dict[str, Any]], rate: float, chunk: int, timeout: float) -> Dict[str, Any]:
+        """Publică workload-ul prin broker (open-loop la `rate` msg/s; 0 = cât de repede se poate)."""
+        start_ms = int(time.time() * 1000)
+        t0 = time.perf_counter()
+        published = 0
+        batch: List[Tuple[str, bytes]] = []
+        for msg in workload:
+            payload = msg["payload"]
+            payload["ts"] = now_iso()                      # latența se măsoară de la publicare
+            batch.append((msg["topic"], json.dumps(payload).encode()))
+            if len(batch) >= chunk:
+                self.broker.publish_many(batch)
+                published += len(batch)
+                batch = []
+                if rate > 0:
+                    delay = t0 + published / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        if batch:
+            self.broker.publish_many(batch)
+            published += len(batch)
+        publish_sec = time.perf_counter() - t0
+        if not wait_for(lambda: self.settled(published), timeout, 0.1):
+            print(f"[BENCH] pipeline not drained after {timeout}s", flush=True)
+
+        with self.db() as con:
+            first_ms, last_ms, rows = con.execute(
+                "SELECT MIN(ingest_ms), MAX(ingest_ms), COUNT(*) FROM telemetry WHERE ingest_ms >= ?",
+                (start_ms,)).fetchone()
+            to_cloud = [r[0] / 1000 for r in con.execute(
+                "SELECT ingest_ms - ts_ms FROM telemetry WHERE ingest_ms >= ? AND sensor != 'alert' AND ts_ms IS NOT NULL",
+                (start_ms,))]
+            to_edge = [r[0] / 1000 for r in con.execute(
+                "SELECT edge_latency_ms FROM telemetry WHERE ingest_ms >= ? AND sensor != 'alert' "
+                "AND edge_latency_ms IS NOT NULL", (start_ms,))]
+        elapsed = max((last_ms or start_ms) - start_ms, 1) / 1000
+        return {
+            "messages": published,
+            "rate_target": rate,
+            "publish_sec": round(publish_sec, 3),
+            "rows": rows,
+            "elapsed_sec": round(elapsed, 3),
+            "rows_per_sec": round(rows / elapsed, 1),
+            "sensor_to_cloud_ms": percentiles(to_cloud),
+            "sensor_to_edge_ms": percentiles(to_edge),
+            "edge": {k: self.edge.metrics.get(k) for k in
+                     ("wire", "batches_sent", "post_retries", "inbox_dropped", "parse_errors", "alert_events")},
+        }
+
+    def fill(self, target: int, batch: int, seed: int) -> float:
+        """Umple baza până la `target` rânduri prin POST /ingest, cu items produse de edge.parse_message."""
+        t0 = time.perf_counter()
+        have = self.row_count()
+        fleet = make_devices(600, 50, seed + have)
+        k = 0
+        while have + k < target:
+            n = min(batch, target - have - k)
+            now_ms = int(time.time() * 1000)
+            lines = []
+            for j in range(n):
+                dev = fleet[(k + j) % len(fleet)]
+                payload = dev.payload((k + j) / 1000)
+                payload["id"] = f"fill-{have + k + j:010d}"
+                item = self.edge.parse_message(dev.topic, json.dumps(payload).encode(), now_ms)
+                lines.append(self.edge.json_dumps(item) + b"\n")
+            body, headers = self.edge.encode_batch(b"".join(lines))
+            while True:
+                resp = self.http.post(self.cloud_url + "/ingest", data=body, headers=headers, timeout=60)
+                if resp.status_code not in (429, 503):
+                    break
+                time.sleep(0.05)                              # coadă plină: reîncercare (id-uri idempotente)
+            resp.raise_for_status()
+            k += n
+        wait_for(self.cloud.ingest_queue.empty, 60)
+        return round(time.perf_counter() - t0, 3)
+
+    def queries(self, n: int) -> Dict[str, Any]:
+        out = {}
+        for path in ("/recent?n=200", "/last?n=200", "/latest_gps"):
+            url = self.cloud_url + path
+            result = {}
+            for mode in ("cold", "warm"):
+                samples = []
+                for _ in range(n):
+                    if mode == "cold":
+                        self.cloud.bump_generation()         # invalidează cache-ul de răspunsuri
+                    t = time.perf_counter()
+                    resp = self.http.get(url, timeout=60)
+                    resp.raise_for_status()
+                    samples.append(time.perf_counter() - t)
+                result[f"{mode}_ms"] = percentiles(samples, (0.5, 0.99))
+            result["bytes"] = len(resp.content)
+            out[path.split("?")[0]] = result
+        return out
+
+    def close(self):
+        self.server.should_exit = True
+
+def cmd_generate(args):
+    with open(args.output, "w") as f:
+        for msg in generate_workload(args.messages, args.devices, args.products, args.seed, args.rate or 1000):
+            f.write(json.dumps(msg) + "\n")
+    print(f"[BENCH] {args.messages} messages -> {args.output}")
+
+def cmd_run(args):
+    scales = [int(s) for s in args.scales.split(",") if s.strip()] if args.scales else []
+    result: Dict[str, Any] = {
+        "bench": "pipeline",
+        "git": git_info(),
+        "started": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k != "func"},
+        "rss_mb": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="tweb-bench-", dir=args.workdir) as workdir:
+        harness = Harness(workdir)
+        result["rss_mb"]["startup"] = rss_mb()
+        try:
+            workload = (read_workload(args.workload) if args.workload else
+                        generate_workload(args.messages, args.devices, args.products, args.seed, args.rate or 1000))
+            print("[BENCH] pipeline ...", flush=True)
+            result["pipeline"] = harness.pipeline(workload, args.rate, args.chunk, args.timeout)
+            result["rss_mb"]["pipeline"] = rss_mb()
+            print(f"[BENCH] pipeline {json.dumps(result['pipeline'])}", flush=True)
+
+            result["queries"] = {}
+            for scale in sorted(scales):
+                print(f"[BENCH] fill to {scale} rows ...", flush=True)
+                fill_sec = harness.fill(scale, args.fill_batch, args.seed)
+                entry = {"rows": harness.row_count(), "fill_sec": fill_sec, "endpoints": harness.queries(args.queries)}
+                result["queries"][str(scale)] = entry
+                result["rss_mb"][f"rows_{scale}"] = rss_mb()
+                print(f"[BENCH] queries@{scale} {json.dumps(entry)}", flush=True)
+        finally:
+            harness.close()
+    result["rss_mb"]["peak"] = peak_rss_mb()
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+def _flatten(obj: Any, prefix: str = "") -> Dict[str, float]:
+    out = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = obj
+    return out
+
+def cmd_compare(args):
+    """Diferențele numerice dintre două rezultate (ex. commit-ul de bază vs cel nou)."""
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"old: {old.get('git', {}).get('commit')}  new: {new.get('git', {}).get('commit')}")
+    a, b = _flatten({k: old.get(k) for k in ("pipeline", "queries", "rss_mb")}), \
+        _flatten({k: new.get(k) for k in ("pipeline", "queries", "rss_mb")})
+    for key in sorted(set(a) | set(b)):
+        x, y = a.get(key), b.get(key)
+        delta = f"{(y - x) / x * 100:+.1f}%" if x and y is not None else ""
+        print(f"{key:60} {x!s:>14} {y!s:>14} {delta:>9}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark senzor -> edge -> cloud (in-process)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def workload_args(p):
+        p.add_argument("--messages", type=int, default=100_000)
+        p.add_argument("--devices", type=int, default=600)
+        p.add_argument("--products", type=int, default=50)
+        p.add_argument("--seed", type=int, default=42)
+        p.add_argument("--rate", type=float, default=0, help="msg/s la publicare (0 = maxim)")
+
+    g = sub.add_parser("generate", help="scrie un workload JSONL")
+    workload_args(g)
+    g.add_argument("-o", "--output", default=os.path.join(ROOT, "bench", "workload.jsonl"))
+    g.set_defaults(func=cmd_generate)
+
+    r = sub.add_parser("run", help="rulează benchmark-ul")
+    workload_args(r)
+    r.add_argument("--workload", help="JSONL {topic, payload}; implicit: generat din sensor_sim")
+    r.add_argument("--chunk", type=int, default=500, help="mesaje publicate odată în broker")
+    r.add_argument("--timeout", type=float, default=300, help="așteptarea maximă pentru golirea pipeline-ului")
+    r.add_argument("--scales", default="1000000,10000000", help="rânduri în bază pentru măsurarea query-urilor")
+    r.add_argument("--fill-batch", type=int, default=5000)
+    r.add_argument("--queries", type=int, default=200, help="cereri per endpoint și mod")
+    r.add_argument("--workdir", help="director pentru baza temporară (implicit: tmp)")
+    r.add_argument("-o", "--output", help="fișierul JSON cu rezultatele")
+    r.set_defaults(func=cmd_run)
+
+    c = sub.add_parser("compare", help="compară două rezultate JSON")
+    c.add_argument("old")
+    c.add_argument("new")
+    c.set_defaults(func=cmd_compare)
+
+    args = ap.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,68 @@
 # cloud-api/app.py
-import os, json, sqlite3
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import asyncio, csv, io, math, os, json, queue, sqlite3, threading, time, uuid, zlib
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-from fastapi import FastAPI, Body, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# formate de transfer opționale (negociate cu edge-ul prin /ingest/formats)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
 
 DB_PATH = os.environ.get("DB_PATH", "/data/cloud.db")
 DEFAULT_RECENT_SEC = int(os.environ.get("RECENT_SEC", "300"))
 
-app = FastAPI(title="Cloud API - SupplyChain")
+# storage: un singur writer (group commit) + pool de conexiuni read-only
+INGEST_QUEUE_MAX = int(os.environ.get("INGEST_QUEUE_MAX", "256"))      # batch-uri în așteptare
+GROUP_COMMIT_MAX = int(os.environ.get("GROUP_COMMIT_MAX", "64"))       # batch-uri / tranzacție
+INGEST_WAIT_SEC = float(os.environ.get("INGEST_WAIT_SEC", "30"))
+INGEST_RETRY_AFTER_SEC = int(os.environ.get("INGEST_RETRY_AFTER_SEC", "1"))
+READ_POOL_SIZE = int(os.environ.get("READ_POOL_SIZE", "4"))
+INGEST_MAX_BYTES = int(os.environ.get("INGEST_MAX_BYTES", str(64 * 1024 * 1024)))  # după decompresie
+STATS_PERSIST_SEC = float(os.environ.get("STATS_PERSIST_SEC", "10"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # cache răspunsuri
+CACHE_RECENT_GRAIN_MS = int(os.environ.get("CACHE_RECENT_GRAIN_MS", "1000"))     # granularitate /recent
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "5000"))   # rânduri / fetchmany la /export
+GRID_MAX_CELLS = int(os.environ.get("GRID_MAX_CELLS", "40000"))       # /gps/grid: celule posibile în bbox
+
+# /stream (SSE): rândurile noi + /metrics, publicate o dată de writer și distribuite abonaților
+STREAM_QUEUE_MAX = int(os.environ.get("STREAM_QUEUE_MAX", "256"))      # evenimente / abonat
+STREAM_METRICS_SEC = float(os.environ.get("STREAM_METRICS_SEC", "1"))
+STREAM_KEEPALIVE_SEC = float(os.environ.get("STREAM_KEEPALIVE_SEC", "15"))
+STREAM_BACKFILL_MAX = int(os.environ.get("STREAM_BACKFILL_MAX", "2000"))  # la reconectare (Last-Event-ID)
+
+# partiții zilnice + retenție: raw -> agregate orare -> agregate zilnice
+RAW_RETENTION_DAYS = float(os.environ.get("RAW_RETENTION_DAYS", "30"))
+HOURLY_RETENTION_DAYS = float(os.environ.get("HOURLY_RETENTION_DAYS", "365"))
+MAINTENANCE_INTERVAL_SEC = float(os.environ.get("MAINTENANCE_INTERVAL_SEC", "3600"))
+# cât de târziu poate sosi un retry: id-urile se verifică și în partițiile din fereastra asta
+DEDUPE_WINDOW_SEC = float(os.environ.get("DEDUPE_WINDOW_SEC", "21600"))
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # thread-urile pornesc doar când modulul e servit (nu la import: CLI-ul `rebuild-latest`, teste)
+    start_background()
+    yield
+
+app = FastAPI(title="Cloud API - SupplyChain", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,39 +70,84 @@ app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
+# -------------------------- Instrumentare (Prometheus, /metrics/prom) --------------------------
+# bucket-uri comune cu edge-ul: latențe în secunde, mărimi de batch în items / bytes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ITEMS_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(9))     # 1 KiB .. 64 MiB
+
+HTTP_SECONDS = Histogram("cloud_http_request_seconds", "Timp până la răspuns (headers), per endpoint",
+                         ["endpoint", "status"], buckets=LATENCY_BUCKETS)
+INGEST_DECODE_SECONDS = Histogram("cloud_ingest_decode_seconds", "Decodare batch /ingest",
+                                  buckets=LATENCY_BUCKETS)
+INGEST_COMMIT_SECONDS = Histogram("cloud_ingest_commit_seconds", "Tranzacție writer (group commit)",
+                                  buckets=LATENCY_BUCKETS)
+INGEST_GROUP_BATCHES = Histogram("cloud_ingest_group_batches", "Batch-uri per tranzacție",
+                                 buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+INGEST_BATCH_ITEMS = Histogram("cloud_ingest_batch_items", "Items per batch /ingest", buckets=ITEMS_BUCKETS)
+INGEST_BATCH_BYTES = Histogram("cloud_ingest_batch_bytes", "Bytes per batch /ingest (pe fir)",
+                               buckets=BYTES_BUCKETS)
+INGEST_ROWS = Counter("cloud_ingest_rows", "Rânduri telemetry", ["result"])     # inserted | duplicate
+INGEST_BATCHES = Counter("cloud_ingest_batches", "Batch-uri /ingest", ["result"])  # applied | duplicate | unsequenced
+EDGE_LOST_BATCHES = Counter("cloud_edge_lost_batches", "Seq-uri sărite de edge (segmente aruncate / carantină)")
+ERRORS = Counter("cloud_errors", "Erori după cauză", ["cause"])
+
+class LatencyMiddleware:
+    """
+    ASGI pur (fără BaseHTTPMiddleware): măsoară până la `http.response.start`, deci pentru
+    /stream și /export timpul până la primul byte, nu durata conexiunii.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                HTTP_SECONDS.labels(route.path if route is not None else "unmatched",
+                                    str(message["status"])).observe(time.perf_counter() - t0)
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
+
+app.add_middleware(LatencyMiddleware)
+
 # --- ADAUGĂ în cloud-api/app.py ---
 from fastapi.responses import HTMLResponse
 
 @app.get("/live/metrics", response_class=HTMLResponse)
-def live_metrics(interval: int = 2000) -> str:
-    return f"""<!doctype html>
+def live_metrics() -> str:
+    # push prin /stream (SSE): zero interogări DB per tab deschis
+    return """<!doctype html>
 <html><head><meta charset="utf-8" />
 <title>cloud-api /metrics (live)</title>
 <style>
-  html,body {{ background:#0f1115; color:#e8e6e3; font:14px ui-monospace; margin:0; }}
-  header {{ padding:10px 14px; border-bottom:1px solid #24262c; }}
-  pre {{ margin:0; padding:14px; white-space:pre-wrap; }}
-  .ok {{ color:#6ee7a2; }} .err {{ color:#f87171; }}
+  html,body { background:#0f1115; color:#e8e6e3; font:14px ui-monospace; margin:0; }
+  header { padding:10px 14px; border-bottom:1px solid #24262c; }
+  pre { margin:0; padding:14px; white-space:pre-wrap; }
+  .ok { color:#6ee7a2; } .err { color:#f87171; }
 </style></head>
 <body>
-  <header>Polling: <b id="iv">{interval}</b> ms • Last: <b id="lu">-</b> • Status: <b id="st">-</b></header>
+  <header>Push: <b id="st">connecting…</b> • Last: <b id="lu">-</b></header>
   <pre id="out">loading…</pre>
 <script>
 const out=document.getElementById('out'), lu=document.getElementById('lu'), st=document.getElementById('st');
-const iv=parseInt(new URLSearchParams(location.search).get('interval')||'{interval}',10);
-async function tick(){{
-  try {{
-    const r=await fetch('/metrics',{cache:'no-store'});
-    st.textContent=r.status+' '+r.statusText; st.className=r.ok?'ok':'err';
-    out.textContent=JSON.stringify(await r.json(),null,2);
-    lu.textContent=new Date().toLocaleTimeString();
-  }} catch(e){{ st.textContent='error'; st.className='err'; out.textContent=String(e); }}
-}}
-tick(); setInterval(tick,iv);
+const es=new EventSource('/stream?events=metrics');
+es.onopen=()=>{ st.textContent='connected'; st.className='ok'; };
+es.onerror=()=>{ st.textContent='reconnecting…'; st.className='err'; };
+es.addEventListener('metrics', ev=>{
+  out.textContent=JSON.stringify(JSON.parse(ev.data),null,2);
+  lu.textContent=new Date().toLocaleTimeString();
+});
 </script></body></html>"""
 
 @app.get("/live/last", response_class=HTMLResponse)
-def live_last(n: int = 10, interval: int = 2000) -> str:
+def live_last(n: int = 10) -> str:
+    # un singur /last la încărcare, apoi doar rândurile noi prin /stream
     return f"""<!doctype html>
 <html><head><meta charset="utf-8" />
 <title>cloud-api /last?n={n} (live)</title>
@@ -61,169 +158,2205 @@ def live_last(n: int = 10, interval: int = 2000) -> str:
   .ok {{ color:#6ee7a2; }} .err {{ color:#f87171; }}
 </style></head>
 <body>
-  <header>n=<b id="nn">{n}</b> • Polling: <b id="iv">{interval}</b> ms • Last: <b id="lu">-</b> • Status: <b id="st">-</b></header>
+  <header>n=<b id="nn">{n}</b> • Push: <b id="st">connecting…</b> • Last: <b id="lu">-</b></header>
   <pre id="out">loading…</pre>
 <script>
 const out=document.getElementById('out'), lu=document.getElementById('lu'), st=document.getElementById('st');
-const q=new URLSearchParams(location.search);
-const iv=parseInt(q.get('interval')||'{interval}',10);
-const n =parseInt(q.get('n')||'{n}',10);
-async function tick(){{
-  try {{
-    const r=await fetch('/last?n='+encodeURIComponent(n),{{cache:'no-store'}});
-    st.textContent=r.status+' '+r.statusText; st.className=r.ok?'ok':'err';
-    out.textContent=JSON.stringify(await r.json(),null,2);
-    lu.textContent=new Date().toLocaleTimeString();
-  }} catch(e){{ st.textContent='error'; st.className='err'; out.textContent=String(e); }}
+const n=parseInt(new URLSearchParams(location.search).get('n')||'{n}',10);
+let items=[];
+function render(){{
+  out.textContent=JSON.stringify({{items}},null,2);
+  lu.textContent=new Date().toLocaleTimeString();
+}}
+async function reload(){{
+  const r=await fetch('/last?n='+encodeURIComponent(n),{{cache:'no-store'}});
+  items=(await r.json()).items; render();
 }}
-tick(); setInterval(tick,iv);
+reload().then(()=>{{
+  const es=new EventSource('/stream?events=rows');
+  es.onopen=()=>{{ st.textContent='connected'; st.className='ok'; }};
+  es.onerror=()=>{{ st.textContent='reconnecting…'; st.className='err'; }};
+  es.addEventListener('rows', ev=>{{
+    items=JSON.parse(ev.data).reverse().concat(items).slice(0,n); render();
+  }});
+  es.addEventListener('lag', ()=>reload());   // consumator prea lent: resincronizare
+}});
 </script></body></html>"""
 
 
 # -------------------------- DB helpers --------------------------
-def get_db() -> sqlite3.Connection:
-    con = sqlite3.connect(DB_PATH, check_same_thread=False)
+def get_db(readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        con = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        con = sqlite3.connect(DB_PATH, check_same_thread=False)
+        con.execute("PRAGMA synchronous=NORMAL")
     con.row_factory = sqlite3.Row
+    # distanța exactă în SQL (/gps/near filtrează fiecare punct înainte de GROUP BY)
+    con.create_function(
+        "haversine_m", 4, lambda *a: None if None in a else haversine_m(*a), deterministic=True,
+    )
     return con
 
-db = get_db()
+# conexiunea de scriere: folosită doar de init_schema() și apoi exclusiv de writer_loop()
+writer_db = get_db()
+
+LEGACY_TELEMETRY_DDL = """
+    CREATE TABLE IF NOT EXISTS telemetry (
+      id              TEXT PRIMARY KEY,
+      ts              TEXT NOT NULL,
+      ingest_ts       TEXT NOT NULL DEFAULT (datetime('now')),
+      topic           TEXT,
+      sensor          TEXT,
+      productId       TEXT,
+      locationId      TEXT,
+      edge_alert      TEXT,
+      edge_latency_ms INTEGER,
+      data_json       TEXT,
+      ingest_ms       INTEGER
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_tel_sensor     ON telemetry(sensor);
+    CREATE INDEX IF NOT EXISTS idx_tel_prod_loc   ON telemetry(productId, locationId);
+"""
+
+# o partiție = o tabelă zilnică (după ingest_ms) cu indecși proprii, mici => insert constant
+PARTITION_MS = 86400000
+PARTITION_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS {name} (
+      id              TEXT PRIMARY KEY,
+      ts              TEXT NOT NULL,
+      ingest_ts       TEXT NOT NULL,
+      topic           TEXT,
+      sensor          TEXT,
+      productId       TEXT,
+      locationId      TEXT,
+      edge_alert      TEXT,
+      edge_latency_ms INTEGER,
+      data_json       TEXT,
+      ingest_ms       INTEGER NOT NULL,
+      ts_ms           INTEGER,
+      temp_c          REAL,
+      humidity_pct    REAL,
+      level           REAL,
+      reorder_point   REAL,
+      safety_stock    REAL,
+      lat             REAL,
+      lon             REAL,
+      speed_kmh       REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_{name}_ingest_ms ON {name}(ingest_ms)",
+    "CREATE INDEX IF NOT EXISTS idx_{name}_sensor    ON {name}(sensor)",
+    "CREATE INDEX IF NOT EXISTS idx_{name}_prod_loc  ON {name}(productId, locationId, ts_ms)",
+    "CREATE INDEX IF NOT EXISTS idx_{name}_ts_ms     ON {name}(ts_ms)",     # /timeseries fără productId
+]
+# câmpurile cunoscute din `data` (sensor_sim.py: gen_env/gen_stock/gen_gps), extrase la ingest
+# în coloane tipizate; ts_ms = timpul evenimentului în epoch-ms
+TYPED_FIELDS = (
+    "temp_c", "humidity_pct", "level", "reorder_point", "safety_stock", "lat", "lon", "speed_kmh",
+)
+VIEW_COLUMNS = (
+    "id, ts, ingest_ts, topic, sensor, productId, locationId, "
+    "edge_alert, edge_latency_ms, data_json, ingest_ms, ts_ms, " + ", ".join(TYPED_FIELDS)
+)
 
 def init_schema() -> None:
-    cur = db.cursor()
+    cur = writer_db.cursor()
+    if writer_db.execute("PRAGMA user_version").fetchone()[0] < 3:
+        # tabela unică de dinainte de partiționare; migrarea 3 o transformă în partiție
+        cur.executescript(LEGACY_TELEMETRY_DDL)
     cur.executescript(
         """
         PRAGMA journal_mode=WAL;
 
-        CREATE TABLE IF NOT EXISTS telemetry (
-          id              TEXT PRIMARY KEY,
-          ts              TEXT NOT NULL,
-          ingest_ts       TEXT NOT NULL DEFAULT (datetime('now')),
-          topic           TEXT,
+        -- registrul partițiilor de telemetrie: intervalul [lo_ms, hi_ms) de ingest_ms
+        CREATE TABLE IF NOT EXISTS partitions (
+          name  TEXT PRIMARY KEY,
+          lo_ms INTEGER NOT NULL,
+          hi_ms INTEGER NOT NULL
+        );
+
+        -- agregate după retenția datelor raw; metric='' => doar numărul de rânduri
+        CREATE TABLE IF NOT EXISTS telemetry_agg (
+          res_ms     INTEGER NOT NULL,
+          bucket_ms  INTEGER NOT NULL,
+          sensor     TEXT NOT NULL,
+          productId  TEXT NOT NULL,
+          locationId TEXT NOT NULL,
+          metric     TEXT NOT NULL,
+          n          INTEGER NOT NULL,
+          alerts     INTEGER NOT NULL,
+          vmin       REAL,
+          vmax       REAL,
+          vsum       REAL,
+          PRIMARY KEY (res_ms, productId, locationId, metric, bucket_ms, sensor)
+        ) WITHOUT ROWID;
+
+        -- rollup-uri calculate pe edge: un rând per (fereastră, câmp numeric)
+        CREATE TABLE IF NOT EXISTS rollup (
+          id              TEXT NOT NULL,
+          field           TEXT NOT NULL,
           sensor          TEXT,
           productId       TEXT,
           locationId      TEXT,
+          window_start_ms INTEGER NOT NULL,
+          window_end_ms   INTEGER NOT NULL,
+          count           INTEGER NOT NULL,
+          n               INTEGER,
+          vmin            REAL,
+          vmax            REAL,
+          vmean           REAL,
+          vlast           REAL,
+          ingest_ts       TEXT NOT NULL,
+          PRIMARY KEY (id, field)
+        );
+
+        -- secvențele de batch per edge (X-Edge-Id / X-Edge-Epoch / X-Batch-Seq): tot ce e
+        -- <= contiguous e aplicat, peste el doar seq-urile din `applied` (JSON); actualizat în
+        -- aceeași tranzacție cu rândurile batch-ului
+        CREATE TABLE IF NOT EXISTS edge_batches (
+          edge_id      TEXT NOT NULL,
+          epoch        TEXT NOT NULL,
+          contiguous   INTEGER NOT NULL,
+          high         INTEGER NOT NULL,
+          applied      TEXT NOT NULL,
+          lost         INTEGER NOT NULL,
+          lost_ranges  TEXT NOT NULL,
+          batches      INTEGER NOT NULL,
+          last_seen_ms INTEGER,
+          PRIMARY KEY (edge_id, epoch)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_rollup_prod_loc ON rollup(productId, locationId, window_start_ms);
+
+        -- ultima poziție GPS per asset, actualizată în tranzacția de ingest
+        CREATE TABLE IF NOT EXISTS latest_position (
+          productId       TEXT NOT NULL,
+          locationId      TEXT NOT NULL,
+          ts_ms           INTEGER NOT NULL,
+          id              TEXT,
+          ts              TEXT,
+          ingest_ts       TEXT,
+          topic           TEXT,
+          sensor          TEXT,
           edge_alert      TEXT,
           edge_latency_ms INTEGER,
-          data_json       TEXT
+          data_json       TEXT,
+          lat             REAL,
+          lon             REAL,
+          speed_kmh       REAL,
+          PRIMARY KEY (productId, locationId)
+        );
+
+        -- snapshot periodic al statisticilor incrementale din /metrics
+        CREATE TABLE IF NOT EXISTS stats (
+          key        TEXT PRIMARY KEY,
+          value      TEXT NOT NULL,
+          updated_ms INTEGER NOT NULL
         );
 
-        CREATE INDEX IF NOT EXISTS idx_tel_ingest_ts  ON telemetry(ingest_ts);
-        CREATE INDEX IF NOT EXISTS idx_tel_sensor     ON telemetry(sensor);
-        CREATE INDEX IF NOT EXISTS idx_tel_prod_loc   ON telemetry(productId, locationId);
+        -- index spațial (R*Tree) al punctelor GPS: lat x lon x timp, populat la ingest.
+        -- coordonatele R*Tree sunt float32 (rotunjite în afară) => valorile exacte stau în
+        -- coloanele auxiliare (+) și sunt folosite pentru filtrarea finală
+        CREATE VIRTUAL TABLE IF NOT EXISTS gps_rtree USING rtree(
+          id, min_lat, max_lat, min_lon, max_lon, min_ts, max_ts,
+          +ts_ms INTEGER, +lat REAL, +lon REAL, +point_id TEXT,
+          +productId TEXT, +locationId TEXT, +speed_kmh REAL
+        );
+
+        -- aceeași idee pentru ultima poziție per asset (id = rowid din latest_position),
+        -- ținută la zi prin triggere => acoperă și UPSERT-ul de la ingest și rebuild-latest
+        CREATE VIRTUAL TABLE IF NOT EXISTS latest_position_rtree USING rtree(
+          id, min_lat, max_lat, min_lon, max_lon
+        );
+        CREATE TRIGGER IF NOT EXISTS latest_position_rtree_ins AFTER INSERT ON latest_position
+        WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+          INSERT OR REPLACE INTO latest_position_rtree VALUES (new.rowid, new.lat, new.lat, new.lon, new.lon);
+        END;
+        CREATE TRIGGER IF NOT EXISTS latest_position_rtree_upd AFTER UPDATE OF lat, lon ON latest_position
+        BEGIN
+          DELETE FROM latest_position_rtree WHERE id = old.rowid;
+          INSERT INTO latest_position_rtree
+            SELECT new.rowid, new.lat, new.lat, new.lon, new.lon
+            WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+        END;
+        CREATE TRIGGER IF NOT EXISTS latest_position_rtree_del AFTER DELETE ON latest_position BEGIN
+          DELETE FROM latest_position_rtree WHERE id = old.rowid;
+        END;
         """
     )
-    db.commit()
+    writer_db.commit()
+
+def iso_to_ms(ts: Any) -> Optional[int]:
+    try:
+        dt = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp() * 1000)
+    except ValueError:
+        return None
+
+# ISO text (oricare din formatele din DB) -> epoch-ms, în SQL
+SQL_ISO_TO_MS = "CAST(ROUND((julianday({col}) - 2440587.5) * 86400000) AS INTEGER)"
+
+def rebuild_latest_positions(con: sqlite3.Connection) -> int:
+    """
+    Reconstruiește `latest_position` din istoricul `telemetry`. Upsert, nu truncate: `telemetry`
+    acoperă doar partițiile raw reținute, iar asset-urile cu date expirate își păstrează poziția.
+    Întoarce numărul de asset-uri actualizate.
+    """
+    ts_ms = SQL_ISO_TO_MS.format(col="ts")
+    with con:
+        cur = con.execute(
+            f"""
+            INSERT INTO latest_position (
+              productId, locationId, ts_ms, id, ts, ingest_ts, topic, sensor,
+              edge_alert, edge_latency_ms, data_json, lat, lon, speed_kmh
+            )
+            SELECT productId, locationId, ts_ms, id, ts, ingest_ts, topic, sensor,
+                   edge_alert, edge_latency_ms, data_json,
+                   json_extract(data_json, '$.lat'), json_extract(data_json, '$.lon'),
+                   json_extract(data_json, '$.speed_kmh')
+            FROM (
+              SELECT *, {ts_ms} AS ts_ms,
+                     ROW_NUMBER() OVER (
+                       PARTITION BY productId, locationId ORDER BY {ts_ms} DESC, ingest_ts DESC
+                     ) AS rn
+              FROM telemetry
+              WHERE sensor='gps' AND productId IS NOT NULL AND locationId IS NOT NULL
+                AND json_valid(data_json)
+            )
+            WHERE rn = 1 AND ts_ms IS NOT NULL
+            ON CONFLICT (productId, locationId) DO UPDATE SET
+              ts_ms=excluded.ts_ms, id=excluded.id, ts=excluded.ts, ingest_ts=excluded.ingest_ts,
+              topic=excluded.topic, sensor=excluded.sensor, edge_alert=excluded.edge_alert,
+              edge_latency_ms=excluded.edge_latency_ms, data_json=excluded.data_json,
+              lat=excluded.lat, lon=excluded.lon, speed_kmh=excluded.speed_kmh
+            WHERE excluded.ts_ms >= latest_position.ts_ms
+            """
+        )
+    return cur.rowcount
+
+def add_ingest_ms(con: sqlite3.Connection) -> None:
+    """
+    `ingest_ms` (epoch-ms, INTEGER) pentru interogări pe interval care folosesc indexul.
+    Backfill din `ingest_ts` (text ISO în formate mixte). Indexul pe (ingest_ms) conține
+    implicit și rowid-ul, deci acoperă complet cheia de paginare (ingest_ms, rowid).
+    """
+    cols = {r["name"] for r in con.execute("PRAGMA table_info(telemetry)")}
+    with con:
+        if "ingest_ms" not in cols:
+            con.execute("ALTER TABLE telemetry ADD COLUMN ingest_ms INTEGER")
+        con.execute(
+            f"UPDATE telemetry SET ingest_ms = {SQL_ISO_TO_MS.format(col='ingest_ts')} "
+            "WHERE ingest_ms IS NULL"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS idx_tel_ingest_ms ON telemetry(ingest_ms)")
+        con.execute("DROP INDEX IF EXISTS idx_tel_ingest_ts")
+
+def partition_name(ms: int) -> str:
+    return "telemetry_p" + datetime.utcfromtimestamp(ms / 1000).strftime("%Y%m%d")
+
+def refresh_view(con: sqlite3.Connection) -> None:
+    """`telemetry` = VIEW peste toate partițiile (pentru interogări ad-hoc / compatibilitate)."""
+    names = [r[0] for r in con.execute("SELECT name FROM partitions ORDER BY lo_ms")]
+    con.execute("DROP VIEW IF EXISTS telemetry")
+    if names:
+        body = " UNION ALL ".join(f"SELECT {VIEW_COLUMNS} FROM {n}" for n in names)
+    else:
+        # niciun rând raw (ex. după retenție): view gol, dar cu aceleași coloane
+        body = "SELECT " + ", ".join(f"NULL AS {c.strip()}" for c in VIEW_COLUMNS.split(",")) + " WHERE 0"
+    con.execute("CREATE VIEW telemetry AS " + body)
+
+def ensure_partition(con: sqlite3.Connection, ms: int) -> str:
+    """Partiția zilei care conține `ms`; creată (tabelă + indecși + registru + view) la nevoie."""
+    name = partition_name(ms)
+    if con.execute("SELECT 1 FROM partitions WHERE name=?", (name,)).fetchone() is None:
+        lo = ms - ms % PARTITION_MS
+        for ddl in PARTITION_DDL:
+            con.execute(ddl.format(name=name))
+        con.execute("INSERT INTO partitions (name, lo_ms, hi_ms) VALUES (?, ?, ?)",
+                    (name, lo, lo + PARTITION_MS))
+        refresh_view(con)
+    return name
+
+def partitions_for(con: sqlite3.Connection, lo_ms: Optional[int] = None,
+                   hi_ms: Optional[int] = None, newest_first: bool = True) -> List[str]:
+    """Router: partițiile al căror interval de ingest_ms intersectează [lo_ms, hi_ms)."""
+    order = "DESC" if newest_first else "ASC"
+    return [r[0] for r in con.execute(
+        f"SELECT name FROM partitions WHERE hi_ms > ? AND lo_ms < ? ORDER BY hi_ms {order}",
+        (-(2 ** 63) if lo_ms is None else lo_ms, 2 ** 63 - 1 if hi_ms is None else hi_ms),
+    )]
+
+def partition_telemetry(con: sqlite3.Connection) -> None:
+    """
+    Tabela unică `telemetry` devine partiția `telemetry_legacy` (înregistrată cu intervalul
+    ei real de ingest_ms) sau e ștearsă dacă e goală; `telemetry` devine VIEW.
+    """
+    with con:
+        lo, hi = con.execute("SELECT MIN(ingest_ms), MAX(ingest_ms) FROM telemetry").fetchone()
+        if lo is None:
+            con.execute("DROP TABLE telemetry")
+        else:
+            con.execute("ALTER TABLE telemetry RENAME TO telemetry_legacy")
+            con.execute("INSERT INTO partitions (name, lo_ms, hi_ms) VALUES (?, ?, ?)",
+                        ("telemetry_legacy", lo, hi + 1))
+        ensure_partition(con, int(time.time() * 1000))
+        refresh_view(con)
+
+def add_typed_columns(con: sqlite3.Connection) -> None:
+    """
+    Coloanele tipizate (ts_ms + TYPED_FIELDS) în partițiile existente, cu backfill din
+    `ts`/`data_json`, și indexul (productId, locationId, ts_ms) folosit de /timeseries.
+    """
+    names = [r[0] for r in con.execute("SELECT name FROM partitions")]
+    with con:
+        for name in names:
+            cols = {r["name"] for r in con.execute(f"PRAGMA table_info({name})")}
+            if "ts_ms" not in cols:
+                con.execute(f"ALTER TABLE {name} ADD COLUMN ts_ms INTEGER")
+            for f in TYPED_FIELDS:
+                if f not in cols:
+                    con.execute(f"ALTER TABLE {name} ADD COLUMN {f} REAL")
+            typed = ", ".join(
+                f"{f} = CASE WHEN json_type(data_json, '$.{f}') IN ('integer', 'real') "
+                f"THEN json_extract(data_json, '$.{f}') END"
+                for f in TYPED_FIELDS
+            )
+            con.execute(f"UPDATE {name} SET ts_ms = {SQL_ISO_TO_MS.format(col='ts')} WHERE ts_ms IS NULL")
+            con.execute(f"UPDATE {name} SET {typed} WHERE json_valid(data_json)")
+            con.execute(f"DROP INDEX IF EXISTS idx_{name}_prod_loc")
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_prod_loc ON {name}(productId, locationId, ts_ms)")
+        con.execute("DROP INDEX IF EXISTS idx_tel_prod_loc")    # înlocuit de cel de mai sus (legacy)
+        refresh_view(con)
+
+def build_gps_index(con: sqlite3.Connection) -> None:
+    """Populează cele două R*Tree-uri din datele existente (partițiile raw + latest_position)."""
+    names = [r[0] for r in con.execute("SELECT name FROM partitions")]
+    with con:
+        con.execute("DELETE FROM gps_rtree")
+        for name in names:
+            con.execute(
+                f"""
+                INSERT INTO gps_rtree (min_lat, max_lat, min_lon, max_lon, min_ts, max_ts,
+                                       ts_ms, lat, lon, point_id, productId, locationId, speed_kmh)
+                SELECT lat, lat, lon, lon, ts_ms, ts_ms, ts_ms, lat, lon, id, productId, locationId, speed_kmh
+                FROM {name}
+                WHERE sensor = 'gps' AND lat IS NOT NULL AND lon IS NOT NULL AND ts_ms IS NOT NULL
+                """
+            )
+        con.execute("DELETE FROM latest_position_rtree")
+        con.execute(
+            """
+            INSERT INTO latest_position_rtree
+            SELECT rowid, lat, lat, lon, lon FROM latest_position
+            WHERE lat IS NOT NULL AND lon IS NOT NULL
+            """
+        )
+
+# migrări one-shot, aplicate în ordine; PRAGMA user_version = câte au rulat
+def add_ts_index(con: sqlite3.Connection) -> None:
+    """Indexul pe ts_ms în partițiile existente: /timeseries fără filtrul productId nu mai scanează partiția."""
+    with con:
+        for (name,) in con.execute("SELECT name FROM partitions").fetchall():
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_ts_ms ON {name}(ts_ms)")
+
+MIGRATIONS = [
+    rebuild_latest_positions,
+    add_ingest_ms,
+    partition_telemetry,
+    add_typed_columns,
+    build_gps_index,
+    add_ts_index,
+]
+
+def migrate() -> None:
+    version = writer_db.execute("PRAGMA user_version").fetchone()[0]
+    for i, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        step(writer_db)
+        writer_db.execute(f"PRAGMA user_version = {i}")
+        print(f"[CLOUD] migration {i} ({step.__name__}) applied")
+
+# -------------------------- Statistici incrementale --------------------------
+class HdrHistogram:
+    """
+    Histogramă log-liniară cu bucket-uri fixe (stil HDR): valori < 2^SUB_BITS exacte, apoi
+    2^SUB_BITS sub-bucket-uri liniare per putere a lui 2 => eroare relativă < ~3%.
+    """
+    SUB_BITS = 5
+    SUB = 1 << SUB_BITS
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None):
+        self.counts: Dict[int, int] = dict(counts or {})
+        self.n = sum(self.counts.values())
+
+    @classmethod
+    def index(cls, v: int) -> int:
+        if v < cls.SUB:
+            return max(v, 0)
+        shift = v.bit_length() - 1 - cls.SUB_BITS
+        return (shift + 1) * cls.SUB + ((v >> shift) - cls.SUB)
+
+    @classmethod
+    def upper(cls, idx: int) -> int:
+        """Cea mai mare valoare care cade în bucket-ul `idx`."""
+        if idx < cls.SUB:
+            return idx
+        shift, sub = divmod(idx, cls.SUB)
+        return ((cls.SUB + sub + 1) << (shift - 1)) - 1
+
+    def record(self, v: int) -> None:
+        i = self.index(int(v))
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.n += 1
+
+    def percentile(self, p: float) -> Optional[int]:
+        if not self.n:
+            return None
+        rank, seen = p / 100.0 * self.n, 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return self.upper(idx)
+        return self.upper(max(self.counts))
+
+    def summary(self) -> Dict[str, Any]:
+        return {"count": self.n, "p50": self.percentile(50),
+                "p95": self.percentile(95), "p99": self.percentile(99)}
+
+class TelemetryStats:
+    """
+    Statisticile din /metrics, menținute incremental de writer pentru rândurile noi:
+    totaluri per senzor, alerte per tip, histograme de latență. Snapshot-ul se salvează
+    periodic în tabela `stats`, în aceeași tranzacție cu datele; la pornire se încarcă
+    și se completează cu rândurile ingerate după `ingest_ms` din snapshot.
+    """
+    KEY = "telemetry"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.by_sensor: Dict[str, int] = {}
+        self.alerts_by_type: Dict[str, int] = {}
+        self.edge_latency_sum = 0
+        self.edge_latency = HdrHistogram()   # senzor -> edge, raportat de edge
+        self.cloud_latency = HdrHistogram()  # edge -> cloud = (ingest - ts) - senzor->edge
+        self.watermark_ms = 0
+        self.persisted_at = 0.0
+
+    def add(self, sensor: Optional[str], alert: Optional[str], edge_latency: Optional[int],
+            ts: Any, ingest_ms: int) -> None:
+        self.total += 1
+        key = sensor or "unknown"
+        self.by_sensor[key] = self.by_sensor.get(key, 0) + 1
+        if alert is not None:
+            self.alerts_by_type[alert] = self.alerts_by_type.get(alert, 0) + 1
+        if isinstance(edge_latency, int):
+            self.edge_latency_sum += edge_latency
+            self.edge_latency.record(edge_latency)
+            ts_ms = iso_to_ms(ts)
+            if ts_ms is not None:
+                self.cloud_latency.record(ingest_ms - ts_ms - edge_latency)
+        if ingest_ms > self.watermark_ms:
+            self.watermark_ms = ingest_ms
+
+    def add_rows(self, rows: List[tuple]) -> None:
+        with self.lock:
+            for r in rows:
+                self.add(r[3], r[6], r[7], r[1], r[10])
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "by_sensor": self.by_sensor,
+            "alerts_by_type": self.alerts_by_type,
+            "edge_latency_sum": self.edge_latency_sum,
+            "edge_latency": self.edge_latency.counts,
+            "cloud_latency": self.cloud_latency.counts,
+            "watermark_ms": self.watermark_ms,
+        }
+
+    def persist_if_due(self, con: sqlite3.Connection) -> None:
+        """Apelat de writer în interiorul tranzacției de ingest."""
+        if time.monotonic() - self.persisted_at < STATS_PERSIST_SEC:
+            return
+        with self.lock:
+            value = json.dumps(self.snapshot())
+        con.execute(
+            "INSERT OR REPLACE INTO stats (key, value, updated_ms) VALUES (?, ?, ?)",
+            (self.KEY, value, int(time.time() * 1000)),
+        )
+        self.persisted_at = time.monotonic()
+
+    def load(self, con: sqlite3.Connection) -> None:
+        """Snapshot-ul salvat + rândurile de după el (scan pe idx_tel_ingest_ms)."""
+        row = con.execute("SELECT value FROM stats WHERE key=?", (self.KEY,)).fetchone()
+        with self.lock:
+            if row is not None:
+                snap = json.loads(row["value"])
+                self.total = snap["total"]
+                self.by_sensor = snap["by_sensor"]
+                self.alerts_by_type = snap["alerts_by_type"]
+                self.edge_latency_sum = snap["edge_latency_sum"]
+                self.edge_latency = HdrHistogram({int(k): v for k, v in snap["edge_latency"].items()})
+                self.cloud_latency = HdrHistogram({int(k): v for k, v in snap["cloud_latency"].items()})
+                self.watermark_ms = snap["watermark_ms"]
+            cur = con.execute(
+                """
+                SELECT sensor, edge_alert, edge_latency_ms, ts, ingest_ms
+                FROM telemetry WHERE ingest_ms > ?
+                """,
+                (self.watermark_ms,),
+            )
+            for r in cur:
+                self.add(*r)
+
+    def to_json(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "total_rows": self.total,
+                "alerts": sum(self.alerts_by_type.values()),
+                "avg_edge_latency_ms": (
+                    self.edge_latency_sum / self.edge_latency.n if self.edge_latency.n else None
+                ),
+                "by_sensor": dict(self.by_sensor),
+                "alerts_by_type": dict(self.alerts_by_type),
+                "edge_latency_ms": self.edge_latency.summary(),
+                "edge_to_cloud_latency_ms": self.cloud_latency.summary(),
+            }
+
+stats = TelemetryStats()
 
 init_schema()
+migrate()
+with writer_db:
+    ensure_partition(writer_db, int(time.time() * 1000))
+stats.load(writer_db)
+last_ingest_ms = stats.watermark_ms
+# crește după fiecare commit care schimbă datele (ingest, retenție) => invalidează cache-ul
+ingest_generation = 0
+
+# pool de conexiuni read-only (WAL => citirile nu așteaptă după commit-urile writer-ului)
+read_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+for _ in range(READ_POOL_SIZE):
+    read_pool.put(get_db(readonly=True))
+
+@contextmanager
+def read_db() -> Iterator[sqlite3.Connection]:
+    """
+    O conexiune din pool, într-o tranzacție de citire: registrul de partiții și partițiile
+    citite provin din același snapshot, chiar dacă între timp retenția șterge o partiție.
+    """
+    con = read_pool.get()
+    try:
+        con.execute("BEGIN")
+        yield con
+    finally:
+        con.rollback()
+        read_pool.put(con)
+
+# coada writer-ului: (rânduri telemetry, rânduri rollup, future cu rezultatul, secvența batch-ului)
+IngestJob = Tuple[List[tuple], List[tuple], Future, Optional["BatchSeq"]]
+ingest_queue: "queue.Queue[IngestJob]" = queue.Queue(maxsize=INGEST_QUEUE_MAX)
+
+# sarcini administrative (retenție, compactare) rulate tot de writer, între group commit-uri
+admin_queue: "queue.Queue[Tuple[Callable[[sqlite3.Connection], Any], Future]]" = queue.Queue()
+
+def run_in_writer(task: Callable[[sqlite3.Connection], Any]) -> Any:
+    fut: Future = Future()
+    admin_queue.put((task, fut))
+    return fut.result()
+
+def run_admin_tasks() -> None:
+    while True:
+        try:
+            task, fut = admin_queue.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            res = task(writer_db)
+            bump_generation()
+            fut.set_result(res)
+        except Exception as e:
+            writer_db.rollback()
+            fut.set_exception(e)
+
+# -------------------------- Secvențe de batch per edge --------------------------
+# (edge_id, epoch, seq, low): low = cel mai mic seq pe care edge-ul îl mai poate trimite
+BatchSeq = Tuple[str, str, int, int]
+UPSERT_EDGE_MARK_SQL = """
+INSERT OR REPLACE INTO edge_batches
+  (edge_id, epoch, contiguous, high, applied, lost, lost_ranges, batches, last_seen_ms)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+class EdgeMark:
+    """
+    Batch-urile aplicate pentru un (edge, epoch): toate seq <= `contiguous`, plus `applied`
+    (puține: doar POST-urile concurente sosite în altă ordine). `seen` e O(1), fără telemetry.
+    Seq-urile sub `low` care n-au sosit nu mai pot veni (segmente aruncate la spool plin sau
+    puse în carantină pe edge): sunt numărate ca pierdute, iar `contiguous` sare peste ele.
+    """
+    LOST_RANGES_MAX = 20
+
+    def __init__(self, contiguous: int, high: Optional[int] = None, applied=(), lost: int = 0,
+                 lost_ranges=(), batches: int = 0, last_seen_ms: Optional[int] = None):
+        self.contiguous = contiguous
+        self.high = contiguous if high is None else high
+        self.applied = set(applied)
+        self.lost = lost
+        self.lost_ranges = [list(r) for r in lost_ranges]
+        self.batches = batches
+        self.last_seen_ms = last_seen_ms
+
+    def copy(self) -> "EdgeMark":
+        return EdgeMark(self.contiguous, self.high, self.applied, self.lost, self.lost_ranges,
+                        self.batches, self.last_seen_ms)
+
+    def seen(self, seq: int) -> bool:
+        return seq <= self.contiguous or seq in self.applied
+
+    def apply(self, seq: int, low: int, now_ms: int) -> None:
+        self.applied.add(seq)
+        self.high = max(self.high, seq)
+        self.batches += 1
+        self.last_seen_ms = now_ms
+        if low - 1 > self.contiguous:
+            start = self.contiguous + 1
+            for s in sorted(x for x in self.applied if x < low) + [low]:
+                if s > start:
+                    self.lost += s - start
+                    self.lost_ranges = (self.lost_ranges + [[start, s - 1]])[-self.LOST_RANGES_MAX:]
+                start = s + 1
+            self.applied = {x for x in self.applied if x >= low}
+            self.contiguous = low - 1
+        while self.contiguous + 1 in self.applied:
+            self.contiguous += 1
+            self.applied.discard(self.contiguous)
+
+    def gaps(self, limit: int = 100) -> List[int]:
+        """Seq-uri lipsă între contiguous și high: încă în zbor / de reîncercat pe edge."""
+        out = []
+        for seq in range(self.contiguous + 1, self.high):
+            if seq not in self.applied:
+                out.append(seq)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def row(self, key: Tuple[str, str]) -> tuple:
+        return (key[0], key[1], self.contiguous, self.high, json.dumps(sorted(self.applied)),
+                self.lost, json.dumps(self.lost_ranges), self.batches, self.last_seen_ms)
+
+def load_edge_marks(con: sqlite3.Connection) -> Dict[Tuple[str, str], EdgeMark]:
+    return {
+        (r[0], r[1]): EdgeMark(r[2], r[3], json.loads(r[4]), r[5], json.loads(r[6]), r[7], r[8])
+        for r in con.execute(
+            "SELECT edge_id, epoch, contiguous, high, applied, lost, lost_ranges, batches, last_seen_ms "
+            "FROM edge_batches"
+        )
+    }
+
+# citit de /ingest fără lock (obiectele sunt înlocuite de writer după commit, nu modificate)
+edge_marks = load_edge_marks(writer_db)
+edge_duplicates: Dict[Tuple[str, str], int] = defaultdict(int)
+
+def batch_seq(headers) -> Optional[BatchSeq]:
+    """Secvența din headerele edge-ului; None pentru clienți fără secvență (dedupe doar pe id)."""
+    seq = headers.get("x-batch-seq")
+    if seq is None:
+        return None
+    edge_id = headers.get("x-edge-id")
+    if not edge_id:
+        raise ValueError("X-Batch-Seq without X-Edge-Id")
+    seq = int(seq)
+    low = int(headers.get("x-edge-low-seq") or 0)
+    return edge_id, headers.get("x-edge-epoch", ""), seq, min(low, seq)
+
+def existing_ids(table: str, ids: List[str]) -> set:
+    """Id-urile care există deja în `table` (partiție sau view-ul telemetry), pe bucăți de 500."""
+    found = set()
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        found.update(x[0] for x in writer_db.execute(
+            f"SELECT id FROM {table} WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        ))
+    return found
+
+def insert_new(table: str, rows: List[tuple], now_ms: int) -> List[tuple]:
+    """
+    Inserează rândurile în partiția `table` și întoarce exact rândurile noi. Calea rapidă e
+    un singur executemany (duplicatele din partiția activă sunt prinse de cheia primară);
+    un retry poate trece însă de miezul nopții UTC, așa că id-urile se verifică întâi și în
+    partițiile anterioare din DEDUPE_WINDOW_SEC (de obicei niciuna, după midnight una).
+    Dacă apar duplicate, savepoint-ul se anulează și se reinserează doar id-urile care nu
+    există în nicio partiție (caz rar: retry-uri).
+    """
+    sql = INSERT_SQL.format(table=table)
+    for older in partitions_for(writer_db, now_ms - int(DEDUPE_WINDOW_SEC * 1000), None):
+        if older != table and rows:
+            seen = existing_ids(older, [r[0] for r in rows])
+            if seen:
+                rows = [r for r in rows if r[0] not in seen]
+    writer_db.execute("SAVEPOINT batch")
+    before = writer_db.total_changes
+    writer_db.executemany(sql, rows)
+    if writer_db.total_changes - before < len(rows):
+        writer_db.execute("ROLLBACK TO batch")
+        existing = existing_ids("telemetry", [r[0] for r in rows])
+        fresh = []
+        for r in rows:
+            if r[0] not in existing:
+                existing.add(r[0])
+                fresh.append(r)
+        writer_db.executemany(sql, fresh)
+        rows = fresh
+    writer_db.execute("RELEASE batch")
+    return rows
+
+def _write_jobs(jobs: List[IngestJob]) -> Tuple[List[Tuple[int, int, bool]], List[tuple]]:
+    """
+    Scrie job-urile într-o tranzacție; per job: (rânduri telemetry, rânduri rollup inserate,
+    batch deja aplicat), plus rândurile noi. Marcajele edge-urilor se scriu în aceeași
+    tranzacție și se publică în `edge_marks` imediat după commit; restul (/metrics, cache,
+    /stream) îl face `_publish`, în afara retry-ului per job: o eroare acolo nu trebuie să
+    reîncerce un grup deja scris, care ar raporta inserted=0.
+    """
+    global last_ingest_ms
+    stamp = ingest_clock(last_ingest_ms)
+    inserted, fresh_rows = [], []
+    marks: Dict[Tuple[str, str], EdgeMark] = {}
+    with writer_db:
+        writer_db.execute("BEGIN")
+        table = ensure_partition(writer_db, stamp[1])
+        for rows, rollup_rows, _, batch in jobs:
+            if batch is not None:
+                key, seq, low = batch[:2], batch[2], batch[3]
+                mark = marks.get(key)
+                if mark is None:
+                    mark = marks[key] = edge_marks[key].copy() if key in edge_marks else EdgeMark(low - 1)
+                if mark.seen(seq):
+                    # același batch de două ori în coadă (retry cât timp originalul aștepta)
+                    inserted.append((0, 0, True))
+                    continue
+                mark.apply(seq, low, stamp[1])
+            fresh = insert_new(table, [r[:9] + stamp + r[9:] for r in rows], stamp[1])
+            fresh_rows.extend(fresh)
+            before = writer_db.total_changes
+            if rollup_rows:
+                writer_db.executemany(INSERT_ROLLUP_SQL, rollup_rows)
+            inserted.append((len(fresh), writer_db.total_changes - before, False))
+        if marks:
+            writer_db.executemany(UPSERT_EDGE_MARK_SQL, [m.row(k) for k, m in marks.items()])
+        positions = latest_positions(fresh_rows)
+        if positions:
+            writer_db.executemany(UPSERT_POSITION_SQL, positions)
+        points = gps_points(fresh_rows)
+        if points:
+            writer_db.executemany(INSERT_GPS_POINT_SQL, points)
+        stats.persist_if_due(writer_db)
+    last_ingest_ms = stamp[1]
+    for key, mark in marks.items():
+        old = edge_marks.get(key)
+        edge_marks[key] = mark
+        EDGE_LOST_BATCHES.inc(mark.lost - (old.lost if old else 0))
+    return inserted, fresh_rows
+
+def _publish(fresh_rows: List[tuple]) -> None:
+    """După commit: /metrics, generația cache-ului și abonații /stream."""
+    try:
+        stats.add_rows(fresh_rows)
+    finally:
+        bump_generation()
+    broadcaster.publish_rows(fresh_rows)
+
+def writer_loop() -> None:
+    """
+    Singurul thread care scrie în DB: golește coada și face group commit
+    (până la GROUP_COMMIT_MAX batch-uri într-o singură tranzacție).
+    """
+    data_version = writer_db.execute("PRAGMA data_version").fetchone()[0]
+    while True:
+        run_admin_tasks()
+        # commit făcut de alt proces (ex. `python app.py rebuild-latest`) => cache-ul e invalid
+        current = writer_db.execute("PRAGMA data_version").fetchone()[0]
+        if current != data_version:
+            data_version = current
+            bump_generation()
+        try:
+            jobs = [ingest_queue.get(timeout=0.5)]
+        except queue.Empty:
+            continue
+        while len(jobs) < GROUP_COMMIT_MAX:
+            try:
+                jobs.append(ingest_queue.get_nowait())
+            except queue.Empty:
+                break
+        INGEST_GROUP_BATCHES.observe(len(jobs))
+        committed = []
+        try:
+            with INGEST_COMMIT_SECONDS.time():
+                results, done = _write_jobs(jobs)
+            committed.append(done)
+        except Exception:
+            # un batch invalid nu trebuie să pice tot grupul: reîncearcă individual
+            results = []
+            for job in jobs:
+                try:
+                    res, done = _write_jobs([job])
+                    results.extend(res)
+                    committed.append(done)
+                except Exception as e:
+                    print("[CLOUD] ingest write error:", e)
+                    results.append(e)
+        for done in committed:
+            try:
+                _publish(done)
+            except Exception as e:      # datele sunt deja scrise: clienții primesc numerele reale
+                ERRORS.labels("post_commit").inc()
+                print("[CLOUD] post-commit error:", e)
+        for (_, _, fut, _), res in zip(jobs, results):
+            if isinstance(res, Exception):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+# -------------------------- Retenție / downsampling --------------------------
+HOUR_MS = 3600000
+# câmpurile numerice păstrate ca agregate după ce datele raw expiră
+AGG_METRICS = {
+    "env": ("temp_c", "humidity_pct"),
+    "stock": ("level", "reorder_point", "safety_stock"),
+    "gps": ("speed_kmh",),
+}
+
+AGG_MERGE = """
+ON CONFLICT (res_ms, productId, locationId, metric, bucket_ms, sensor) DO UPDATE SET
+  n      = n + excluded.n,
+  alerts = alerts + excluded.alerts,
+  vmin   = MIN(COALESCE(vmin, excluded.vmin), COALESCE(excluded.vmin, vmin)),
+  vmax   = MAX(COALESCE(vmax, excluded.vmax), COALESCE(excluded.vmax, vmax)),
+  vsum   = CASE WHEN vsum IS NULL AND excluded.vsum IS NULL THEN NULL
+                ELSE COALESCE(vsum, 0) + COALESCE(excluded.vsum, 0) END
+"""
+
+UPSERT_AGG_SQL = """
+INSERT INTO telemetry_agg (res_ms, bucket_ms, sensor, productId, locationId, metric, n, alerts, vmin, vmax, vsum)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+""" + AGG_MERGE
+
+def downsample_sql(table: str, res_ms: int = HOUR_MS) -> str:
+    """Agregatele unei partiții pe bucket-uri de `res_ms` după timpul evenimentului (fallback: ingest)."""
+    bucket = f"(COALESCE(ts_ms, ingest_ms) / {res_ms}) * {res_ms}"
+    keys = "COALESCE(sensor, '') AS s, COALESCE(productId, '') AS p, COALESCE(locationId, '') AS l"
+    parts = [
+        f"""SELECT {res_ms}, {bucket} AS b, {keys}, '', COUNT(*), COUNT(edge_alert), NULL, NULL, NULL
+            FROM {table} GROUP BY 2, 3, 4, 5"""
+    ]
+    for sensor, fields in AGG_METRICS.items():
+        for f in fields:
+            parts.append(
+                f"""SELECT {res_ms}, b, s, p, l, '{f}', COUNT(v), 0, MIN(v), MAX(v), SUM(v)
+                    FROM (SELECT {bucket} AS b, {keys}, {f} AS v FROM {table} WHERE sensor = '{sensor}')
+                    WHERE v IS NOT NULL GROUP BY 2, 3, 4, 5"""
+            )
+    return " UNION ALL ".join(parts)
+
+def retire_partition(name: str, agg_rows: List[tuple]) -> Callable[[sqlite3.Connection], int]:
+    """Sarcină pentru writer: agregatele + DROP partiție + registru + view, atomic."""
+    def task(con: sqlite3.Connection) -> int:
+        with con:
+            con.execute("BEGIN")
+            con.executemany(UPSERT_AGG_SQL, agg_rows)
+            con.execute(f"DROP TABLE IF EXISTS {name}")
+            con.execute("DELETE FROM partitions WHERE name=?", (name,))
+            refresh_view(con)
+        return len(agg_rows)
+    return task
+
+def prune_gps_points(cutoff_ms: int) -> Callable[[sqlite3.Connection], int]:
+    """Sarcină pentru writer: punctele GPS mai vechi de retenția raw ies din gps_rtree."""
+    def task(con: sqlite3.Connection) -> int:
+        with con:
+            cur = con.execute(
+                "DELETE FROM gps_rtree WHERE id IN (SELECT id FROM gps_rtree WHERE max_ts < ?)",
+                (cutoff_ms,),
+            )
+        return cur.rowcount
+    return task
+
+def compact_hourly(cutoff_ms: int) -> Callable[[sqlite3.Connection], int]:
+    """Sarcină pentru writer: agregatele orare mai vechi de `cutoff_ms` devin agregate zilnice."""
+    def task(con: sqlite3.Connection) -> int:
+        with con:
+            con.execute("BEGIN")
+            con.execute(
+                f"""
+                INSERT INTO telemetry_agg (res_ms, bucket_ms, sensor, productId, locationId, metric,
+                                           n, alerts, vmin, vmax, vsum)
+                SELECT {PARTITION_MS}, (bucket_ms / {PARTITION_MS}) * {PARTITION_MS}, sensor,
+                       productId, locationId, metric, SUM(n), SUM(alerts), MIN(vmin), MAX(vmax), SUM(vsum)
+                FROM telemetry_agg
+                WHERE res_ms = {HOUR_MS} AND bucket_ms < ?
+                GROUP BY 2, 3, 4, 5, 6
+                """ + AGG_MERGE,
+                (cutoff_ms,),
+            )
+            cur = con.execute(f"DELETE FROM telemetry_agg WHERE res_ms = {HOUR_MS} AND bucket_ms < ?",
+                              (cutoff_ms,))
+        return cur.rowcount
+    return task
+
+def run_maintenance(now_ms: Optional[int] = None) -> Dict[str, Any]:
+    """
+    O trecere de retenție: partițiile complet mai vechi de RAW_RETENTION_DAYS sunt agregate
+    orar (pe o conexiune de citire, fără să blocheze ingestul) și apoi șterse de writer;
+    agregatele orare mai vechi de HOURLY_RETENTION_DAYS sunt compactate în agregate zilnice.
+    """
+    now_ms = now_ms or int(time.time() * 1000)
+    raw_cutoff = now_ms - int(RAW_RETENTION_DAYS * PARTITION_MS)
+    active = partition_name(now_ms)
+    with read_db() as con:
+        expired = [r[0] for r in con.execute(
+            "SELECT name FROM partitions WHERE hi_ms <= ? AND name <> ? ORDER BY lo_ms",
+            (raw_cutoff, active),
+        )]
+    retired = {}
+    for name in expired:
+        # partițiile expirate nu mai primesc scrieri => agregatele din snapshot sunt finale
+        with read_db() as con:
+            agg_rows = con.execute(downsample_sql(name)).fetchall()
+        retired[name] = run_in_writer(retire_partition(name, [tuple(r) for r in agg_rows]))
+    hourly_cutoff = now_ms - int(HOURLY_RETENTION_DAYS * PARTITION_MS)
+    hourly_cutoff -= hourly_cutoff % PARTITION_MS
+    compacted = run_in_writer(compact_hourly(hourly_cutoff))
+    pruned = run_in_writer(prune_gps_points(raw_cutoff))
+    return {"retired_partitions": retired, "hourly_rows_compacted": compacted, "gps_points_pruned": pruned}
+
+def maintenance_loop() -> None:
+    while True:
+        try:
+            res = run_maintenance()
+            if any(res.values()):
+                print("[CLOUD] maintenance:", res)
+        except Exception as e:
+            ERRORS.labels("maintenance").inc()
+            print("[CLOUD] maintenance error:", e)
+        time.sleep(MAINTENANCE_INTERVAL_SEC)
 
 def row_to_dict(r: sqlite3.Row) -> Dict[str, Any]:
     d = dict(r)
     return d
 
+# -------------------------- Cache răspunsuri --------------------------
+def bump_generation() -> None:
+    """Apelat de writer DUPĂ commit: o citire nu poate pune date vechi sub generația nouă."""
+    global ingest_generation
+    ingest_generation += 1
+
+class ResponseCache:
+    """
+    LRU de corpuri JSON gata serializate, cheie = (endpoint, parametri), valabile doar pentru
+    generația de ingest la care au fost calculate; plafonat la CACHE_MAX_BYTES.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[tuple, Tuple[int, bytes]]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple, generation: int) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, generation: int, body: bytes) -> None:
+        if len(body) > self.max_bytes // 4:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[key] = (generation, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+response_cache = ResponseCache(CACHE_MAX_BYTES)
+Gauge("cloud_cache_hits", "Răspunsuri servite din cache").set_function(lambda: response_cache.hits)
+Gauge("cloud_cache_misses", "Răspunsuri recalculate").set_function(lambda: response_cache.misses)
+Gauge("cloud_cache_bytes", "Mărimea cache-ului de răspunsuri").set_function(lambda: response_cache.size)
+CACHE_BOOT_ID = uuid.uuid4().hex[:8]    # generația repornește de la 0 => ETag-urile nu supraviețuiesc restartului
+
+def cached_json(request: Request, key: tuple, compute: Callable[[], Any]) -> Response:
+    """
+    ETag = generația de ingest + cheia: If-None-Match potrivit => 304 fără DB și fără JSON;
+    altfel corpul din cache, dacă generația nu s-a schimbat; altfel compute().
+    """
+    generation = ingest_generation
+    etag = f'"{CACHE_BOOT_ID}-{generation:x}-{zlib.crc32(repr(key).encode()):08x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    body = response_cache.get(key, generation)
+    if body is None:
+        body = json.dumps(compute(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        response_cache.put(key, generation, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # -------------------------- Endpoints --------------------------
 @app.get("/health")
 def health():
     return {"status": "ok", "db": DB_PATH}
+
+# -------------------------- Ingest --------------------------
+# rândurile telemetry circulă ca tuple în ordinea coloanelor de mai jos; (ingest_ts, ingest_ms)
+# sunt inserate de writer la commit (poziția 9-10), deci ingest_ms e monoton; urmează
+# ts_ms și câmpurile tipizate (TYPED_FIELDS), extrase la decodare
+INSERT_SQL = """
+    INSERT OR IGNORE INTO {table} (
+      id, ts, topic, sensor, productId, locationId,
+      edge_alert, edge_latency_ms, data_json, ingest_ts, ingest_ms,
+      ts_ms, temp_c, humidity_pct, level, reorder_point, safety_stock, lat, lon, speed_kmh
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_ROLLUP_SQL = """
+    INSERT OR IGNORE INTO rollup (
+      id, field, sensor, productId, locationId, window_start_ms, window_end_ms,
+      count, n, vmin, vmax, vmean, vlast, ingest_ts
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_POSITION_SQL = """
+    INSERT INTO latest_position (
+      productId, locationId, ts_ms, id, ts, ingest_ts, topic, sensor,
+      edge_alert, edge_latency_ms, data_json, lat, lon, speed_kmh
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (productId, locationId) DO UPDATE SET
+      ts_ms=excluded.ts_ms, id=excluded.id, ts=excluded.ts, ingest_ts=excluded.ingest_ts,
+      topic=excluded.topic, sensor=excluded.sensor, edge_alert=excluded.edge_alert,
+      edge_latency_ms=excluded.edge_latency_ms, data_json=excluded.data_json,
+      lat=excluded.lat, lon=excluded.lon, speed_kmh=excluded.speed_kmh
+    WHERE excluded.ts_ms > latest_position.ts_ms
+"""
+
+INSERT_GPS_POINT_SQL = """
+    INSERT INTO gps_rtree (
+      min_lat, max_lat, min_lon, max_lon, min_ts, max_ts,
+      ts_ms, lat, lon, point_id, productId, locationId, speed_kmh
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def gps_points(rows: List[tuple]) -> List[tuple]:
+    """Punctele GPS (cu lat/lon/ts valide) din rândurile noi, gata pentru INSERT_GPS_POINT_SQL."""
+    return [
+        (r[17], r[17], r[18], r[18], r[11], r[11], r[11], r[17], r[18], r[0], r[4], r[5], r[19])
+        for r in rows
+        if r[3] == "gps" and r[17] is not None and r[18] is not None and r[11] is not None
+    ]
+
+def latest_positions(rows: List[tuple]) -> List[tuple]:
+    """
+    Cel mai nou punct GPS per (productId, locationId) dintr-un grup de rânduri telemetry,
+    gata pentru UPSERT_POSITION_SQL (care păstrează oricum punctul cu `ts` mai nou).
+    """
+    newest: Dict[tuple, tuple] = {}
+    for r in rows:
+        if r[3] != "gps" or r[4] is None or r[5] is None or r[11] is None:
+            continue
+        key = (r[4], r[5])
+        if key not in newest or r[11] > newest[key][11]:
+            newest[key] = r
+    return [
+        (product_id, location_id, r[11], r[0], r[1], r[9], r[2], r[3], r[6], r[7], r[8],
+         r[17], r[18], r[19])
+        for (product_id, location_id), r in newest.items()
+    ]
+
 def _norm_id(item: dict, k1: str, k2: str) -> str | None:
     v = item.get(k1)
     if v is None:
         v = item.get(k2)
     return str(v) if v is not None else None
 
-# ... în interiorul handler-ului /ingest, pentru fiecare `it` din items:
-product_id = _norm_id(it, "productId", "product_id")
-location_id = _norm_id(it, "locationId", "location_id")
+def ingest_clock(after_ms: int = 0) -> Tuple[str, int]:
+    """
+    Momentul ingestului: (ISO text pentru `ingest_ts`, epoch-ms pentru `ingest_ms`),
+    strict după `after_ms` (writer-ul îl ține monoton între commit-uri).
+    """
+    ms = max(int(time.time() * 1000), after_ms + 1)
+    return datetime.utcfromtimestamp(ms / 1000).isoformat(timespec="milliseconds") + "Z", ms
 
-sensor = it.get("sensor")
-data_json = it.get("data") if isinstance(it.get("data"), dict) else it.get("data_json")
-if isinstance(data_json, dict):
-    data_json = json.dumps(data_json)
+def _num(v: Any) -> Optional[float]:
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else None
 
-# edge meta
-edge_alert = (it.get("_edge") or {}).get("alert")
-edge_latency_ms = (it.get("_edge") or {}).get("latency_ms_sensor_to_edge")
-topic = (it.get("_edge") or {}).get("topic")
+def typed_fields(ts_ms: Optional[int], data: Any) -> tuple:
+    """(ts_ms, TYPED_FIELDS...) din payload-ul deja decodat; câmpurile lipsă/ne-numerice => NULL."""
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            data = None
+    if not isinstance(data, dict):
+        return (ts_ms,) + (None,) * len(TYPED_FIELDS)
+    return (ts_ms,) + tuple(_num(data.get(f)) for f in TYPED_FIELDS)
 
-# timpi
-src_ts = it.get("ts")              # când a fost generat de „senzor”
-ingest_ts = datetime.utcnow().isoformat() + "Z"  # când ajunge în cloud
+def is_sql_row(row: tuple) -> bool:
+    """Toate valorile se pot lega ca parametri SQLite (scalari, întregi pe 64 de biți)."""
+    for v in row:
+        if v is None or isinstance(v, (str, float)):
+            continue
+        if not isinstance(v, int) or not -2 ** 63 <= v < 2 ** 63:
+            return False
+    return True
 
-# construiește row/insert exact ca în codul tău, dar folosind variabilele de mai sus:
-# productId=product_id, locationId=location_id, sensor=sensor, data_json=data_json,
-# ts=src_ts, ingest_ts=ingest_ts, edge_alert=edge_alert, edge_latency_ms=edge_latency_ms, topic=topic
+def normalize_item(it: Dict[str, Any], default_ts: str) -> tuple:
+    """
+    Transformă un item primit de la edge în rândul pentru `telemetry` (fără ștampila de ingest).
+    Forma greșită (`_edge` care nu e obiect, valori ne-scalare) => ValueError, item respins:
+    altfel eroarea ar apărea abia în writer și ar pica tot group commit-ul.
+    """
+    edge = it.get("_edge") or {}
+    if not isinstance(edge, dict):
+        raise ValueError("_edge must be an object")
+    data = it.get("data") if isinstance(it.get("data"), dict) else it.get("data_json")
+    data_json = json.dumps(data) if isinstance(data, dict) else data
+    item_id = it.get("id")
+    ts = it.get("ts") or default_ts              # când a fost generat de „senzor”
+    row = (
+        str(item_id) if item_id is not None else str(uuid.uuid4()),
+        ts,
+        edge.get("topic"),
+        it.get("sensor"),
+        _norm_id(it, "productId", "product_id"),
+        _norm_id(it, "locationId", "location_id"),
+        edge.get("alert"),
+        edge.get("latency_ms_sensor_to_edge"),
+        data_json,
+    ) + typed_fields(iso_to_ms(ts), data)
+    if not is_sql_row(row):
+        raise ValueError("item fields must be scalars")
+    return row
 
-@app.get("/metrics")
-def metrics():
-    cur = db.cursor()
-    total = cur.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0]
-    alerts = cur.execute("SELECT COUNT(*) FROM telemetry WHERE edge_alert IS NOT NULL").fetchone()[0]
-    avg_lat = cur.execute(
-        "SELECT AVG(edge_latency_ms) FROM telemetry WHERE edge_latency_ms IS NOT NULL"
-    ).fetchone()[0]
+def rows_from_columns(batch: Dict[str, Any], default_ts: str) -> List[tuple]:
+    """
+    Varianta columnară msgpack: coloane paralele, productId/locationId/sensor/topic
+    dicționar-encodate (indici într-o listă de valori), timpi ca epoch-ms, `data` deja JSON.
+    Rândurile se construiesc direct prin zip, fără dict-uri intermediare per item.
+    """
+    cols, dicts = batch["cols"], batch.get("dict") or {}
+
+    def decoded(name: str) -> List[Any]:
+        col = cols.get(name) or [None] * len(cols["id"])
+        values = dicts.get(name)
+        if values is None:
+            return col
+        used = [i for i in col if i is not None]
+        if used and (min(used) < 0 or max(used) >= len(values)):   # indicii negativi ar lua alt capăt
+            raise ValueError(f"{name}: dictionary index out of range")
+        return [None if i is None else values[i] for i in col]
+
+    def iso(ms: Optional[int]) -> str:
+        if ms is None:
+            return default_ts
+        return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat()
+
+    return [
+        (str(item_id) if item_id is not None else str(uuid.uuid4()), iso(ts_ms), topic, sensor,
+         product_id, location_id, alert, latency, data)
+        + typed_fields(ts_ms if ts_ms is not None else iso_to_ms(default_ts), data)
+        for item_id, ts_ms, topic, sensor, product_id, location_id, alert, latency, data in zip(
+            cols["id"], cols["ts_ms"], decoded("topic"), decoded("sensor"),
+            decoded("productId"), decoded("locationId"), decoded("alert"),
+            cols.get("latency_ms") or [None] * len(cols["id"]), cols["data"],
+        )
+    ]
+
+class UnsupportedFormat(ValueError):
+    pass
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        out = body
+    elif encoding == "gzip":
+        d = zlib.decompressobj(wbits=31)
+        out = d.decompress(body, INGEST_MAX_BYTES + 1)
+    elif encoding == "zstd" and zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body))
+        out = reader.read(INGEST_MAX_BYTES + 1)
+    else:
+        raise UnsupportedFormat(f"unsupported content-encoding: {encoding}")
+    if len(out) > INGEST_MAX_BYTES:
+        raise ValueError("batch too large")
+    return out
+
+@INGEST_DECODE_SECONDS.time()
+def decode_batch(body: bytes, content_type: str, encoding: str) -> Tuple[List[tuple], List[tuple], int]:
+    """
+    Decodează corpul unui POST /ingest în (rânduri telemetry, rânduri rollup,
+    număr de items primite). Record-urile cu `"kind": "rollup"` merg în tabela `rollup`.
+    """
+    data = decompress(body, encoding)
+    ctype = content_type.split(";")[0].strip().lower()
+    ingest_ts, _ = ingest_clock()
+
+    if ctype in ("", "application/json"):
+        batch = json.loads(data)
+        if not isinstance(batch, dict):
+            raise ValueError('body must be an object: {"items": [...]}')
+        items = batch.get("items") or []
+        if not isinstance(items, list):
+            raise ValueError("items must be a list")
+    elif ctype == "application/x-ndjson":
+        items = [json.loads(line) for line in data.splitlines() if line.strip()]
+    elif ctype == "application/x-msgpack" and msgpack is not None:
+        batch = msgpack.unpackb(data, raw=False)
+        if not isinstance(batch, dict):
+            raise ValueError("msgpack body must be a map")
+        built = rows_from_columns(batch, ingest_ts)
+        records = batch.get("rollups") or []
+        rows = [r for r in built if is_sql_row(r)]
+        return rows, valid_rollups(records, ingest_ts), len(built) + len(records)
+    else:
+        raise UnsupportedFormat(f"unsupported content-type: {ctype}")
+
+    # itemii malformați sunt săriți și raportați ca `rejected`, restul batch-ului intră
+    rows, records = [], []
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        if it.get("kind") == "rollup":
+            records.append(it)
+            continue
+        try:
+            rows.append(normalize_item(it, ingest_ts))
+        except (ValueError, TypeError):
+            continue
+    return rows, valid_rollups(records, ingest_ts), len(items)
+
+def valid_rollups(records: List[Any], ingest_ts: str) -> List[tuple]:
+    """Rândurile rollup ale record-urilor valide; cele malformate ajung la `rejected`."""
+    out = []
+    for rec in records:
+        try:
+            out.extend(rollup_rows(rec, ingest_ts))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            continue
+    return out
+
+@app.get("/ingest/formats")
+def ingest_formats():
+    """Formatele și compresiile acceptate de /ingest, în ordinea preferinței."""
     return {
-        "total_rows": int(total),
-        "alerts": int(alerts),
-        "avg_edge_latency_ms": None if avg_lat is None else float(avg_lat),
+        "formats": (["msgpack"] if msgpack else []) + ["ndjson", "json"],
+        "encodings": (["zstd"] if zstandard else []) + ["gzip", "identity"],
+    }
+
+def rollup_rows(rec: Dict[str, Any], ingest_ts: str) -> List[tuple]:
+    """Un record rollup de la edge => câte un rând per câmp agregat."""
+    head = (
+        str(rec["id"]), rec.get("sensor"),
+        _norm_id(rec, "productId", "product_id"), _norm_id(rec, "locationId", "location_id"),
+        int(rec["window_start_ms"]), int(rec["window_end_ms"]), int(rec.get("count") or 0),
+    )
+    fields = rec.get("fields") or {"": {}}
+    rows = [
+        (head[0], name) + head[1:] + (
+            st.get("n"), st.get("min"), st.get("max"), st.get("mean"), st.get("last"), ingest_ts,
+        )
+        for name, st in fields.items()
+    ]
+    if not all(is_sql_row(r) for r in rows):
+        raise ValueError("rollup fields must be scalars")
+    return rows
+
+@app.post("/ingest")
+async def ingest(request: Request):
+    """
+    Primește un batch de la edge și îl pune în coada writer-ului, care îl scrie într-o
+    singură tranzacție. Formate: JSON (`{"batch_ts": ..., "items": [...]}`), NDJSON sau
+    msgpack columnar, opțional cu Content-Encoding gzip/zstd. Duplicatele (același `id`)
+    sunt ignorate prin cheia primară. Coadă plină => 429 + Retry-After.
+    """
+    body = await request.body()
+    INGEST_BATCH_BYTES.observe(len(body))
+    try:
+        batch = batch_seq(request.headers)
+    except ValueError as e:
+        ERRORS.labels("bad_batch").inc()
+        return JSONResponse({"error": f"bad batch sequence: {e}"}, status_code=400)
+    if batch is not None:
+        mark = edge_marks.get(batch[:2])
+        if mark is not None and mark.seen(batch[2]):
+            # retry al unui batch deja aplicat: confirmat fără decodare și fără telemetry
+            INGEST_BATCHES.labels("duplicate").inc()
+            edge_duplicates[batch[:2]] += 1
+            return {"received": 0, "inserted": 0, "duplicates": 0, "rejected": 0, "rollup_rows": 0,
+                    "duplicate_batch": True, "seq": batch[2]}
+    try:
+        rows, rollups, received = await run_in_threadpool(
+            decode_batch, body,
+            request.headers.get("content-type", ""), request.headers.get("content-encoding", ""),
+        )
+    except UnsupportedFormat as e:
+        ERRORS.labels("unsupported_format").inc()
+        return JSONResponse({"error": str(e), **ingest_formats()}, status_code=415)
+    except (ValueError, KeyError, TypeError, zlib.error) as e:
+        ERRORS.labels("bad_batch").inc()
+        return JSONResponse({"error": f"bad batch: {e}"}, status_code=400)
+    INGEST_BATCH_ITEMS.observe(received)
+
+    fut: Future = Future()
+    try:
+        ingest_queue.put_nowait((rows, rollups, fut, batch))
+    except queue.Full:
+        ERRORS.labels("queue_full").inc()
+        return JSONResponse(
+            {"error": "ingest queue full"}, status_code=429,
+            headers={"Retry-After": str(INGEST_RETRY_AFTER_SEC)},
+        )
+    try:
+        inserted, rollups_inserted, duplicate_batch = await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(fut)), INGEST_WAIT_SEC)
+    except asyncio.TimeoutError:
+        # batch-ul rămâne în coadă; edge-ul reîncearcă, duplicatele sunt ignorate
+        ERRORS.labels("commit_timeout").inc()
+        return JSONResponse(
+            {"error": "ingest commit timeout"}, status_code=503,
+            headers={"Retry-After": str(INGEST_RETRY_AFTER_SEC)},
+        )
+    except Exception as e:
+        ERRORS.labels("write_error").inc()
+        return JSONResponse({"error": f"ingest failed: {e}"}, status_code=500)
+    INGEST_ROWS.labels("inserted").inc(inserted)
+    INGEST_ROWS.labels("duplicate").inc(len(rows) - inserted)
+    INGEST_BATCHES.labels("unsequenced" if batch is None else "duplicate" if duplicate_batch else "applied").inc()
+    if duplicate_batch:
+        edge_duplicates[batch[:2]] += 1
+    out = {
+        "received": received,
+        "inserted": inserted,
+        "duplicates": len(rows) - inserted,
+        "rejected": received - len(rows) - len({r[0] for r in rollups}),
+        "rollup_rows": rollups_inserted,
     }
+    if batch is not None:
+        out.update(duplicate_batch=duplicate_batch, seq=batch[2])
+    return out
+
+@app.get("/edges")
+def edges():
+    """
+    Secvențele per (edge, epoch): contiguous (tot ce e sub e aplicat), high, golurile dintre
+    ele (batch-uri încă în zbor / de reîncercat), batch-urile pierdute pe edge și retry-urile
+    confirmate fără scriere.
+    """
+    items = []
+    for (edge_id, epoch), mark in sorted(edge_marks.items()):
+        items.append({
+            "edge_id": edge_id,
+            "epoch": epoch,
+            "contiguous": mark.contiguous,
+            "high": mark.high,
+            "gaps": mark.gaps(),
+            "lost": mark.lost,
+            "lost_ranges": mark.lost_ranges,
+            "batches": mark.batches,
+            "duplicates": edge_duplicates[(edge_id, epoch)],
+            "last_seen": datetime.fromtimestamp(mark.last_seen_ms / 1000, timezone.utc).isoformat()
+                         if mark.last_seen_ms else None,
+        })
+    return {"items": items}
+
+@app.get("/metrics")
+def metrics(request: Request):
+    """Statistici menținute incremental la ingest: cost O(1), indiferent de mărimea tabelei."""
+    return cached_json(request, ("metrics",), stats.to_json)
+
+# adâncimi de cozi / buffere, citite la scrape
+Gauge("cloud_ingest_queue_depth", "Batch-uri în coada writer-ului").set_function(ingest_queue.qsize)
+Gauge("cloud_admin_queue_depth", "Sarcini administrative în așteptare").set_function(admin_queue.qsize)
+Gauge("cloud_read_pool_idle", "Conexiuni read-only libere").set_function(read_pool.qsize)
+
+@app.get("/metrics/prom")
+def metrics_prom():
+    """Instrumentarea căilor fierbinți, în formatul text Prometheus."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+TELEMETRY_COLUMNS = """
+    rowid AS _rowid, id, ts, ingest_ts, ingest_ms, topic, sensor,
+    productId, locationId, edge_alert, edge_latency_ms, data_json
+"""
+
+def parse_cursor(cursor: Optional[str], since: Optional[int]) -> Optional[Tuple[int, int]]:
+    """Cheia (ingest_ms, rowid) după care continuă citirea: `cursor` opac sau `since` (epoch-ms)."""
+    if cursor:
+        ms, _, rowid = cursor.partition(":")
+        try:
+            return int(ms), int(rowid or 0)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"invalid cursor: {cursor}")
+    if since is not None:
+        return since, 2 ** 63 - 1      # tot ce e strict după `since`
+    return None
+
+def page(rows: List[sqlite3.Row], after: Optional[Tuple[int, int]]) -> Dict[str, Any]:
+    """Răspunsul paginat: items + cursor-ul (cea mai nouă cheie văzută) pentru următorul apel."""
+    items = [row_to_dict(r) for r in rows]
+    keys = [(d["ingest_ms"] or 0, d.pop("_rowid")) for d in items]
+    newest = max(keys) if keys else after
+    return {"items": items, "cursor": f"{newest[0]}:{newest[1]}" if newest else None}
+
+def read_after(con: sqlite3.Connection, after: Tuple[int, int], n: int, min_ms: int = 0) -> List[sqlite3.Row]:
+    """
+    Keyset: rândurile cu (ingest_ms, rowid) > after, crescător, parcurgând partițiile de la
+    cea mai veche relevantă; în fiecare, intervalul folosește indexul pe ingest_ms.
+    """
+    lo = max(after[0], min_ms)
+    rows: List[sqlite3.Row] = []
+    for name in partitions_for(con, lo_ms=lo, newest_first=False):
+        rows += con.execute(
+            f"""
+            SELECT {TELEMETRY_COLUMNS}
+            FROM {name}
+            WHERE ingest_ms >= ? AND (ingest_ms > ? OR rowid > ?)
+            ORDER BY ingest_ms ASC, rowid ASC
+            LIMIT ?
+            """,
+            (lo, after[0], after[1], n - len(rows)),
+        ).fetchall()
+        if len(rows) >= n:
+            break
+    return rows
+
+def read_newest(con: sqlite3.Connection, n: int, min_ms: Optional[int] = None) -> List[sqlite3.Row]:
+    """Cele mai noi `n` rânduri (opțional cu ingest_ms >= min_ms), partiție cu partiție."""
+    rows: List[sqlite3.Row] = []
+    for name in partitions_for(con, lo_ms=min_ms):
+        rows += con.execute(
+            f"""
+            SELECT {TELEMETRY_COLUMNS}
+            FROM {name}
+            WHERE ingest_ms >= ?
+            ORDER BY ingest_ms DESC, rowid DESC
+            LIMIT ?
+            """,
+            (min_ms or 0, n - len(rows)),
+        ).fetchall()
+        if len(rows) >= n:
+            break
+    return rows
 
 @app.get("/last")
-def last(n: int = Query(200, ge=1, le=2000)):
-    rows = db.execute(
-        """
-        SELECT id, ts, ingest_ts, topic, sensor,
-               productId, locationId, edge_alert, edge_latency_ms, data_json
-        FROM telemetry
-        ORDER BY ingest_ts DESC
-        LIMIT ?
-        """,
-        (n,),
-    ).fetchall()
-    return {"items": [row_to_dict(r) for r in rows]}
+def last(
+    request: Request,
+    n: int = Query(200, ge=1, le=2000),
+    cursor: Optional[str] = Query(None, description="cursor întors de apelul anterior"),
+    since: Optional[int] = Query(None, description="epoch-ms; doar rândurile ingerate după"),
+):
+    """
+    Ultimele `n` rânduri (cele mai noi primele). Cu `cursor`/`since`: rândurile de după
+    acea cheie, în ordine crescătoare (tail fără OFFSET).
+    """
+    after = parse_cursor(cursor, since)
+
+    def compute() -> Dict[str, Any]:
+        with read_db() as con:
+            rows = read_after(con, after, n) if after is not None else read_newest(con, n)
+        return page(rows, after)
+
+    return cached_json(request, ("last", n, after), compute)
 
 @app.get("/recent")
 def recent(
+    request: Request,
     n: int = Query(200, ge=1, le=2000),
     seconds: int = Query(DEFAULT_RECENT_SEC, ge=1, le=86400),
+    cursor: Optional[str] = Query(None, description="cursor întors de apelul anterior"),
+    since: Optional[int] = Query(None, description="epoch-ms; doar rândurile ingerate după"),
 ):
-    rows = db.execute(
-        """
-        SELECT id, ts, ingest_ts, topic, sensor,
-               productId, locationId, edge_alert, edge_latency_ms, data_json
-        FROM telemetry
-        WHERE julianday('now') - julianday(ingest_ts) <= (? / 86400.0)
-        ORDER BY ingest_ts DESC
-        LIMIT ?
+    """
+    Rândurile ingerate în ultimele `seconds` secunde; paginare cu `cursor`/`since` ca la /last.
+    Fereastra e aliniată la CACHE_RECENT_GRAIN_MS, ca răspunsul să poată fi refolosit între poll-uri.
+    """
+    now_ms = int(time.time() * 1000)
+    min_ms = now_ms - now_ms % CACHE_RECENT_GRAIN_MS - seconds * 1000
+    after = parse_cursor(cursor, since)
+
+    def compute() -> Dict[str, Any]:
+        with read_db() as con:
+            if after is not None:
+                rows = read_after(con, after, n, min_ms)
+            else:
+                rows = read_newest(con, n, min_ms)
+        return page(rows, after)
+
+    return cached_json(request, ("recent", n, min_ms, after), compute)
+
+@app.get("/latest_gps")
+def latest_gps(request: Request):
+    """
+    Ultimul punct GPS pentru fiecare (productId, locationId), din `latest_position`
+    (menținută la ingest) => cost O(număr de asset-uri), nu O(istoric).
+    """
+    def compute() -> Dict[str, Any]:
+        with read_db() as con:
+            rows = con.execute(
+                """
+                SELECT id, ts, ingest_ts, topic, sensor, productId, locationId,
+                       edge_alert, edge_latency_ms, data_json, lat, lon, speed_kmh
+                FROM latest_position
+                ORDER BY ingest_ts DESC
+                """
+            ).fetchall()
+        return {"items": [row_to_dict(r) for r in rows]}
+
+    return cached_json(request, ("latest_gps",), compute)
+
+# -------------------------- GPS spațial --------------------------
+EARTH_R_M = 6371000.0
+M_PER_DEG_LAT = 111320.0
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_R_M * math.asin(math.sqrt(a))
+
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """`min_lon,min_lat,max_lon,max_lat` (ordinea GeoJSON) -> (min_lat, max_lat, min_lon, max_lon)."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(x) for x in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid bbox: {bbox}")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise HTTPException(status_code=400, detail=f"invalid bbox: {bbox}")
+    if min_lon > max_lon:
+        raise HTTPException(status_code=400, detail=f"bbox crosses the antimeridian, split it in two: {bbox}")
+    return min_lat, max_lat, min_lon, max_lon
+
+def assets_in_box(con: sqlite3.Connection, box: Tuple[float, float, float, float],
+                  lo_ms: Optional[int], hi_ms: Optional[int],
+                  near: Optional[Tuple[float, float, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Fără interval de timp: ultima poziție a fiecărui asset aflat în cutie (latest_position_rtree).
+    Cu interval: asset-urile care au trecut prin cutie în [lo_ms, hi_ms) (gps_rtree), fiecare cu
+    cel mai nou punct din cutie și numărul de puncte. `near` = (lat, lon, radius_m): fiecare punct
+    e filtrat întâi după distanță, deci asset-ul primește cel mai nou punct din cerc.
+    """
+    min_lat, max_lat, min_lon, max_lon = box
+    near_sql, near_args = "", ()
+    if near is not None:
+        near_sql, near_args = " AND haversine_m(?, ?, {p}lat, {p}lon) <= ?", near
+    if lo_ms is None and hi_ms is None:
+        rows = con.execute(
+            f"""
+            SELECT lp.id, lp.ts, lp.ts_ms, lp.productId, lp.locationId, lp.lat, lp.lon, lp.speed_kmh
+            FROM latest_position_rtree r JOIN latest_position lp ON lp.rowid = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+              AND lp.lat BETWEEN ? AND ? AND lp.lon BETWEEN ? AND ?{near_sql.format(p="lp.")}
+            """,
+            (min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon, *near_args),
+        ).fetchall()
+        return [row_to_dict(r) for r in rows]
+    lo = -(2 ** 63) if lo_ms is None else lo_ms
+    hi = 2 ** 63 - 1 if hi_ms is None else hi_ms
+    rows = con.execute(
+        f"""
+        SELECT point_id AS id, MAX(ts_ms) AS ts_ms, productId, locationId, lat, lon, speed_kmh,
+               COUNT(*) AS points
+        FROM gps_rtree
+        WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+          AND max_ts >= ? AND min_ts <= ?
+          AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? AND ts_ms >= ? AND ts_ms < ?{near_sql.format(p="")}
+        GROUP BY productId, locationId
         """,
-        (seconds, n),
+        (min_lat, max_lat, min_lon, max_lon, lo, hi,
+         min_lat, max_lat, min_lon, max_lon, lo, hi, *near_args),
     ).fetchall()
-    return {"items": [row_to_dict(r) for r in rows]}
+    items = [row_to_dict(r) for r in rows]
+    for d in items:
+        d["ts"] = datetime.fromtimestamp(d["ts_ms"] / 1000, timezone.utc).isoformat()
+    return items
 
-@app.get("/latest_gps")
-def latest_gps():
+@app.get("/gps/within")
+def gps_within(
+    request: Request,
+    bbox: str = Query(..., description="min_lon,min_lat,max_lon,max_lat"),
+    start: Optional[str] = Query(None, description="epoch-ms sau ISO-8601; fără start/end => poziția curentă"),
+    end: Optional[str] = Query(None, description="epoch-ms sau ISO-8601 (exclusiv)"),
+):
+    """Asset-urile dintr-un dreptunghi, prin indexul R*Tree (fără scanarea istoricului)."""
+    box = parse_bbox(bbox)
+    lo_ms, hi_ms = parse_time_ms(start, "start"), parse_time_ms(end, "end")
+
+    def compute() -> Dict[str, Any]:
+        with read_db() as con:
+            return {"items": assets_in_box(con, box, lo_ms, hi_ms)}
+
+    return cached_json(request, ("gps_within", box, lo_ms, hi_ms), compute)
+
+@app.get("/gps/near")
+def gps_near(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(..., gt=0, le=500000),
+    start: Optional[str] = Query(None, description="epoch-ms sau ISO-8601; fără start/end => poziția curentă"),
+    end: Optional[str] = Query(None, description="epoch-ms sau ISO-8601 (exclusiv)"),
+):
+    """
+    Asset-urile aflate la cel mult `radius_m` de (lat, lon), cele mai apropiate primele:
+    cutia care încadrează cercul merge prin R*Tree, apoi filtru exact cu haversine.
+    """
+    lo_ms, hi_ms = parse_time_ms(start, "start"), parse_time_ms(end, "end")
+    dlat = radius_m / M_PER_DEG_LAT
+    dlon = min(radius_m / (M_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6)), 180.0)
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    # cercul care trece de antimeridian => două cutii, una de fiecare parte
+    boxes = [(min_lat, max_lat, max(lon - dlon, -180.0), min(lon + dlon, 180.0))]
+    if lon - dlon < -180.0:
+        boxes.append((min_lat, max_lat, lon - dlon + 360.0, 180.0))
+    if lon + dlon > 180.0:
+        boxes.append((min_lat, max_lat, -180.0, lon + dlon - 360.0))
+
+    def compute() -> Dict[str, Any]:
+        found: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        with read_db() as con:
+            for box in boxes:
+                for d in assets_in_box(con, box, lo_ms, hi_ms, near=(lat, lon, radius_m)):
+                    key = (d["productId"], d["locationId"])
+                    prev = found.get(key)
+                    if prev is None:
+                        found[key] = d
+                        continue
+                    newest = d if d["ts_ms"] > prev["ts_ms"] else prev
+                    if "points" in d:
+                        newest["points"] = prev["points"] + d["points"]
+                    found[key] = newest
+        items = list(found.values())
+        for d in items:
+            d["distance_m"] = round(haversine_m(lat, lon, d["lat"], d["lon"]), 1)
+        items.sort(key=lambda d: d["distance_m"])
+        return {"items": items}
+
+    return cached_json(request, ("gps_near", lat, lon, radius_m, lo_ms, hi_ms), compute)
+
+def grid_cell_deg(zoom: int, cell_px: int, lat: float) -> Tuple[float, float]:
+    """
+    (dlat, dlon) ale unei celule de ~`cell_px` pixeli la zoom-ul web-mercator `zoom` (tile 256 px).
+    Pe latitudine celula e scalată cu cos(lat) la o latitudine rotunjită la grad, ca celulele să
+    arate aproape pătrate pe hartă și să rămână aceleași cât timp harta e doar mutată puțin.
+    """
+    dlon = 360.0 / (2 ** zoom) * cell_px / 256
+    return dlon * max(math.cos(math.radians(round(lat))), 0.05), dlon
+
+def grid_cells(con: sqlite3.Connection, box: Tuple[float, float, float, float], dlat: float, dlon: float,
+               lo_ms: Optional[int], hi_ms: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    Agregarea pe celule o face SQLite (GROUP BY pe indicii de celulă), peste rândurile filtrate
+    de R*Tree: fără start/end pozițiile curente (latest_position_rtree), altfel punctele din
+    istoric (gps_rtree), cu numărul de asset-uri distincte pe celulă.
     """
-    Ultimul punct GPS pentru fiecare (productId, locationId).
-    Compatibil cu SQLite.
+    min_lat, max_lat, min_lon, max_lon = box
+    cell = "CAST((lat + 90.0) / ? AS INTEGER) AS cy, CAST((lon + 180.0) / ? AS INTEGER) AS cx"
+    if lo_ms is None and hi_ms is None:
+        rows = con.execute(
+            f"""
+            SELECT {cell}, COUNT(*) AS count, COUNT(*) AS assets, AVG(lat) AS lat, AVG(lon) AS lon,
+                   MIN(productId) AS productId, MIN(locationId) AS locationId, MAX(ts_ms) AS ts_ms
+            FROM (SELECT lp.lat, lp.lon, lp.productId, lp.locationId, lp.ts_ms
+                  FROM latest_position_rtree r JOIN latest_position lp ON lp.rowid = r.id
+                  WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+                    AND lp.lat BETWEEN ? AND ? AND lp.lon BETWEEN ? AND ?)
+            GROUP BY cy, cx
+            """,
+            (dlat, dlon, min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon),
+        ).fetchall()
+    else:
+        lo = -(2 ** 63) if lo_ms is None else lo_ms
+        hi = 2 ** 63 - 1 if hi_ms is None else hi_ms
+        rows = con.execute(
+            f"""
+            SELECT {cell}, COUNT(*) AS count,
+                   COUNT(DISTINCT ifnull(productId, '') || '|' || ifnull(locationId, '')) AS assets,
+                   AVG(lat) AS lat, AVG(lon) AS lon,
+                   MIN(productId) AS productId, MIN(locationId) AS locationId, MAX(ts_ms) AS ts_ms
+            FROM gps_rtree
+            WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+              AND max_ts >= ? AND min_ts <= ?
+              AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? AND ts_ms >= ? AND ts_ms < ?
+            GROUP BY cy, cx
+            """,
+            (dlat, dlon, min_lat, max_lat, min_lon, max_lon, lo, hi,
+             min_lat, max_lat, min_lon, max_lon, lo, hi),
+        ).fetchall()
+    cells = []
+    for r in rows:
+        d = row_to_dict(r)
+        if d["assets"] != 1:                     # identitatea are sens doar pentru un singur asset
+            d["productId"] = d["locationId"] = None
+        d["lat"], d["lon"] = round(d["lat"], 6), round(d["lon"], 6)
+        cells.append(d)
+    return cells
+
+@app.get("/gps/grid")
+def gps_grid(
+    request: Request,
+    bbox: str = Query(..., description="viewport: min_lon,min_lat,max_lon,max_lat"),
+    zoom: int = Query(..., ge=0, le=22, description="zoom web-mercator al hărții"),
+    cell_px: int = Query(64, ge=16, le=256, description="mărimea aproximativă a unei celule, în pixeli"),
+    start: Optional[str] = Query(None, description="epoch-ms sau ISO-8601; fără start/end => poziția curentă"),
+    end: Optional[str] = Query(None, description="epoch-ms sau ISO-8601 (exclusiv)"),
+):
+    """
+    Pozițiile din viewport grupate pe o grilă dependentă de zoom: per celulă numărul de puncte /
+    asset-uri și centroidul (plus identitatea când celula are un singur asset). Viewport-ul e
+    extins la marginile celulelor, deci celulele de la margine sunt complete și hărți mutate cu
+    mai puțin de o celulă împart același răspuns din cache.
+    """
+    min_lat, max_lat, min_lon, max_lon = parse_bbox(bbox)
+    lo_ms, hi_ms = parse_time_ms(start, "start"), parse_time_ms(end, "end")
+    dlat, dlon = grid_cell_deg(zoom, cell_px, (min_lat + max_lat) / 2)
+    box = (
+        max(math.floor((min_lat + 90.0) / dlat) * dlat - 90.0, -90.0),
+        min((math.floor((max_lat + 90.0) / dlat) + 1) * dlat - 90.0, 90.0),
+        max(math.floor((min_lon + 180.0) / dlon) * dlon - 180.0, -180.0),
+        min((math.floor((max_lon + 180.0) / dlon) + 1) * dlon - 180.0, 180.0),
+    )
+    if (box[1] - box[0]) / dlat * (box[3] - box[2]) / dlon > GRID_MAX_CELLS:
+        return JSONResponse({"error": "bbox too large for this zoom (more than GRID_MAX_CELLS cells)"},
+                            status_code=400)
+
+    def compute() -> Dict[str, Any]:
+        with read_db() as con:
+            cells = grid_cells(con, box, dlat, dlon, lo_ms, hi_ms)
+        return {
+            "zoom": zoom,
+            "cell_deg": {"lat": dlat, "lon": dlon},
+            "bbox": [box[2], box[0], box[3], box[1]],
+            "total": sum(c["count"] for c in cells),
+            "cells": cells,
+        }
+
+    return cached_json(request, ("gps_grid", box, zoom, cell_px, lo_ms, hi_ms), compute)
+
+# -------------------------- Serii de timp --------------------------
+TIMESERIES_METRICS = {f for fields in AGG_METRICS.values() for f in fields}
+
+def timeseries_buckets(con: sqlite3.Connection, metric: str, lo_ms: int, hi_ms: int, bucket_ms: int,
+                       filters: Dict[str, str]) -> Dict[int, List[Any]]:
     """
-    rows = db.execute(
+    bucket -> [n, min, max, sum]: din partițiile raw (indexul productId, locationId, ts_ms) și
+    din telemetry_agg pentru intervalele deja trecute prin retenție (rândurile sunt mutate,
+    nu copiate, deci cele două surse nu se suprapun).
+    """
+    out: Dict[int, List[Any]] = {}
+
+    def merge(rows) -> None:
+        for b, n, vmin, vmax, vsum in rows:
+            if not n:
+                continue
+            acc = out.get(b)
+            if acc is None:
+                out[b] = [n, vmin, vmax, vsum]
+            else:
+                acc[0] += n
+                acc[1] = min(acc[1], vmin)
+                acc[2] = max(acc[2], vmax)
+                acc[3] += vsum
+
+    where = " AND ".join(f"{k} = ?" for k in filters)
+    where = (where + " AND ") if where else ""
+    # ts_ms <= ingest_ms (evenimentul precede ingestul) => doar partițiile cu hi_ms > lo_ms
+    for name in partitions_for(con, lo_ms=lo_ms, newest_first=False):
+        merge(con.execute(
+            f"""
+            SELECT (ts_ms / {bucket_ms}) * {bucket_ms}, COUNT({metric}), MIN({metric}),
+                   MAX({metric}), SUM({metric})
+            FROM {name}
+            WHERE {where}ts_ms >= ? AND ts_ms < ? AND {metric} IS NOT NULL
+            GROUP BY 1
+            """,
+            (*filters.values(), lo_ms, hi_ms),
+        ))
+    merge(con.execute(
+        f"""
+        SELECT (bucket_ms / {bucket_ms}) * {bucket_ms}, SUM(n), MIN(vmin), MAX(vmax), SUM(vsum)
+        FROM telemetry_agg
+        WHERE metric = ? AND {where}bucket_ms >= ? AND bucket_ms < ?
+        GROUP BY 1
+        """,
+        (metric, *filters.values(), lo_ms, hi_ms),
+    ))
+    return out
+
+@app.get("/timeseries")
+def timeseries(
+    request: Request,
+    metric: str = Query(..., description="temp_c, humidity_pct, level, reorder_point, safety_stock, speed_kmh"),
+    productId: Optional[str] = None,
+    locationId: Optional[str] = None,
+    start: Optional[str] = Query(None, description="epoch-ms sau ISO-8601 (timpul evenimentului); implicit acum - 24h"),
+    end: Optional[str] = Query(None, description="epoch-ms sau ISO-8601 (exclusiv); implicit acum"),
+    bucket_sec: int = Query(300, ge=1, le=31 * 86400),
+):
+    """
+    min/max/avg/count pe bucket-uri de `bucket_sec` pentru o metrică, calculate în SQL pe
+    coloanele tipizate. Intervalele mai vechi decât retenția raw vin din agregatele orare/zilnice
+    (granularitate efectivă = max(bucket_sec, rezoluția agregatului)).
+    """
+    if metric not in TIMESERIES_METRICS:
+        return JSONResponse(status_code=400, content={
+            "error": f"unknown metric: {metric}", "metrics": sorted(TIMESERIES_METRICS),
+        })
+    now_ms = int(time.time() * 1000)
+    now_ms -= now_ms % CACHE_RECENT_GRAIN_MS
+    hi_ms = parse_time_ms(end, "end")
+    hi_ms = now_ms if hi_ms is None else hi_ms
+    lo_ms = parse_time_ms(start, "start")
+    lo_ms = hi_ms - PARTITION_MS if lo_ms is None else lo_ms
+    bucket_ms = bucket_sec * 1000
+    filters = {k: v for k, v in (("productId", productId), ("locationId", locationId)) if v is not None}
+
+    def compute() -> Dict[str, Any]:
+        with read_db() as con:
+            buckets = timeseries_buckets(con, metric, lo_ms, hi_ms, bucket_ms, filters)
+        return {
+            "metric": metric, "bucket_ms": bucket_ms, "start_ms": lo_ms, "end_ms": hi_ms,
+            "items": [
+                {
+                    "bucket_ms": b,
+                    "ts": datetime.fromtimestamp(b / 1000, timezone.utc).isoformat(),
+                    "count": n, "min": vmin, "max": vmax, "avg": vsum / n,
+                }
+                for b, (n, vmin, vmax, vsum) in sorted(buckets.items())
+            ],
+        }
+
+    return cached_json(request, ("timeseries", metric, lo_ms, hi_ms, bucket_ms, tuple(filters.items())), compute)
+
+# -------------------------- Export --------------------------
+EXPORT_COLUMNS = [
+    "id", "ts", "ingest_ts", "ingest_ms", "topic", "sensor",
+    "productId", "locationId", "edge_alert", "edge_latency_ms", "data_json", "ts_ms",
+    *TYPED_FIELDS,
+]
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# intervalul reprezentabil ca datetime (anii 1..9999): încape în INTEGER-ul SQLite și în aritmetica pe limite
+MIN_TIME_MS = -62135596800000
+MAX_TIME_MS = 253402300799999
+
+def parse_time_ms(value: Optional[str], name: str) -> Optional[int]:
+    """epoch-ms sau ISO-8601 -> epoch-ms."""
+    if value is None:
+        return None
+    ms = int(value) if value.lstrip("-").isdigit() else iso_to_ms(value)
+    if ms is None or not MIN_TIME_MS <= ms <= MAX_TIME_MS:
+        raise HTTPException(status_code=400, detail=f"invalid {name}: {value}")
+    return ms
+
+def export_chunks(lo_ms: Optional[int], hi_ms: Optional[int], filters: Dict[str, str]) -> Iterator[List[tuple]]:
+    """
+    Rândurile din [lo_ms, hi_ms) (după ingest_ms), partiție cu partiție, în bucăți de
+    EXPORT_CHUNK_ROWS luate cu fetchmany => memorie constantă. Conexiune dedicată (nu ocupă
+    pool-ul pe durata unui export lung), într-o singură tranzacție de citire: exportul vede un
+    snapshot consistent, chiar dacă între timp retenția șterge o partiție.
+    """
+    where = ["ingest_ms >= ?", "ingest_ms < ?"] + [f"{k} = ?" for k in filters]
+    params = [-(2 ** 63) if lo_ms is None else lo_ms, 2 ** 63 - 1 if hi_ms is None else hi_ms]
+    params += list(filters.values())
+    con = get_db(readonly=True)
+    try:
+        con.execute("BEGIN")
+        for name in partitions_for(con, lo_ms, hi_ms, newest_first=False):
+            cur = con.execute(
+                f"SELECT {', '.join(EXPORT_COLUMNS)} FROM {name} "
+                f"WHERE {' AND '.join(where)} ORDER BY ingest_ms, rowid",
+                params,
+            )
+            while True:
+                rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+                if not rows:
+                    break
+                yield [tuple(r) for r in rows]
+    finally:
+        con.close()
+
+def encode_ndjson(chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, r)), ensure_ascii=False) + "\n" for r in rows
+        ).encode("utf-8")
+
+def encode_csv(chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        w.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def encode_arrow(chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    """Arrow IPC stream: un record batch per bucată."""
+    types = {"ingest_ms": pyarrow.int64(), "edge_latency_ms": pyarrow.int64(), "ts_ms": pyarrow.int64()}
+    types.update((f, pyarrow.float64()) for f in TYPED_FIELDS)
+    schema = pyarrow.schema([(c, types.get(c, pyarrow.string())) for c in EXPORT_COLUMNS])
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+        for rows in chunks:
+            cols = list(zip(*rows))
+            writer.write_batch(pyarrow.record_batch(
+                [pyarrow.array(col, type=f.type) for col, f in zip(cols, schema)], schema=schema
+            ))
+            yield drain()
+    yield drain()
+
+def gzip_stream(parts: Iterator[bytes]) -> Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)      # wbits=31 => container gzip
+    for part in parts:
+        out = z.compress(part)
+        if out:
+            yield out
+    yield z.flush()
+
+@app.get("/export")
+def export(
+    request: Request,
+    start: Optional[str] = Query(None, description="epoch-ms sau ISO-8601 (ingest, inclusiv)"),
+    end: Optional[str] = Query(None, description="epoch-ms sau ISO-8601 (ingest, exclusiv)"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv|arrow)$"),
+    sensor: Optional[str] = None,
+    productId: Optional[str] = None,
+    locationId: Optional[str] = None,
+    gzip: Optional[bool] = Query(None, description="implicit: după Accept-Encoding"),
+):
+    """
+    Export în flux al telemetriei pe un interval de ingest, fără limită de rânduri:
+    NDJSON, CSV sau Arrow IPC, opțional comprimat gzip din mers.
+    """
+    if format == "arrow" and pyarrow is None:
+        return JSONResponse(status_code=501, content={"error": "arrow export requires pyarrow"})
+    lo_ms, hi_ms = parse_time_ms(start, "start"), parse_time_ms(end, "end")
+    filters = {k: v for k, v in (("sensor", sensor), ("productId", productId),
+                                 ("locationId", locationId)) if v is not None}
+    encode = {"ndjson": encode_ndjson, "csv": encode_csv, "arrow": encode_arrow}[format]
+    body = encode(export_chunks(lo_ms, hi_ms, filters))
+    if gzip is None:
+        gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition": f'attachment; filename="telemetry.{format}"'}
+    if gzip:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+# -------------------------- Stream (SSE) --------------------------
+STREAM_EVENTS = {"rows", "metrics"}
+
+def sse(event: str, data: str, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+class Subscriber:
+    """O conexiune /stream: filtre + coadă mărginită de cadre SSE gata serializate."""
+    def __init__(self, events: set, filters: Dict[str, str]):
+        self.events = events
+        self.filters = filters
+        self.queue: "asyncio.Queue[Tuple[Optional[int], str]]" = asyncio.Queue(maxsize=STREAM_QUEUE_MAX)
+        self.delivered_ms = last_ingest_ms   # ultimul ingest_ms trimis clientului (resincronizare)
+        self.skip_ms = 0          # rândurile cu ingest_ms <= skip_ms au venit deja prin backfill
+
+    def matches(self, row: Dict[str, Any]) -> bool:
+        return all(row.get(k) == v for k, v in self.filters.items())
+
+    def offer(self, item: Tuple[Optional[int], str]) -> None:
         """
-        SELECT t1.*
-        FROM telemetry t1
-        JOIN (
-          SELECT productId, locationId, MAX(ingest_ts) AS max_ts
-          FROM telemetry
-          WHERE sensor='gps'
-          GROUP BY productId, locationId
-        ) t2
-        ON t1.productId=t2.productId
-       AND t1.locationId=t2.locationId
-       AND t1.ingest_ts=t2.max_ts
-        WHERE t1.sensor='gps'
-        ORDER BY t1.ingest_ts DESC
+        Consumator lent: în loc să crească memoria sau să blocheze fan-out-ul, coada se golește
+        și se înlocuiește cu un singur cadru `lag` (clientul reia cu /last?since=...).
         """
-    ).fetchall()
-    return {"items": [row_to_dict(r) for r in rows]}
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            dropped = 0
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                dropped += 1
+            ERRORS.labels("stream_lag").inc()
+            self.queue.put_nowait((None, sse("lag", json.dumps(
+                {"dropped_events": dropped + 1, "since": self.delivered_ms}
+            ))))
+            return
+
+class Broadcaster:
+    """
+    Fan-out în procesul API: writer-ul publică după commit (din thread-ul lui), serializarea
+    se face o singură dată per rând, iar distribuirea rulează în event loop. Fără abonați,
+    publicarea nu costă nimic.
+    """
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subs: set = set()
+        self.ticker: Optional[asyncio.Task] = None
+        self.metrics_frame = ""
+
+    def subscribe(self, sub: Subscriber) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.subs.add(sub)
+        if self.ticker is None or self.ticker.done():
+            self.ticker = self.loop.create_task(self._metrics_loop())
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self.subs.discard(sub)
+
+    def publish_rows(self, rows: List[tuple]) -> None:
+        """Apelat de writer după commit."""
+        if rows and self.subs and self.loop is not None:
+            self.loop.call_soon_threadsafe(self._fanout_rows, rows)
+
+    def _fanout_rows(self, rows: List[tuple]) -> None:
+        items = [row_tuple_to_dict(r) for r in rows]
+        encoded = [json.dumps(d) for d in items]
+        ms = rows[-1][10]
+        for sub in list(self.subs):
+            if "rows" not in sub.events:
+                continue
+            if sub.filters:
+                data = [e for d, e in zip(items, encoded) if sub.matches(d)]
+            else:
+                data = encoded
+            if data:
+                sub.offer((ms, sse("rows", "[" + ",".join(data) + "]", ms)))
+
+    async def _metrics_loop(self) -> None:
+        """Un singur snapshot /metrics pe interval, doar dacă s-a schimbat ceva."""
+        seen = None
+        while self.subs:
+            if stats.watermark_ms != seen:
+                seen = stats.watermark_ms
+                self.metrics_frame = sse("metrics", json.dumps(stats.to_json()))
+                for sub in list(self.subs):
+                    if "metrics" in sub.events:
+                        sub.offer((None, self.metrics_frame))
+            await asyncio.sleep(STREAM_METRICS_SEC)
+
+broadcaster = Broadcaster()
+Gauge("cloud_stream_subscribers", "Conexiuni /stream deschise").set_function(lambda: len(broadcaster.subs))
+
+def row_tuple_to_dict(r: tuple) -> Dict[str, Any]:
+    """Rândul din writer în aceeași formă ca itemii din /last."""
+    return {
+        "id": r[0], "ts": r[1], "ingest_ts": r[9], "ingest_ms": r[10], "topic": r[2],
+        "sensor": r[3], "productId": r[4], "locationId": r[5], "edge_alert": r[6],
+        "edge_latency_ms": r[7], "data_json": r[8],
+    }
+
+def backfill(since_ms: int, sub: Subscriber) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """
+    Rândurile de după `since_ms` (max STREAM_BACKFILL_MAX), ingest_ms-ul până la care s-a
+    citit și dacă lista a fost trunchiată.
+    """
+    with read_db() as con:
+        rows = read_after(con, (since_ms, 2 ** 63 - 1), STREAM_BACKFILL_MAX)
+    items = [row_to_dict(r) for r in rows]
+    for d in items:
+        d.pop("_rowid")
+    upto = items[-1]["ingest_ms"] if items else since_ms
+    truncated = len(items) >= STREAM_BACKFILL_MAX
+    return ([d for d in items if sub.matches(d)] if sub.filters else items), upto, truncated
+
+@app.get("/stream")
+async def stream(
+    request: Request,
+    events: str = Query("rows,metrics", description="rows, metrics sau ambele (separate prin virgulă)"),
+    sensor: Optional[str] = None,
+    productId: Optional[str] = None,
+    locationId: Optional[str] = None,
+):
+    """
+    Server-Sent Events: `rows` (rândurile noi, după commit) și `metrics` (snapshot /metrics,
+    cel mult o dată pe STREAM_METRICS_SEC). La reconectare, EventSource trimite Last-Event-ID
+    (= ingest_ms) și rândurile pierdute între timp sunt retrimise din DB.
+    """
+    wanted = {e.strip() for e in events.split(",") if e.strip()}
+    if not wanted or wanted - STREAM_EVENTS:
+        return JSONResponse(status_code=400, content={"error": f"unknown events: {events}"})
+    filters = {k: v for k, v in (("sensor", sensor), ("productId", productId),
+                                 ("locationId", locationId)) if v is not None}
+    sub = Subscriber(wanted, filters)
+    broadcaster.subscribe(sub)
+    last_id = request.headers.get("last-event-id", "")
+
+    async def frames():
+        try:
+            yield "retry: 2000\n\n"
+            if "metrics" in wanted:
+                yield broadcaster.metrics_frame or sse("metrics", json.dumps(stats.to_json()))
+            if "rows" in wanted and last_id.isdigit():
+                items, sub.skip_ms, truncated = await run_in_threadpool(backfill, int(last_id), sub)
+                sub.delivered_ms = sub.skip_ms
+                if items:
+                    yield sse("rows", json.dumps(items), sub.skip_ms)
+                if truncated:
+                    yield sse("lag", json.dumps({"dropped_events": None, "since": sub.skip_ms}))
+            while True:
+                try:
+                    ms, frame = await asyncio.wait_for(sub.queue.get(), STREAM_KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if ms is not None and ms <= sub.skip_ms:
+                    continue
+                yield frame
+                if ms is not None:
+                    sub.delivered_ms = ms
+        finally:
+            broadcaster.unsubscribe(sub)
+
+    return StreamingResponse(frames(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def start_background():
+    threading.Thread(target=writer_loop, daemon=True).start()
+    threading.Thread(target=maintenance_loop, daemon=True).start()
 
 # -------------- Local dev (optional) --------------
+# python app.py                  -> pornește API-ul
+# python app.py rebuild-latest   -> reconstruiește latest_position din telemetry
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=8000)
+    import sys
+    if sys.argv[1:] == ["rebuild-latest"]:
+        print(f"[CLOUD] latest_position rebuilt: {rebuild_latest_positions(writer_db)} assets updated")
+    else:
+        import uvicorn
+        # obiectul, nu "app:app": un al doilea import al modulului ar reînregistra metricile Prometheus
+        uvicorn.run(app, host="0.0.0.0", port=8000)
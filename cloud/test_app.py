@@ -0,0 +1,234 @@
+# cloud-api/test_app.py — rulează din cloud/: python -m pytest -q
+import gzip, json, os, subprocess, sys, tempfile, time
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "cloud.db"))
+
+import msgpack
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+
+import app
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app.app) as c:
+        yield c
+
+def items_without_id(n: int):
+    return [
+        {"sensor": "env", "productId": "SKU-1", "locationId": "LOC-1",
+         "ts": f"2026-01-01T00:00:0{i}Z", "data": {"temp_c": 4.0 + i}}
+        for i in range(n)
+    ]
+
+def encode(fmt: str, items) -> tuple:
+    if fmt == "json":
+        return json.dumps({"items": items}).encode(), {"Content-Type": "application/json"}
+    if fmt == "ndjson":
+        body = "\n".join(json.dumps(it) for it in items).encode()
+        return gzip.compress(body), {"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"}
+    # aceeași formă columnară ca edge/app.py:msgpack_columns
+    cols = {
+        "id": [it.get("id") for it in items],
+        "ts_ms": [1767225600000 + i * 1000 for i in range(len(items))],
+        "latency_ms": [None] * len(items),
+        "data": [json.dumps(it["data"]) for it in items],
+        "productId": [0] * len(items),
+        "locationId": [0] * len(items),
+        "sensor": [0] * len(items),
+        "topic": [None] * len(items),
+        "alert": [None] * len(items),
+    }
+    body = msgpack.packb({
+        "dict": {"productId": ["SKU-1"], "locationId": ["LOC-1"], "sensor": ["env"], "topic": [], "alert": []},
+        "cols": cols,
+        "rollups": [],
+    })
+    return zstandard.ZstdCompressor().compress(body), {"Content-Type": "application/x-msgpack",
+                                                       "Content-Encoding": "zstd"}
+
+def test_items_without_id_inserted_in_every_format(client):
+    counts = {}
+    for fmt in ("json", "ndjson", "msgpack"):
+        body, headers = encode(fmt, items_without_id(4))
+        resp = client.post("/ingest", content=body, headers=headers)
+        assert resp.status_code == 200, resp.text
+        counts[fmt] = (resp.json()["inserted"], resp.json()["duplicates"])
+    assert counts == {"json": (4, 0), "ndjson": (4, 0), "msgpack": (4, 0)}
+
+def test_retry_across_midnight_is_deduped(client):
+    body = {"items": [{"id": "retry-midnight", "sensor": "env", "productId": "SKU-1",
+                       "locationId": "LOC-1", "ts": "2026-01-01T23:59:59Z", "data": {"temp_c": 4.0}}]}
+    assert client.post("/ingest", json=body).json()["inserted"] == 1
+    # următorul ingest cade în partiția zilei următoare
+    app.last_ingest_ms = (app.last_ingest_ms // app.PARTITION_MS + 1) * app.PARTITION_MS
+    resp = client.post("/ingest", json=body).json()
+    assert (resp["inserted"], resp["duplicates"]) == (0, 1)
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b'"items"', b"42", b'{"items": {"a": 1}}'])
+def test_non_object_json_body_is_rejected(client, body):
+    resp = client.post("/ingest", content=body, headers={"Content-Type": "application/json"})
+    assert resp.status_code == 400
+
+def test_timeseries_epoch_zero_bounds(client):
+    resp = client.get("/timeseries", params={"metric": "temp_c", "start": "0", "end": "0"}).json()
+    assert (resp["start_ms"], resp["end_ms"], resp["items"]) == (0, 0, [])
+
+@pytest.mark.parametrize("path, params", [
+    ("/timeseries", {"metric": "temp_c", "start": "99999999999999999999"}),
+    ("/timeseries", {"metric": "temp_c", "end": "-99999999999999999999"}),
+    ("/gps/within", {"bbox": "20,40,30,50", "start": "99999999999999999999"}),
+])
+def test_out_of_range_epoch_is_rejected(client, path, params):
+    assert client.get(path, params=params).status_code == 400
+
+def test_timeseries_without_product_uses_ts_index(client):
+    with app.read_db() as con:
+        name = app.partitions_for(con)[0]
+        plan = " ".join(str(r[-1]) for r in con.execute(
+            f"EXPLAIN QUERY PLAN SELECT COUNT(temp_c) FROM {name} "
+            f"WHERE locationId = ? AND ts_ms >= ? AND ts_ms < ? AND temp_c IS NOT NULL", ("LOC-1", 0, 1)))
+    assert f"idx_{name}_ts_ms" in plan
+
+def test_rebuild_latest_from_another_process_invalidates_cache(client):
+    gps = {"id": "gps-rebuild", "sensor": "gps", "productId": "SKU-9", "locationId": "LOC-9",
+           "ts": "2026-01-01T00:00:00Z", "data": {"lat": 44.4, "lon": 26.1, "speed_kmh": 50}}
+    assert client.post("/ingest", json={"items": [gps]}).json()["inserted"] == 1
+    first = client.get("/latest_gps")
+    assert first.status_code == 200
+    subprocess.run([sys.executable, "app.py", "rebuild-latest"], check=True,
+                   cwd=os.path.dirname(os.path.abspath(app.__file__)), env=dict(os.environ))
+    # writer-ul observă commit-ul extern la următoarea trecere (<= 0.5 s)
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        resp = client.get("/latest_gps", headers={"If-None-Match": first.headers["etag"]})
+        if resp.status_code == 200:
+            break
+        time.sleep(0.1)
+    assert resp.status_code == 200
+
+def gps_item(item_id: str, product: str, ts: str, lat: float, lon: float) -> dict:
+    return {"id": item_id, "sensor": "gps", "productId": product, "locationId": "LOC-GPS",
+            "ts": ts, "data": {"lat": lat, "lon": lon, "speed_kmh": 40}}
+
+def test_gps_near_keeps_asset_that_was_inside_radius_earlier(client):
+    # colțul cutiei care încadrează cercul: în cutie, dar la ~1.35 km de centru
+    centre, corner = (45.0, 25.0), (45.0 + 950 / 111320, 25.0 + 950 / (111320 * 0.7071))
+    items = [gps_item("near-1", "TRUCK-NEAR", "2026-02-01T00:00:00Z", *centre),
+             gps_item("near-2", "TRUCK-NEAR", "2026-02-01T00:01:00Z", *corner)]
+    assert client.post("/ingest", json={"items": items}).json()["inserted"] == 2
+    resp = client.get("/gps/near", params={"lat": 45.0, "lon": 25.0, "radius_m": 1000,
+                                           "start": "2026-02-01T00:00:00Z", "end": "2026-02-01T00:05:00Z"})
+    hits = [d for d in resp.json()["items"] if d["productId"] == "TRUCK-NEAR"]
+    assert [(d["id"], d["distance_m"]) for d in hits] == [("near-1", 0.0)]
+
+def test_gps_near_across_antimeridian(client):
+    item = gps_item("anti-1", "TRUCK-ANTI", "2026-02-01T00:00:00Z", 0.0, 179.999)
+    assert client.post("/ingest", json={"items": [item]}).json()["inserted"] == 1
+    for params in ({}, {"start": "2026-02-01T00:00:00Z"}):
+        resp = client.get("/gps/near", params={"lat": 0.0, "lon": -179.999, "radius_m": 1000, **params})
+        assert [d["productId"] for d in resp.json()["items"]] == ["TRUCK-ANTI"]
+
+def test_gps_within_rejects_antimeridian_bbox(client):
+    assert client.get("/gps/within", params={"bbox": "179,-1,-179,1"}).status_code == 400
+
+def test_rebuild_latest_keeps_assets_with_expired_raw_data(client):
+    # poziția unui asset ale cărui partiții raw au trecut prin retenție: nu mai apare în telemetry
+    def insert_expired(con):
+        with con:
+            con.execute(
+                "INSERT INTO latest_position (productId, locationId, ts_ms, id, ts, sensor, lat, lon) "
+                "VALUES ('SKU-OLD', 'LOC-OLD', 1000, 'old-1', '1970-01-01T00:00:01Z', 'gps', 44.0, 26.0)"
+            )
+
+    app.run_in_writer(insert_expired)
+    subprocess.run([sys.executable, "app.py", "rebuild-latest"], check=True,
+                   cwd=os.path.dirname(os.path.abspath(app.__file__)), env=dict(os.environ))
+    with app.read_db() as con:
+        row = con.execute("SELECT id FROM latest_position WHERE productId = 'SKU-OLD'").fetchone()
+    assert row is not None and row[0] == "old-1"
+
+@pytest.mark.parametrize("index", [5, -1])
+def test_msgpack_dictionary_index_out_of_range_is_rejected(client, index):
+    body, headers = encode("msgpack", items_without_id(2))
+    batch = msgpack.unpackb(zstandard.ZstdDecompressor().decompress(body), raw=False)
+    batch["cols"]["productId"][1] = index
+    body = zstandard.ZstdCompressor().compress(msgpack.packb(batch))
+    resp = client.post("/ingest", content=body, headers=headers)
+    assert resp.status_code == 400, resp.text
+
+def test_malformed_items_are_rejected_not_500(client):
+    good = {"id": "shape-ok", "sensor": "env", "ts": "2026-01-01T00:00:00Z", "data": {"temp_c": 5}}
+    items = [
+        good,
+        {**good, "id": "shape-edge-str", "_edge": "mqtt"},
+        {**good, "id": "shape-edge-list", "_edge": ["t"]},
+        {**good, "id": "shape-ts-dict", "ts": {"at": 1}},
+        {**good, "id": "shape-big-int", "_edge": {"latency_ms_sensor_to_edge": 2 ** 70}},
+        {"kind": "rollup", "id": "shape-rollup", "window_start_ms": 0, "window_end_ms": 1, "fields": ["x"]},
+    ]
+    for fmt in ("json", "ndjson"):
+        body, headers = encode(fmt, [{**it, "id": f"{fmt}-{it['id']}"} for it in items])
+        resp = client.post("/ingest", content=body, headers=headers)
+        assert resp.status_code == 200, resp.text
+        assert (resp.json()["inserted"], resp.json()["rejected"]) == (1, 5)
+
+def test_post_commit_error_reports_real_counts(client, monkeypatch):
+    def boom(rows):
+        raise RuntimeError("subscriber exploded")
+    monkeypatch.setattr(app.broadcaster, "publish_rows", boom)
+    items = [{"id": f"post-commit-{i}", "sensor": "env", "ts": "2026-01-01T00:00:00Z", "data": {"temp_c": i}}
+             for i in range(3)]
+    resp = client.post("/ingest", json={"items": items})
+    assert resp.status_code == 200
+    assert (resp.json()["inserted"], resp.json()["duplicates"]) == (3, 0)
+
+def test_edge_mark_out_of_order_and_low_seq_skip():
+    mark = app.EdgeMark(0)
+    mark.apply(1, 1, 0)
+    mark.apply(3, 1, 0)                                   # POST-uri concurente: 3 înaintea lui 2
+    assert (mark.contiguous, mark.high, mark.gaps()) == (1, 3, [2])
+    assert mark.seen(3) and not mark.seen(2)
+    mark.apply(2, 1, 0)
+    assert (mark.contiguous, mark.applied, mark.gaps()) == (3, set(), [])
+    mark.apply(6, 6, 0)                                   # 4-5 aruncate pe edge (spool plin)
+    assert (mark.contiguous, mark.lost, mark.lost_ranges) == (6, 2, [[4, 5]])
+    mark.apply(9, 8, 0)                                   # 7 pierdut, 8 încă în zbor
+    assert (mark.contiguous, mark.lost, mark.lost_ranges, mark.gaps()) == (7, 3, [[4, 5], [7, 7]], [8])
+
+def post_seq(client, edge_id: str, epoch: str, seq: int, low: int, item_id: str):
+    item = {"id": item_id, "sensor": "env", "ts": "2026-03-01T00:00:00Z", "data": {"temp_c": seq}}
+    return client.post("/ingest", json={"items": [item]}, headers={
+        "X-Edge-Id": edge_id, "X-Edge-Epoch": epoch, "X-Batch-Seq": str(seq), "X-Edge-Low-Seq": str(low)})
+
+def edge_status(client, edge_id: str) -> dict:
+    return {e["epoch"]: e for e in client.get("/edges").json()["items"] if e["edge_id"] == edge_id}
+
+def test_sequenced_batches_duplicates_and_epoch_bump(client):
+    assert post_seq(client, "edge-seq", "e1", 1, 1, "seq-1").json()["inserted"] == 1
+    assert post_seq(client, "edge-seq", "e1", 3, 1, "seq-3").json()["inserted"] == 1
+    replay = post_seq(client, "edge-seq", "e1", 1, 1, "seq-1").json()
+    assert (replay["duplicate_batch"], replay["inserted"], replay["seq"]) == (True, 0, 1)
+    status = edge_status(client, "edge-seq")["e1"]
+    assert (status["contiguous"], status["high"], status["gaps"], status["duplicates"]) == (1, 3, [2], 1)
+
+    # 2 n-a mai ajuns (carantină pe edge): low-ul trece de el
+    assert post_seq(client, "edge-seq", "e1", 4, 4, "seq-4").json()["duplicate_batch"] is False
+    status = edge_status(client, "edge-seq")["e1"]
+    assert (status["contiguous"], status["gaps"], status["lost"], status["lost_ranges"]) == (4, [], 1, [[2, 2]])
+
+    # spool șters pe edge: epocă nouă, seq reîncepe de la 1 și nu e luat drept retry
+    resp = post_seq(client, "edge-seq", "e2", 1, 1, "seq-e2-1").json()
+    assert (resp["duplicate_batch"], resp["inserted"]) == (False, 1)
+    assert edge_status(client, "edge-seq")["e2"]["contiguous"] == 1
+
+    with app.read_db() as con:                            # restart: marcajele se reîncarcă din DB
+        reloaded = app.load_edge_marks(con)
+    assert reloaded[("edge-seq", "e1")].row(("edge-seq", "e1")) == \
+        app.edge_marks[("edge-seq", "e1")].row(("edge-seq", "e1"))
+    assert reloaded[("edge-seq", "e2")].seen(1)
+
+def test_batch_seq_without_edge_id_is_rejected(client):
+    resp = client.post("/ingest", json={"items": []}, headers={"X-Batch-Seq": "1"})
+    assert resp.status_code == 400
@@ -1,24 +1,169 @@
-# app.py — DEMO ONLY (no backend calls)
-import math, random, time
+# app.py — dashboard live pe API-ul cloud (DASH_MODE=live) sau DEMO fără backend (DASH_MODE=demo)
+import math, os, random, time
 from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
 
 import pandas as pd
 import pydeck as pdk
+import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+
+CLOUD_URL = os.getenv("CLOUD_URL", "http://localhost:8001").rstrip("/")
+DASH_MODE = os.getenv("DASH_MODE", "live")                      # live | demo
+DASH_REFRESH_MS = int(os.getenv("DASH_REFRESH_MS", "5000"))
+DASH_RECENT_SEC = int(os.getenv("DASH_RECENT_SEC", "120"))
+DASH_MAX_ROWS = int(os.getenv("DASH_MAX_ROWS", "2000"))         # evenimente păstrate per sesiune
+DASH_METRICS_TTL_SEC = float(os.getenv("DASH_METRICS_TTL_SEC", "5"))
+DASH_POSITIONS_TTL_SEC = float(os.getenv("DASH_POSITIONS_TTL_SEC", "5"))
+DASH_HTTP_TIMEOUT_SEC = float(os.getenv("DASH_HTTP_TIMEOUT_SEC", "5"))
+
+DASH_MAP_WIDTH_PX = int(os.getenv("DASH_MAP_WIDTH_PX", "1200"))    # viewport-ul presupus al hărții
+DASH_MAP_HEIGHT_PX = int(os.getenv("DASH_MAP_HEIGHT_PX", "500"))
+DASH_MAP_CELL_PX = int(os.getenv("DASH_MAP_CELL_PX", "48"))         # mărimea unui cluster pe hartă
+
+PAGE_ROWS = 2000        # limita lui n la /recent și /last
+MAX_PAGES = 5           # pagini delta per rerun; mai multe => sărim direct la cele mai noi
+DEFAULT_CENTER = (45.9, 24.9)   # România, cât timp nu există poziții
 
 # ---------------- UI / Page ----------------
-st.set_page_config(page_title="Supply Chain Edge+Cloud — DEMO", layout="wide")
+st.set_page_config(page_title="Supply Chain Edge+Cloud", layout="wide")
 st.title("📦 IoT Edge + Cloud — Supply Chain Dashboard")
 
 with st.sidebar:
     st.caption("Settings")
-    refresh_ms = st.number_input("Refresh (ms)", 1000, 30000, 5000, 500)
-    recent_sec = st.number_input("Recency sec", 30, 900, 120, 30)
+    refresh_ms = st.number_input("Refresh (ms)", 1000, 30000, min(max(DASH_REFRESH_MS, 1000), 30000), 500)
+    recent_sec = st.number_input("Recency sec", 30, 900, min(max(DASH_RECENT_SEC, 30), 900), 30)
+    map_zoom = st.slider("Map zoom", 3, 15, 6)
+    track_min = st.selectbox("GPS history (min)", [0, 15, 60, 240], format_func=lambda m: "current" if m == 0 else f"{m} min")
     st.markdown(
         "<small>This settings can be made by the user. ",
         unsafe_allow_html=True,
     )
 
+# ---------------- Cloud API (pool comun + cache-uri partajate) ----------------
+@st.cache_resource
+def http_session() -> requests.Session:
+    """Un singur pool keep-alive pentru toate sesiunile (operatorii) din acest proces."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def etag_store() -> Dict[str, Tuple[str, Any]]:
+    """Ultimul (ETag, corp) pentru endpoint-urile fără parametri variabili."""
+    return {}
+
+def get_json(path: str, conditional: bool = False, **params) -> Any:
+    """
+    GET pe cloud. Cu `conditional`, trimite ETag-ul ultimului răspuns: dacă nu s-a ingerat
+    nimic între timp, cloud-ul răspunde 304 fără să atingă baza și fără să serializeze JSON.
+    """
+    url = f"{CLOUD_URL}{path}"
+    prev = etag_store().get(path) if conditional else None
+    headers = {"If-None-Match": prev[0]} if prev else {}
+    resp = http_session().get(url, params=params, headers=headers, timeout=DASH_HTTP_TIMEOUT_SEC)
+    if resp.status_code == 304 and prev:
+        return prev[1]
+    resp.raise_for_status()
+    data = resp.json()
+    if conditional and resp.headers.get("ETag"):
+        etag_store()[path] = (resp.headers["ETag"], data)
+    return data
+
+# cache-urile st.cache_data sunt comune tuturor sesiunilor: N operatori => un request per TTL
+@st.cache_data(ttl=DASH_METRICS_TTL_SEC, show_spinner=False)
+def fetch_metrics() -> Dict[str, Any]:
+    return get_json("/metrics", conditional=True)
+
+@st.cache_data(ttl=DASH_POSITIONS_TTL_SEC, max_entries=256, show_spinner=False)
+def fetch_grid(bbox: str, zoom: int, start_ms: Optional[int]) -> pd.DataFrame:
+    """Clusterele din viewport calculate de cloud (/gps/grid): câte un rând per celulă, nu per asset."""
+    params = {"bbox": bbox, "zoom": zoom, "cell_px": DASH_MAP_CELL_PX}
+    if start_ms is not None:
+        params["start"] = start_ms
+    cells = get_json("/gps/grid", **params).get("cells") or []
+    return pd.DataFrame(cells, columns=["count", "assets", "lat", "lon", "productId", "locationId", "ts_ms"])
+
+def map_view(zoom: int, start_ms: Optional[int]) -> Tuple[float, float]:
+    """Centrul hărții: centroidul flotei (o grilă globală grosieră, cache-uită), altfel DEFAULT_CENTER."""
+    world = fetch_grid("-180,-85,180,85", 2, start_ms)
+    if world.empty:
+        return DEFAULT_CENTER
+    w = world["count"]
+    return float((world["lat"] * w).sum() / w.sum()), float((world["lon"] * w).sum() / w.sum())
+
+def viewport_bbox(lat: float, lon: float, zoom: int) -> str:
+    """bbox-ul (min_lon,min_lat,max_lon,max_lat) acoperit de o hartă DASH_MAP_WIDTH_PX x HEIGHT_PX."""
+    half_lon = DASH_MAP_WIDTH_PX / (256 * 2 ** zoom) * 360 / 2
+    half_lat = DASH_MAP_HEIGHT_PX / (256 * 2 ** zoom) * 360 / 2 * math.cos(math.radians(lat))
+    return (f"{max(lon - half_lon, -180):.5f},{max(lat - half_lat, -85):.5f},"
+            f"{min(lon + half_lon, 180):.5f},{min(lat + half_lat, 85):.5f}")
+
+def fetch_map(zoom: int, track_min: int) -> Tuple[pd.DataFrame, Tuple[float, float]]:
+    start_ms = None
+    if track_min:
+        # aliniat la TTL, ca toate sesiunile să ceară (și să cache-uiască) aceeași fereastră
+        now_ms = int(time.time() * 1000)
+        start_ms = now_ms - now_ms % int(DASH_POSITIONS_TTL_SEC * 1000) - track_min * 60_000
+    center = map_view(zoom, start_ms)
+    return fetch_grid(viewport_bbox(*center, zoom), zoom, start_ms), center
+
+@st.cache_data(ttl=DASH_REFRESH_MS / 1000, max_entries=64, show_spinner=False)
+def fetch_recent(seconds: int) -> Dict[str, Any]:
+    """Bootstrap: cele mai noi rânduri din fereastră (cele mai noi primele) + cursor."""
+    return get_json("/recent", seconds=seconds, n=PAGE_ROWS)
+
+@st.cache_data(ttl=DASH_REFRESH_MS / 1000, max_entries=256, show_spinner=False)
+def fetch_after(cursor: str) -> Dict[str, Any]:
+    """Delta: rândurile de după cursor (crescător). Sesiunile la zi au același cursor => un singur request."""
+    return get_json("/last", cursor=cursor, n=PAGE_ROWS)
+
+EVENT_COLUMNS = ["id", "ingest_ms", "ingest_ts", "sensor", "productId", "locationId",
+                 "edge_alert", "edge_latency_ms"]
+
+def events_frame(items) -> pd.DataFrame:
+    return pd.DataFrame(items, columns=EVENT_COLUMNS)
+
+def refresh_events(recent_sec: int) -> pd.DataFrame:
+    """
+    Evenimentele sesiunii (cele mai noi primele): bootstrap din /recent, apoi doar rândurile
+    de după cursor, adăugate în față; tăiate la fereastra de recență și la DASH_MAX_ROWS.
+    """
+    ss = st.session_state
+    if ss.get("cursor") is None or ss.get("recent_sec") != recent_sec:
+        page = fetch_recent(recent_sec)
+        ss.events, ss.cursor, ss.recent_sec = events_frame(page["items"]), page["cursor"], recent_sec
+    else:
+        pages = []
+        for _ in range(MAX_PAGES):
+            page = fetch_after(ss.cursor)
+            if page["items"]:
+                pages.append(events_frame(page["items"][::-1]))
+            ss.cursor = page["cursor"] or ss.cursor
+            if len(page["items"]) < PAGE_ROWS:
+                break
+        else:
+            # prea mult în urmă (ex. tab în fundal): nu recuperăm istoric, sărim la cele mai noi
+            ss.cursor = None
+            return refresh_events(recent_sec)
+        if pages:
+            ss.events = pd.concat(pages[::-1] + [ss.events], ignore_index=True)
+    cutoff_ms = int(time.time() * 1000) - recent_sec * 1000
+    ss.events = ss.events[ss.events["ingest_ms"] >= cutoff_ms].head(DASH_MAX_ROWS).reset_index(drop=True)
+    return ss.events
+
+def live_data(recent_sec: int, zoom: int, track_min: int) -> Optional[tuple]:
+    """(metrici, (clustere, centru), evenimente); la o eroare a cloud-ului păstrează ultimele date bune."""
+    ss = st.session_state
+    try:
+        ss.live = (fetch_metrics(), fetch_map(zoom, track_min), refresh_events(recent_sec))
+    except requests.RequestException as e:
+        st.warning(f"Cloud indisponibil ({CLOUD_URL}): {e}")
+    return ss.get("live")
+
 # ---------------- Helpers (demo generators) ----------------
 def _rng_tick(refresh_ms: int) -> int:
     """Schimbă seed-ul la fiecare fereastră de refresh, pentru animație stabilă."""
@@ -79,55 +224,80 @@ def demo_events(tick: int, n=20) -> pd.DataFrame:
     # ordonează descrescător după timp
     return df.sort_values("when", ascending=False).reset_index(drop=True)
 
-# ---------------- KPI ----------------
-tick = _rng_tick(refresh_ms)
-m = demo_metrics(tick)
-colA, colB, colC, colD = st.columns(4)
-colA.metric("Total mesaje", m["total_rows"])
-colB.metric("Alerte (edge)", m["alerts"])
-colC.metric("Latență medie edge→cloud (ms)", m["avg_edge_latency_ms"])
-colD.markdown("&nbsp;", unsafe_allow_html=True)
-
-st.markdown("---")
-left, right = st.columns([2, 1])
-
-# ---------------- Harta GPS ----------------
-with left:
-    st.subheader("📍 Poziții curente (GPS)")
-    gps_df = demo_latest_gps(tick)
-    if not gps_df.empty:
-        view_state = pdk.ViewState(
-            latitude=float(gps_df["lat"].mean()),
-            longitude=float(gps_df["lon"].mean()),
-            zoom=8,
-        )
-        layer = pdk.Layer(
-            "ScatterplotLayer",
-            data=gps_df,
-            get_position='[lon, lat]',
-            get_fill_color='[200, 30, 0, 180]',
-            get_radius=160,
-            pickable=True,
-        )
-        tooltip = {
-            "html": "<b>Prod:</b> {productId}<br/><b>Loc:</b> {locationId}<br/><b>ts:</b> {ingest_ts}",
-            "style": {"backgroundColor": "rgba(30,30,30,0.9)", "color": "white"},
-        }
-        st.pydeck_chart(pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip=tooltip))
-    else:
-        st.info("Nu există încă poziții GPS recente.")
-
-# ---------------- Alerte & Evenimente ----------------
-with right:
-    st.subheader("🚨 Alerte și ultimele evenimente")
-    df = demo_events(tick, n=28)
-    show = df[["when", "sensor", "productId", "locationId"]]
-    st.dataframe(show, use_container_width=True, height=520)
-
-# ---------------- Auto-refresh ----------------
-st.caption(f"Auto-refresh la fiecare {refresh_ms/1000:.1f}s • Recency: {recent_sec}s • DEMO mode")
-# (Streamlit 1.39+) – reîmprospătare simplă fără APIs „experimental”
-st.components.v1.html(
-    f"<script>setTimeout(() => window.location.reload(), {int(refresh_ms)});</script>",
-    height=0,
-)
+# ---------------- Randare ----------------
+def render(m: dict, cells: pd.DataFrame, center: Tuple[float, float], zoom: int, events: pd.DataFrame) -> None:
+    colA, colB, colC, colD = st.columns(4)
+    colA.metric("Total mesaje", m.get("total_rows") or 0)
+    colB.metric("Alerte (edge)", m.get("alerts") or 0)
+    colC.metric("Latență medie edge→cloud (ms)", m.get("avg_edge_latency_ms") or 0)
+    colD.metric("Evenimente în fereastră", len(events))
+
+    st.markdown("---")
+    left, right = st.columns([2, 1])
+
+    # ---------------- Harta GPS ----------------
+    with left:
+        st.subheader("📍 Poziții curente (GPS)")
+        cells = cells.dropna(subset=["lat", "lon"])
+        if not cells.empty:
+            view_state = pdk.ViewState(latitude=center[0], longitude=center[1], zoom=zoom)
+            # rază în pixeli ~ sqrt(număr), plafonată la jumătatea unei celule
+            cells = cells.assign(
+                radius=(4 + 3 * cells["count"] ** 0.5).clip(upper=DASH_MAP_CELL_PX / 2),
+                label=cells["count"].astype(str),
+                tip=cells["productId"].fillna("").str.cat(cells["locationId"].fillna(""), sep=" @ ")
+                    .where(cells["assets"] == 1, cells["assets"].astype(str) + " assets"),
+            )
+            layers = [
+                pdk.Layer(
+                    "ScatterplotLayer",
+                    data=cells,
+                    get_position='[lon, lat]',
+                    get_fill_color='[200, 30, 0, 180]',
+                    get_radius="radius",
+                    radius_units="pixels",
+                    pickable=True,
+                ),
+                pdk.Layer(
+                    "TextLayer",
+                    data=cells[cells["count"] > 1],
+                    get_position='[lon, lat]',
+                    get_text="label",
+                    get_size=12,
+                    get_color='[255, 255, 255]',
+                ),
+            ]
+            tooltip = {
+                "html": "<b>{tip}</b><br/><b>Puncte:</b> {count}",
+                "style": {"backgroundColor": "rgba(30,30,30,0.9)", "color": "white"},
+            }
+            st.pydeck_chart(pdk.Deck(layers=layers, initial_view_state=view_state, tooltip=tooltip))
+        else:
+            st.info("Nu există încă poziții GPS recente.")
+
+    # ---------------- Alerte & Evenimente ----------------
+    with right:
+        st.subheader("🚨 Alerte și ultimele evenimente")
+        show = events[["when", "sensor", "productId", "locationId", "edge_alert"]]
+        st.dataframe(show, use_container_width=True, height=520)
+
+# ---------------- Auto-refresh (fragment: doar secțiunea live se re-rulează) ----------------
+@st.fragment(run_every=timedelta(milliseconds=int(refresh_ms)))
+def live_view():
+    if DASH_MODE == "demo":
+        tick = _rng_tick(refresh_ms)
+        gps_df = demo_latest_gps(tick).assign(count=1, assets=1)
+        render(demo_metrics(tick), gps_df, CLJ, 8, demo_events(tick, n=28))
+        st.caption(f"Auto-refresh la fiecare {refresh_ms/1000:.1f}s • Recency: {recent_sec}s • DEMO mode")
+        return
+    data = live_data(int(recent_sec), int(map_zoom), int(track_min))
+    if data is None:
+        st.info(f"Se așteaptă date de la {CLOUD_URL} …")
+        return
+    m, (cells, center), events = data
+    events = events.assign(when=pd.to_datetime(events["ingest_ms"], unit="ms", utc=True).dt.floor("s"))
+    render(m, cells, center, int(map_zoom), events)
+    st.caption(f"Auto-refresh la fiecare {refresh_ms/1000:.1f}s • Recency: {recent_sec}s • "
+               f"{CLOUD_URL} • cursor {st.session_state.get('cursor')}")
+
+live_view()
@@ -1,87 +1,1022 @@
 # edge-node/app.py
-import json, os, threading, time
+import asyncio, gzip, json, math, mmap, operator, os, random, socket, threading, time, uuid
+from collections import deque
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 import requests
 import paho.mqtt.client as mqtt
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from requests.adapters import HTTPAdapter
+
+# formate de transfer opționale (negociate cu cloud-ul prin /ingest/formats)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+# decoder/encoder JSON rapid (opțional) pentru parsarea mesajelor MQTT
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 MQTT_HOST = os.getenv("MQTT_HOST", "mosquitto")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 CLOUD_INGEST_URL = os.getenv("CLOUD_INGEST_URL", "http://cloud-api:8000/ingest")
+EDGE_ID = os.getenv("EDGE_ID", socket.gethostname())
 
 AGG_WINDOW_SEC = int(os.getenv("AGG_WINDOW_SEC", "5"))
-ALERT_TEMP_MAX = float(os.getenv("ALERT_TEMP_MAX", "8.0"))
+ALERT_TEMP_MAX = float(os.getenv("ALERT_TEMP_MAX", "8.0"))   # regula implicită, dacă lipsește RULES_PATH
+RULES_PATH = os.getenv("RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+RULES_TICK_SEC = float(os.getenv("RULES_TICK_SEC", "5"))     # verificarea senzorilor tăcuți
+
+# agregare pe edge, per tip de senzor: raw | rollup | both (env/stock), raw | deadband (gps)
+AGG_MODES = dict(
+    kv.split(":", 1) for kv in os.getenv("AGG_MODES", "env:raw,stock:raw,gps:raw").split(",") if ":" in kv
+)
+GPS_DEADBAND_M = float(os.getenv("GPS_DEADBAND_M", "50"))
+GPS_DEADBAND_SPEED_KMH = float(os.getenv("GPS_DEADBAND_SPEED_KMH", "10"))
+GPS_DEADBAND_MAX_SEC = float(os.getenv("GPS_DEADBAND_MAX_SEC", "60"))   # heartbeat chiar dacă stă pe loc
+
+# spool pe disc: segmente append-only, trimise în ordine cu retry
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/data/spool")
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(512 * 1024 * 1024)))
+SPOOL_FULL_POLICY = os.getenv("SPOOL_FULL_POLICY", "drop_oldest")   # drop_oldest | reject
+RETRY_BASE_SEC = float(os.getenv("RETRY_BASE_SEC", "1"))
+RETRY_MAX_SEC = float(os.getenv("RETRY_MAX_SEC", "60"))
+
+# batching adaptiv: un segment se sigilează la primul prag atins (items / bytes / vârstă)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+BATCH_MIN_ITEMS = int(os.getenv("BATCH_MIN_ITEMS", "50"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+BATCH_MAX_AGE_SEC = float(os.getenv("BATCH_MAX_AGE_SEC", "1.0"))
+POST_CONCURRENCY = int(os.getenv("POST_CONCURRENCY", "4"))       # POST-uri simultane
+TARGET_RTT_MS = float(os.getenv("TARGET_RTT_MS", "500"))         # RTT țintă pentru cloud
+
+# format pe fir: auto = cel mai compact suportat de ambele părți
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "auto")             # auto | msgpack | ndjson | json
+WIRE_COMPRESSION = os.getenv("WIRE_COMPRESSION", "auto")   # auto | zstd | gzip | identity
 
-app = FastAPI(title="Edge Node")
+STREAM_INTERVAL_SEC = float(os.getenv("STREAM_INTERVAL_SEC", "1"))    # /stream: snapshot /health
+
+# callback-ul MQTT doar pune bytes în inbox; parsarea/îmbogățirea rulează în PARSE_WORKERS
+INBOX_MAX = int(os.getenv("INBOX_MAX", "100000"))      # mesaje; plin => se pierd cele mai vechi
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+PARSE_CHUNK = int(os.getenv("PARSE_CHUNK", "256"))     # mesaje preluate odată de un worker
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # thread-urile pornesc doar când modulul e servit (nu la import: teste, bench)
+    start_background()
+    yield
+
+app = FastAPI(title="Edge Node", lifespan=lifespan)
 
-buffer_lock = threading.Lock()
-buffer: List[Dict[str, Any]] = []
 metrics = {
     "batches_sent": 0,
     "messages_in": 0,
     "alerts": 0,
-    "last_post_status": None
+    "last_post_status": None,
+    "post_retries": 0,
+    "spool_dropped_segments": 0,
+    "spool_rejected": 0,
+    "spool_quarantined": 0,
+    "spool_io_errors": 0,
+    "flusher_errors": 0,
+    "batch_max_items": BATCH_MAX_ITEMS,
+    "last_post_rtt_ms": None,
+    "wire": None,
+    "rollups_emitted": 0,
+    "raw_suppressed": 0,
+    "gps_suppressed": 0,
+    "inbox_dropped": 0,
+    "parse_errors": 0,
+    "alert_events": 0,
+    "post_errors": 0,
 }
+# contoarele sunt incrementate din mai multe thread-uri (parse workers, posters, spool)
+metrics_lock = threading.Lock()
+
+def incr(key: str, n: int = 1) -> None:
+    with metrics_lock:
+        metrics[key] += n
+
+# -------------------------- Instrumentare (Prometheus, /metrics/prom) --------------------------
+# aceleași bucket-uri ca în cloud: latențe în secunde, batch-uri în items / bytes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ITEMS_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(9))     # 1 KiB .. 64 MiB
+
+PARSE_SECONDS = Histogram("edge_parse_seconds", "Parsare + îmbogățire per mesaj MQTT",
+                          buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01))
+INBOX_WAIT_SECONDS = Histogram("edge_inbox_wait_seconds", "Recepție MQTT -> preluare de un parse worker",
+                               buckets=LATENCY_BUCKETS)
+SENSOR_TO_EDGE_SECONDS = Histogram("edge_sensor_to_edge_seconds", "ts senzor -> recepție pe edge (broker)",
+                                   buckets=LATENCY_BUCKETS)
+RULES_SECONDS = Histogram("edge_rules_seconds", "Evaluarea regulilor per bucată", buckets=LATENCY_BUCKETS)
+BATCH_ITEMS = Histogram("edge_batch_items", "Items per POST", buckets=ITEMS_BUCKETS)
+BATCH_BYTES = Histogram("edge_batch_bytes", "Bytes per POST (după encodare)", buckets=BYTES_BUCKETS)
+ENCODE_SECONDS = Histogram("edge_encode_seconds", "Encodare batch (format + compresie)", buckets=LATENCY_BUCKETS)
+POST_SECONDS = Histogram("edge_post_seconds", "Round-trip POST /ingest", ["status"], buckets=LATENCY_BUCKETS)
+
+class CountersCollector:
+    """
+    Contoarele din `metrics` (incrementate deja pe căile fierbinți) și adâncimile de buffer,
+    citite doar la scrape => zero cost suplimentar per mesaj.
+    """
+    ERROR_KEYS = ("parse_errors", "inbox_dropped", "spool_rejected", "spool_dropped_segments",
+                  "spool_quarantined", "spool_io_errors", "flusher_errors", "post_retries", "post_errors")
+    COUNTER_KEYS = ("messages_in", "alerts", "alert_events", "batches_sent", "rollups_emitted",
+                    "raw_suppressed", "gps_suppressed")
+
+    def describe(self):
+        # numele sunt fixe; evită apelul collect() la register (inbox/spool nu există încă)
+        names = ["edge_errors", "edge_inbox_depth", "edge_batch_max_items"]
+        names += [f"edge_{key}" for key in self.COUNTER_KEYS]
+        names += [f"edge_spool_{key}" for key in ("segments", "inflight", "bytes")]
+        return [GaugeMetricFamily(name, name) for name in names]
+
+    def collect(self):
+        snap = dict(metrics)
+        errors = CounterMetricFamily("edge_errors", "Erori după cauză", labels=["cause"])
+        for key in self.ERROR_KEYS:
+            errors.add_metric([key], snap[key])
+        yield errors
+        for key in self.COUNTER_KEYS:
+            yield CounterMetricFamily(f"edge_{key}", key, value=snap[key])
+        yield GaugeMetricFamily("edge_inbox_depth", "Mesaje în inbox", value=len(inbox))
+        yield GaugeMetricFamily("edge_batch_max_items", "Pragul AIMD de items", value=snap["batch_max_items"])
+        st = spool.stats()
+        for key in ("segments", "inflight", "bytes"):
+            yield GaugeMetricFamily(f"edge_spool_{key}", f"spool {key}", value=st[key])
+
+REGISTRY.register(CountersCollector())
 
 def now_iso():
     return datetime.now(timezone.utc).isoformat()
 
+def ms_to_iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat()
+
+if orjson is not None:
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+else:
+    json_loads = json.loads
+
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+# -------------------------- Spool pe disc --------------------------
+class Spool:
+    """
+    Buffer durabil pe disc. Mesajele se adaugă (NDJSON) în segmentul activ `<seq>.open`;
+    segmentul se sigilează (fsync + rename în `<seq>.seg`) când atinge pragul de items,
+    de bytes sau de vârstă. Poster-ele revendică segmentele sigilate în ordine, le citesc
+    prin mmap și le șterg după confirmarea cloud-ului. După restart, segmentul `.open`
+    rămas e recuperat până la ultima linie completă.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, full_policy: str):
+        self.dir = directory
+        self.max_bytes = max_bytes
+        self.full_policy = full_policy
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.active = None
+        self.active_seq = 0
+        self.active_items = 0
+        self.active_bytes = 0
+        self.active_opened = 0.0
+        self.max_items = BATCH_MAX_ITEMS
+        os.makedirs(self.dir, exist_ok=True)
+        self.next_seq = self._recover()
+        self.epoch = self._epoch()
+        self.sealed = deque(sorted(
+            int(n.partition(".")[0]) for n in os.listdir(self.dir) if n.endswith(".seg")
+        ))
+        self.inflight = set()
+        self.stranded = set()          # segmente `.open` nesigilabile (I/O), trimise după restart
+        self.bytes = sum(os.path.getsize(self._path(seq, "seg")) for seq in self.sealed)
+
+    def _path(self, seq: int, ext: str) -> str:
+        return os.path.join(self.dir, f"{seq:012d}.{ext}")
+
+    def _recover(self) -> int:
+        last = 0
+        for name in sorted(os.listdir(self.dir)):
+            stem, _, ext = name.partition(".")
+            if not stem.isdigit():
+                continue
+            last = max(last, int(stem))
+            if ext != "open":
+                continue
+            path = os.path.join(self.dir, name)
+            if self._cut_partial(path):                  # ultima linie poate fi incompletă
+                os.replace(path, self._path(int(stem), "seg"))
+            else:
+                os.remove(path)
+        try:
+            with open(os.path.join(self.dir, "next_seq")) as f:
+                last = max(last, int(f.read().strip() or 0) - 1)
+        except (OSError, ValueError):
+            pass
+        return last + 1
+
+    def _epoch(self) -> str:
+        """
+        Identitatea spool-ului; seq-urile sunt unice doar în cadrul ei (un spool șters o ia de
+        la 1, iar cloud-ul nu trebuie să le ia drept retry-uri).
+        """
+        path = os.path.join(self.dir, "epoch")
+        try:
+            with open(path) as f:
+                epoch = f.read().strip()
+            if epoch:
+                return epoch
+        except OSError:
+            pass
+        epoch = uuid.uuid4().hex[:12]
+        self._write_durable("epoch", epoch)
+        return epoch
+
+    def _write_durable(self, name: str, text: str) -> None:
+        """tmp + fsync + rename (+ fsync pe director): după o cădere de curent, fișierul e vechi sau nou."""
+        path = os.path.join(self.dir, name)
+        with open(path + ".tmp", "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._fsync_dir()
+
+    def _fsync_dir(self) -> None:
+        dir_fd = os.open(self.dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def low_seq(self) -> int:
+        """Cel mai mic seq care mai poate fi trimis; cele de dedesubt sunt confirmate sau pierdute."""
+        with self.lock:
+            pending = list(self.sealed) + list(self.inflight) + list(self.stranded)
+            if self.active is not None:
+                pending.append(self.active_seq)
+            return min(pending, default=self.next_seq)
+
+    @staticmethod
+    def _cut_partial(path: str, limit: Optional[int] = None) -> int:
+        """Taie segmentul după ultima linie completă (din primii `limit` bytes); întoarce mărimea."""
+        with open(path, "rb+") as f:
+            data = f.read() if limit is None else f.read(limit)
+            size = data.rfind(b"\n") + 1
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+        return size
+
+    @staticmethod
+    def _io_error(where: str, e: OSError) -> None:
+        print(f"[EDGE] spool {where} error:", e)
+        incr("spool_io_errors")
+
+    def _make_room(self, size: int) -> bool:
+        while self.bytes + size > self.max_bytes:
+            if self.full_policy != "drop_oldest" or not self.sealed:
+                return False
+            seq = self.sealed.popleft()
+            path = self._path(seq, "seg")
+            try:
+                seg_size = os.path.getsize(path)
+                os.remove(path)
+            except OSError as e:
+                self._io_error("drop", e)
+                self.sealed.appendleft(seq)
+                return False
+            self.bytes -= seg_size
+            incr("spool_dropped_segments")
+        return True
+
+    def append(self, line: bytes) -> bool:
+        with self.lock:
+            if not self._make_room(len(line)):
+                incr("spool_rejected")
+                return False
+            if self.active is None:
+                # seq-ul avansează doar dacă segmentul s-a putut deschide; next_seq e durabil înaintea
+                # segmentului, altfel după o cădere de curent un seq s-ar refolosi în aceeași epocă
+                # (iar cloud-ul ar confirma batch-ul nou ca duplicat)
+                try:
+                    self._write_durable("next_seq", str(self.next_seq + 1))
+                    self.active = open(self._path(self.next_seq, "open"), "ab")
+                except OSError as e:   # disc plin / eroare I/O: aceeași politică ca la spool plin
+                    self._io_error("open", e)
+                    incr("spool_rejected")
+                    return False
+                self.active_seq = self.next_seq
+                self.next_seq += 1
+                self.active_items = 0
+                self.active_bytes = 0
+                self.active_opened = time.monotonic()
+            try:
+                self.active.write(line)
+            except OSError as e:
+                # o linie poate fi rămas parțial în fișier: segmentul se închide cu liniile complete
+                self._io_error("write", e)
+                incr("spool_rejected")
+                self._seal(damaged=True)
+                return False
+            self.active_items += 1
+            self.active_bytes += len(line)
+            self.bytes += len(line)
+            if self.active_items >= self.max_items or self.active_bytes >= BATCH_MAX_BYTES:
+                self._seal()
+            return True
+
+    def _seal(self, damaged: bool = False) -> None:
+        """
+        Sigilează segmentul activ. După o eroare de scriere (`damaged`) sau de flush, pe disc
+        poate rămâne o linie parțială: segmentul se taie la ultima linie completă contabilizată.
+        """
+        f, seq, path = self.active, self.active_seq, self._path(self.active_seq, "open")
+        self.active = None
+        try:
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        except OSError as e:
+            self._io_error("seal", e)
+            damaged = True
+            try:
+                f.close()
+            except OSError:
+                pass
+        if damaged:
+            try:
+                size = self._cut_partial(path, self.active_bytes)
+            except OSError as e:
+                self._io_error("seal", e)
+                self.stranded.add(seq)       # rămâne `.open`, recuperat la restart
+                return
+            self.bytes -= self.active_bytes - size
+            if size == 0:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                return
+        try:
+            os.replace(path, self._path(seq, "seg"))
+            self._fsync_dir()
+        except OSError as e:
+            self._io_error("seal", e)
+            if not os.path.exists(self._path(seq, "seg")):
+                self.stranded.add(seq)       # rămâne `.open`, recuperat la restart
+                return
+        self.sealed.append(seq)
+        self.ready.notify()
+
+    def seal(self, min_age_sec: float = 0.0) -> None:
+        """Închide segmentul activ dacă e mai vechi de `min_age_sec`."""
+        with self.lock:
+            if self.active is not None and time.monotonic() - self.active_opened >= min_age_sec:
+                self._seal()
+
+    def claim(self, timeout: float) -> Optional[int]:
+        """Următorul segment sigilat de trimis (marcat in-flight) sau None după `timeout`."""
+        with self.lock:
+            if not self.sealed:
+                self.ready.wait(timeout)
+            if not self.sealed:
+                return None
+            seq = self.sealed.popleft()
+            self.inflight.add(seq)
+            return seq
+
+    def release(self, seq: int) -> None:
+        """POST eșuat: segmentul revine în fața cozii pentru retry."""
+        with self.lock:
+            self.inflight.discard(seq)
+            self.sealed.appendleft(seq)
+            self.ready.notify()
+
+    def read(self, seq: int) -> bytes:
+        """Conținutul unui segment sigilat (citit prin mmap)."""
+        with open(self._path(seq, "seg"), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:]
+
+    def ack(self, seq: int) -> None:
+        with self.lock:
+            self.inflight.discard(seq)
+            path = self._path(seq, "seg")
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.bytes -= size
+            except FileNotFoundError:
+                pass
+            except OSError as e:     # rămâne pe disc; retrimis după restart, ignorat de cloud (seq)
+                self._io_error("ack", e)
+
+    def quarantine(self, seq: int) -> None:
+        """Segment respins definitiv de cloud (4xx): păstrat ca `.bad` pentru diagnostic."""
+        with self.lock:
+            self.inflight.discard(seq)
+            try:
+                self.bytes -= os.path.getsize(self._path(seq, "seg"))
+                os.replace(self._path(seq, "seg"), self._path(seq, "bad"))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self._io_error("quarantine", e)
+        incr("spool_quarantined")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments": len(self.sealed) + len(self.inflight),
+            "inflight": len(self.inflight),
+            "bytes": self.bytes,
+            "next_seq": self.next_seq,
+            "max_items": self.max_items,
+        }
+
+spool = Spool(SPOOL_DIR, SPOOL_MAX_BYTES, SPOOL_FULL_POLICY)
+
 def on_connect(client, userdata, flags, rc):
     print(f"[EDGE] MQTT connected rc={rc}")
     client.subscribe("sc/telemetry/#")
 
+# -------------------------- Agregare pe edge --------------------------
+class FieldStats:
+    """min/max/mean/last incremental pentru un câmp numeric: O(1) memorie."""
+    __slots__ = ("n", "vmin", "vmax", "total", "last")
+
+    def __init__(self, v: float):
+        self.n, self.vmin, self.vmax, self.total, self.last = 1, v, v, v, v
+
+    def add(self, v: float) -> None:
+        self.n += 1
+        self.total += v
+        self.last = v
+        if v < self.vmin:
+            self.vmin = v
+        if v > self.vmax:
+            self.vmax = v
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"n": self.n, "min": self.vmin, "max": self.vmax,
+                "mean": self.total / self.n, "last": self.last}
+
+agg_lock = threading.Lock()
+# (sensor, productId, locationId) -> {"n": count, "fields": {field: FieldStats}}
+rollups: Dict[tuple, Dict[str, Any]] = {}
+# (productId, locationId) -> (lat, lon, speed_kmh, monotonic) ultimul punct trimis
+gps_last: Dict[tuple, tuple] = {}
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371000.0 * math.asin(math.sqrt(a))
+
+def gps_moved(payload: Dict[str, Any]) -> bool:
+    """Deadband GPS: True dacă punctul trebuie trimis (s-a mișcat / viteza s-a schimbat / heartbeat)."""
+    data = payload.get("data") or {}
+    lat, lon, speed = data.get("lat"), data.get("lon"), data.get("speed_kmh") or 0.0
+    if not isinstance(lat, (int, float)) or not isinstance(lon, (int, float)):
+        return True
+    key, now = (payload.get("productId"), payload.get("locationId")), time.monotonic()
+    with agg_lock:
+        prev = gps_last.get(key)
+        if prev is not None and (
+            haversine_m(prev[0], prev[1], lat, lon) < GPS_DEADBAND_M
+            and abs(speed - prev[2]) < GPS_DEADBAND_SPEED_KMH
+            and now - prev[3] < GPS_DEADBAND_MAX_SEC
+        ):
+            return False
+        gps_last[key] = (lat, lon, speed, now)
+    return True
+
+def add_to_rollup(payload: Dict[str, Any]) -> None:
+    key = (payload.get("sensor"), payload.get("productId"), payload.get("locationId"))
+    with agg_lock:
+        agg = rollups.get(key)
+        if agg is None:
+            agg = rollups[key] = {"n": 0, "fields": {}}
+        agg["n"] += 1
+        fields = agg["fields"]
+        for name, v in (payload.get("data") or {}).items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                st = fields.get(name)
+                if st is None:
+                    fields[name] = FieldStats(v)
+                else:
+                    st.add(v)
+
+def aggregate(payload: Dict[str, Any]) -> bool:
+    """Aplică etapa de agregare configurată; întoarce True dacă item-ul raw se trimite."""
+    sensor = payload.get("sensor")
+    mode = AGG_MODES.get(sensor, "raw")
+    if mode == "deadband":
+        if gps_moved(payload):
+            return True
+        incr("gps_suppressed")
+        return False
+    if mode in ("rollup", "both"):
+        add_to_rollup(payload)
+        # în modul rollup, item-urile cu alertă ajung totuși în cloud
+        if mode == "rollup" and not payload["_edge"].get("alert"):
+            incr("raw_suppressed")
+            return False
+    return True
+
+# -------------------------- Reguli de alertă --------------------------
+RULE_OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+            "==": operator.eq, "!=": operator.ne}
+
+class Rule:
+    """
+    O regulă compilată din rules.json: `field <op> prag`, pragul fiind `value` (cu override per
+    productId/locationId) sau alt câmp din același mesaj (`value_field`). `for_sec` = condiția
+    trebuie să țină continuu atâtea secunde; `hysteresis` = cât trebuie să revină valoarea
+    dincolo de prag ca alerta să se închidă. `stale_sec` = regulă de senzor tăcut.
+    """
+    def __init__(self, spec: Dict[str, Any]):
+        self.id = spec["id"]
+        self.sensor = spec.get("sensor", "*")
+        self.field = spec.get("field")
+        self.op = spec.get("op", ">")
+        self.cmp = RULE_OPS[self.op]
+        self.value = spec.get("value")
+        self.value_field = spec.get("value_field")
+        self.for_ms = int(float(spec.get("for_sec", 0)) * 1000)
+        self.stale_ms = int(float(spec["stale_sec"]) * 1000) if "stale_sec" in spec else None
+        h = float(spec.get("hysteresis", 0))
+        self.clear_delta = -h if self.op in (">", ">=") else h if self.op in ("<", "<=") else 0
+        self.product = (spec.get("match") or {}).get("productId")
+        self.location = (spec.get("match") or {}).get("locationId")
+        self.overrides = {
+            (o.get("productId"), o.get("locationId")): o["value"] for o in spec.get("overrides") or []
+        }
+        if self.stale_ms is None and (self.field is None or (self.value is None and self.value_field is None)):
+            raise ValueError(f"rule {self.id}: needs field + value/value_field or stale_sec")
+
+    def threshold(self, product_id: Any, location_id: Any, data: Dict[str, Any]) -> Any:
+        if self.value_field:
+            return data.get(self.value_field)
+        if self.overrides:
+            for key in ((product_id, location_id), (product_id, None), (None, location_id)):
+                if key in self.overrides:
+                    return self.overrides[key]
+        return self.value
+
+class RuleEngine:
+    """
+    Regulile compilate o dată într-o tabelă de dispecerizare (sensor, productId) -> reguli
+    aplicabile; evaluarea unui mesaj atinge doar regulile lui, nu toate. Starea ferestrelor
+    (de când ține condiția, dacă alerta e activă) e incrementală, per (regulă, asset).
+    """
+    def __init__(self, specs: List[Dict[str, Any]]):
+        compiled = [Rule(spec) for spec in specs]
+        self.rules = [r for r in compiled if r.stale_ms is None]
+        self.stale_rules = [r for r in compiled if r.stale_ms is not None]
+        self.dispatch: Dict[tuple, List[Rule]] = {}
+        self.state: Dict[tuple, List[Any]] = {}      # cheie -> [pending_since_ms, active, value]
+        self.last_seen: Dict[tuple, int] = {}
+        self.lock = threading.Lock()
+
+    def for_key(self, sensor: Any, product_id: Any) -> List[Rule]:
+        key = (sensor, product_id)
+        rules_ = self.dispatch.get(key)
+        if rules_ is None:
+            rules_ = self.dispatch[key] = [
+                r for r in self.rules
+                if r.sensor in ("*", sensor) and r.product in (None, product_id)
+            ]
+        return rules_
+
+    def evaluate(self, payloads: List[Dict[str, Any]]) -> int:
+        """Evaluează o bucată de mesaje; marchează `_edge.alert` și întoarce câte au fost marcate."""
+        now_ms = int(time.time() * 1000)
+        flagged, events = 0, []
+        with self.lock:
+            for payload in payloads:
+                sensor, p, l = payload.get("sensor"), payload.get("productId"), payload.get("locationId")
+                data = payload.get("data") if isinstance(payload.get("data"), dict) else {}
+                edge = payload["_edge"]
+                at_ms = edge.get("ts_ms") or now_ms
+                self.last_seen[(sensor, p, l)] = now_ms
+                for r in self.stale_rules:
+                    st = self.state.get((r.id, sensor, p, l))
+                    if st is not None and st[1]:
+                        del self.state[(r.id, sensor, p, l)]
+                        events.append(alert_event(r, sensor, p, l, "cleared", None, None, at_ms))
+                active = []
+                for r in self.for_key(sensor, p):
+                    if r.location is not None and r.location != l:
+                        continue
+                    x, thr = data.get(r.field), r.threshold(p, l, data)
+                    if not isinstance(x, (int, float)) or not isinstance(thr, (int, float)):
+                        continue
+                    key = (r.id, sensor, p, l)
+                    st = self.state.get(key)
+                    if st is None:
+                        st = self.state[key] = [None, False, None]
+                    st[2] = x
+                    if st[1]:
+                        if not r.cmp(x, thr + r.clear_delta):
+                            st[0], st[1] = None, False
+                            events.append(alert_event(r, sensor, p, l, "cleared", x, thr, at_ms))
+                    elif r.cmp(x, thr):
+                        if st[0] is None:
+                            st[0] = at_ms
+                        if at_ms - st[0] >= r.for_ms:
+                            st[1] = True
+                            events.append(alert_event(r, sensor, p, l, "fired", x, thr, at_ms))
+                    else:
+                        st[0] = None
+                    if st[1]:
+                        active.append(r.id)
+                if active:
+                    edge["alert"] = ",".join(active)
+                    flagged += 1
+        emit_alert_events(events)
+        return flagged
+
+    def check_stale(self) -> None:
+        """Senzorii (sensor, productId, locationId) tăcuți mai mult de `stale_sec`."""
+        if not self.stale_rules:
+            return
+        now_ms = int(time.time() * 1000)
+        events = []
+        with self.lock:
+            for (sensor, p, l), seen_ms in self.last_seen.items():
+                for r in self.stale_rules:
+                    if r.sensor not in ("*", sensor) or now_ms - seen_ms < r.stale_ms:
+                        continue
+                    key = (r.id, sensor, p, l)
+                    if key not in self.state:
+                        self.state[key] = [seen_ms, True, None]
+                        events.append(alert_event(r, sensor, p, l, "fired", None, None, now_ms))
+        emit_alert_events(events)
+
+    def active(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [
+                {"rule": rid, "sensor": sensor, "productId": p, "locationId": l, "value": st[2]}
+                for (rid, sensor, p, l), st in self.state.items() if st[1]
+            ]
+
+def alert_event(rule: Rule, sensor: Any, product_id: Any, location_id: Any, state: str,
+                value: Any, threshold: Any, at_ms: int) -> Dict[str, Any]:
+    """Tranziție de alertă, trimisă în cloud ca item `sensor: "alert"` (jurnal de evenimente)."""
+    return {
+        "id": str(uuid.uuid4()),
+        "ts": ms_to_iso(at_ms),
+        "sensor": "alert",
+        "productId": product_id,
+        "locationId": location_id,
+        "data": {"rule": rule.id, "state": state, "sensor": sensor, "value": value, "threshold": threshold},
+        "_edge": {"topic": "edge/alerts", "ts_ms": at_ms},
+    }
+
+def emit_alert_events(events: List[Dict[str, Any]]) -> None:
+    for ev in events:
+        print(f"[EDGE] alert {ev['data']['state']}: {ev['data']['rule']} "
+              f"{ev['data']['sensor']}/{ev['productId']}/{ev['locationId']}")
+        spool.append(json_dumps(ev) + b"\n")
+    if events:
+        incr("alert_events", len(events))
+
+def load_rules(path: str) -> RuleEngine:
+    try:
+        with open(path, "rb") as f:
+            specs = json_loads(f.read())["rules"]
+    except FileNotFoundError:
+        # compatibil cu comportamentul vechi: doar pragul de temperatură din ALERT_TEMP_MAX
+        specs = [{"id": f"TEMP_OVER_{ALERT_TEMP_MAX}", "sensor": "env", "field": "temp_c",
+                  "op": ">", "value": ALERT_TEMP_MAX}]
+    engine = RuleEngine(specs)
+    print(f"[EDGE] {len(engine.rules) + len(engine.stale_rules)} alert rules loaded")
+    return engine
+
+rules = load_rules(RULES_PATH)
+
+def rules_loop():
+    while True:
+        time.sleep(RULES_TICK_SEC)
+        try:
+            rules.check_stale()
+        except Exception as e:
+            print("[EDGE] rules error:", e)
+
+def rollup_loop():
+    """La fiecare AGG_WINDOW_SEC (aliniat) emite câte un record rollup per cheie în spool."""
+    while True:
+        window_ms = AGG_WINDOW_SEC * 1000
+        now_ms = int(time.time() * 1000)
+        time.sleep((window_ms - now_ms % window_ms) / 1000)
+        end_ms = (int(time.time() * 1000) // window_ms) * window_ms
+        with agg_lock:
+            window = dict(rollups)
+            rollups.clear()
+        for (sensor, product_id, location_id), agg in window.items():
+            record = {
+                "kind": "rollup",
+                "id": f"{EDGE_ID}|{sensor}|{product_id}|{location_id}|{end_ms - window_ms}",
+                "sensor": sensor,
+                "productId": product_id,
+                "locationId": location_id,
+                "window_start_ms": end_ms - window_ms,
+                "window_end_ms": end_ms,
+                "count": agg["n"],
+                "fields": {name: st.to_dict() for name, st in agg["fields"].items()},
+            }
+            if spool.append(json.dumps(record).encode("utf-8") + b"\n"):
+                incr("rollups_emitted")
+
+# -------------------------- Inbox + parse workers --------------------------
+class Inbox:
+    """
+    Ring buffer mărginit între thread-ul de rețea paho și parse workers: `put` e O(1) și
+    nu blochează niciodată (plin => se pierde cel mai vechi mesaj), ca loop-ul MQTT să
+    răspundă mereu la keepalive.
+    """
+    def __init__(self, maxlen: int):
+        self.items: deque = deque(maxlen=maxlen)
+        self.ready = threading.Condition(threading.Lock())
+
+    def put(self, item: tuple) -> None:
+        with self.ready:
+            if len(self.items) == self.items.maxlen:
+                metrics["inbox_dropped"] += 1     # sub lock-ul inbox-ului: un singur producător
+            self.items.append(item)
+            self.ready.notify()
+
+    def get_many(self, n: int, timeout: float) -> List[tuple]:
+        with self.ready:
+            if not self.items:
+                self.ready.wait(timeout)
+            return [self.items.popleft() for _ in range(min(n, len(self.items)))]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+inbox = Inbox(INBOX_MAX)
+
 def on_message(client, userdata, msg):
-    global buffer
+    """Callback paho: doar bytes + momentul recepției (epoch-ms); restul în parse_loop."""
+    inbox.put((msg.topic, msg.payload, time.time_ns() // 1_000_000))
+
+def parse_message(topic: str, raw: bytes, received_ms: int) -> Dict[str, Any]:
+    """Parsare + îmbogățire cu metadatele edge pentru un mesaj."""
+    payload = json_loads(raw)
+    if not isinstance(payload, dict):
+        raise ValueError("payload is not an object")
+    # ts_ms e calculat o singură dată aici (refolosit de reguli și la trimitere)
+    ts_ms = iso_to_ms(payload.get("ts"))
+    payload["_edge"] = {
+        "topic": topic,
+        "received_ts": ms_to_iso(received_ms),
+        "ts_ms": ts_ms,
+        "latency_ms_sensor_to_edge": received_ms - ts_ms if ts_ms is not None else None,
+    }
+    return payload
+
+def parse_loop():
+    """
+    Un parse worker: parsează o bucată din inbox, evaluează regulile pe toată bucata, apoi
+    agregare + spool. Contoarele se adună local și se publică o dată per bucată.
+    """
+    while True:
+        chunk = inbox.get_many(PARSE_CHUNK, timeout=1.0)
+        if not chunk:
+            continue
+        payloads, errors = [], 0
+        now_ms = time.time_ns() // 1_000_000
+        for topic, raw, received_ms in chunk:
+            INBOX_WAIT_SECONDS.observe((now_ms - received_ms) / 1000)
+            t0 = time.perf_counter()
+            try:
+                payload = parse_message(topic, raw, received_ms)
+            except Exception as e:
+                errors += 1
+                print("[EDGE] parse error:", e)
+                continue
+            PARSE_SECONDS.observe(time.perf_counter() - t0)
+            latency = payload["_edge"]["latency_ms_sensor_to_edge"]
+            if latency is not None:
+                SENSOR_TO_EDGE_SECONDS.observe(latency / 1000)
+            payloads.append(payload)
+        with RULES_SECONDS.time():
+            alerts = rules.evaluate(payloads)
+        for payload in payloads:
+            try:
+                if aggregate(payload):
+                    spool.append(json_dumps(payload) + b"\n")
+            except Exception as e:    # worker-ul trebuie să supraviețuiască unei erori de disc
+                incr("spool_rejected")
+                print("[EDGE] spool append error:", e)
+        with metrics_lock:
+            metrics["messages_in"] += len(payloads)
+            metrics["alerts"] += alerts
+            metrics["parse_errors"] += errors
+
+def batch_body(data: bytes) -> bytes:
+    """Corpul POST-ului construit direct din liniile NDJSON ale segmentului (fără re-serializare)."""
+    items = data.rstrip(b"\n").replace(b"\n", b",")
+    return b'{"batch_ts":' + json.dumps(now_iso()).encode() + b',"items":[' + items + b"]}"
+
+def iso_to_ms(ts: Any) -> Optional[int]:
     try:
-        payload = json.loads(msg.payload.decode("utf-8"))
-        metrics["messages_in"] += 1
-        # îmbogățire metadate edge
-        payload["_edge"] = {
-            "topic": msg.topic,
-            "received_ts": now_iso()
-        }
-        # alertă simplă: temperatură > prag
-        if payload.get("sensor") == "env":
-            temp = (payload.get("data") or {}).get("temp_c", 0)
-            if isinstance(temp, (int, float)) and temp > ALERT_TEMP_MAX:
-                payload["_edge"]["alert"] = f"TEMP_OVER_{ALERT_TEMP_MAX}"
-                metrics["alerts"] += 1
-        with buffer_lock:
-            buffer.append(payload)
+        return int(datetime.fromisoformat(str(ts).replace("Z", "+00:00")).timestamp() * 1000)
+    except Exception:
+        return None
+
+def msgpack_columns(data: bytes) -> bytes:
+    """
+    Varianta columnară: o listă per câmp; productId/locationId/sensor/topic/alert
+    dicționar-encodate, `ts` ca epoch-ms, `data` ca text JSON (stocat ca atare în cloud).
+    Record-urile rollup (puține) merg separat, în `rollups`.
+    """
+    dict_fields = ("productId", "locationId", "sensor", "topic", "alert")
+    dicts = {f: {} for f in dict_fields}
+    cols = {f: [] for f in ("id", "ts_ms", "latency_ms", "data") + dict_fields}
+
+    def code(field: str, value: Any) -> Optional[int]:
+        if value is None:
+            return None
+        return dicts[field].setdefault(value, len(dicts[field]))
+
+    rollup_records = []
+    for line in data.splitlines():
+        it = json_loads(line)
+        if it.get("kind") == "rollup":
+            rollup_records.append(it)
+            continue
+        edge = it.get("_edge") or {}
+        cols["id"].append(it.get("id"))
+        ts_ms = edge["ts_ms"] if "ts_ms" in edge else iso_to_ms(it.get("ts"))
+        cols["ts_ms"].append(ts_ms)
+        cols["latency_ms"].append(edge.get("latency_ms_sensor_to_edge"))
+        cols["data"].append(None if it.get("data") is None else json_dumps(it.get("data")).decode("utf-8"))
+        cols["productId"].append(code("productId", it.get("productId")))
+        cols["locationId"].append(code("locationId", it.get("locationId")))
+        cols["sensor"].append(code("sensor", it.get("sensor")))
+        cols["topic"].append(code("topic", edge.get("topic")))
+        cols["alert"].append(code("alert", edge.get("alert")))
+    return msgpack.packb({
+        "batch_ts_ms": int(time.time() * 1000),
+        "dict": {f: list(d) for f, d in dicts.items()},
+        "cols": cols,
+        "rollups": rollup_records,
+    })
+
+# formatul negociat cu cloud-ul; resetat la 415 ca să fie renegociat
+wire: Dict[str, Optional[str]] = {"format": None, "encoding": None}
+
+def negotiate_wire() -> None:
+    formats, encodings = ["json"], ["identity"]
+    try:
+        resp = session.get(CLOUD_INGEST_URL.rstrip("/") + "/formats", timeout=5)
+        if resp.ok:
+            formats, encodings = resp.json()["formats"], resp.json()["encodings"]
     except Exception as e:
-        print("[EDGE] parse error:", e)
+        print("[EDGE] wire negotiation failed, using json:", e)
+    local_formats = (["msgpack"] if msgpack else []) + ["ndjson", "json"]
+    local_encodings = (["zstd"] if zstandard else []) + ["gzip", "identity"]
+    wanted_f = local_formats if WIRE_FORMAT == "auto" else [WIRE_FORMAT]
+    wanted_e = local_encodings if WIRE_COMPRESSION == "auto" else [WIRE_COMPRESSION]
+    wire["format"] = next((f for f in wanted_f if f in formats and f in local_formats), "json")
+    wire["encoding"] = next((e for e in wanted_e if e in encodings and e in local_encodings), "identity")
+    metrics["wire"] = f"{wire['format']}+{wire['encoding']}"
+
+def encode_batch(data: bytes) -> tuple:
+    """(body, headers) pentru un segment, în formatul negociat."""
+    if wire["format"] is None:
+        negotiate_wire()
+    fmt, enc = wire["format"], wire["encoding"]
+    if fmt == "msgpack":
+        body, ctype = msgpack_columns(data), "application/x-msgpack"
+    elif fmt == "ndjson":
+        body, ctype = data, "application/x-ndjson"    # segmentul e deja NDJSON
+    else:
+        body, ctype = batch_body(data), "application/json"
+    headers = {"Content-Type": ctype, "X-Batch-Ts": now_iso()}
+    if enc == "zstd":
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+    elif enc == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    if enc in ("zstd", "gzip"):
+        headers["Content-Encoding"] = enc
+    return body, headers
+
+def backoff_delay(attempt: int) -> float:
+    """Backoff exponențial cu jitter, plafonat la RETRY_MAX_SEC."""
+    return min(RETRY_MAX_SEC, RETRY_BASE_SEC * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+def adapt_batch_size(rtt_ms: float, items: int) -> None:
+    """
+    AIMD pe pragul de items: batch-urile pline și rapide cresc pragul (throughput),
+    un RTT peste țintă îl micșorează (latență).
+    """
+    with spool.lock:
+        if rtt_ms > TARGET_RTT_MS:
+            spool.max_items = max(BATCH_MIN_ITEMS, int(spool.max_items * 0.7))
+        elif items >= spool.max_items:
+            spool.max_items = min(BATCH_MAX_ITEMS, int(spool.max_items * 1.25) + 1)
+        metrics["batch_max_items"] = spool.max_items
+
+# pool HTTP comun pentru toate POST-urile în zbor
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=POST_CONCURRENCY))
+session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=POST_CONCURRENCY))
+
+def flusher_loop():
+    """Sigilează segmentul activ când primul item din el a atins BATCH_MAX_AGE_SEC."""
+    tick = max(0.05, BATCH_MAX_AGE_SEC / 5)
+    while True:
+        time.sleep(tick)
+        try:
+            spool.seal(BATCH_MAX_AGE_SEC)
+        except Exception as e:      # fără flusher, la trafic mic nu se mai sigilează nimic
+            incr("flusher_errors")
+            print("[EDGE] flusher error:", e)
 
 def poster_loop():
-    global buffer
-    session = requests.Session()
+    """Un worker de POST; rulează POST_CONCURRENCY instanțe în paralel."""
+    attempt = 0
     while True:
-        time.sleep(AGG_WINDOW_SEC)
-        with buffer_lock:
-            batch = buffer
-            buffer = []
-        if not batch:
+        seq = spool.claim(timeout=1.0)
+        if seq is None:
             continue
-
-        # calculează latența senzor->edge (ms)
-        for item in batch:
-            try:
-                ts_src  = datetime.fromisoformat(str(item["ts"]).replace("Z", "+00:00"))
-                ts_edge = datetime.fromisoformat(str(item["_edge"]["received_ts"]).replace("Z", "+00:00"))
-                item["_edge"]["latency_ms_sensor_to_edge"] = int((ts_edge - ts_src).total_seconds() * 1000)
-            except Exception:
-                pass
-
         try:
-            resp = session.post(CLOUD_INGEST_URL, json={"batch_ts": now_iso(), "items": batch}, timeout=10)
-            metrics["batches_sent"] += 1
+            data = spool.read(seq)
+        except OSError as e:
+            spool._io_error("read", e)
+            spool.release(seq)
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+        size = data.count(b"\n")
+        BATCH_ITEMS.observe(size)
+        t0 = time.perf_counter()
+        try:
+            with ENCODE_SECONDS.time():
+                body, headers = encode_batch(data)
+            # segmentul = batch-ul: același seq la fiecare retry, deci cloud-ul îl confirmă o singură dată
+            headers.update({
+                "X-Edge-Id": EDGE_ID,
+                "X-Edge-Epoch": spool.epoch,
+                "X-Batch-Seq": str(seq),
+                "X-Edge-Low-Seq": str(spool.low_seq()),
+            })
+            BATCH_BYTES.observe(len(body))
+            t0 = time.perf_counter()
+            resp = session.post(CLOUD_INGEST_URL, data=body, headers=headers, timeout=10)
             metrics["last_post_status"] = f"{resp.status_code}"
-            print(f"[EDGE] POST {CLOUD_INGEST_URL} size={len(batch)} status={resp.status_code}")
+            print(f"[EDGE] POST {CLOUD_INGEST_URL} size={size} bytes={len(body)} "
+                  f"wire={metrics.get('wire')} status={resp.status_code}")
         except Exception as e:
             metrics["last_post_status"] = f"error:{e}"
+            incr("post_errors")
             print("[EDGE] POST error:", e)
+            resp = None
+        rtt_ms = (time.perf_counter() - t0) * 1000
+        POST_SECONDS.labels(f"{resp.status_code // 100}xx" if resp is not None else "error").observe(rtt_ms / 1000)
+
+        if resp is not None and resp.ok:
+            spool.ack(seq)
+            incr("batches_sent")
+            metrics["last_post_rtt_ms"] = round(rtt_ms, 1)
+            adapt_batch_size(rtt_ms, size)
+            attempt = 0
+        elif resp is not None and resp.status_code == 415:
+            wire["format"] = None           # cloud-ul nu mai acceptă formatul: renegociere
+            spool.release(seq)
+            incr("post_retries")
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+        elif resp is not None and 400 <= resp.status_code < 500 and resp.status_code not in (408, 429):
+            spool.quarantine(seq)
+            attempt = 0
+        else:
+            spool.release(seq)
+            incr("post_retries")
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
 
 def run_mqtt():
     client = mqtt.Client(client_id="edge-node")
@@ -92,34 +1027,95 @@ def run_mqtt():
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "metrics": metrics}
+    return {"status": "ok", "metrics": metrics, "inbox": len(inbox),
+            "active_alerts": len(rules.active()), "spool": spool.stats()}
+
+@app.get("/metrics/prom")
+def metrics_prom():
+    """Instrumentarea căilor fierbinți, în formatul text Prometheus."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/alerts")
+def alerts():
+    """Alertele active acum (după histerezis / fereastră)."""
+    return {"items": rules.active()}
+
+class HealthFeed:
+    """
+    /stream (SSE): un singur snapshot /health per STREAM_INTERVAL_SEC, trimis doar când s-a
+    schimbat și partajat de toate conexiunile; un client lent primește direct ultimul snapshot.
+    """
+    def __init__(self):
+        self.frame = ""
+        self.version = 0
+        self.subs = 0
+        self.tick: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def _loop(self) -> None:
+        last = None
+        while self.subs:
+            body = json.dumps(health())
+            if body != last:
+                last = body
+                self.frame = f"event: health\ndata: {body}\n\n"
+                self.version += 1
+                tick, self.tick = self.tick, asyncio.Event()
+                tick.set()
+            await asyncio.sleep(STREAM_INTERVAL_SEC)
+
+    async def frames(self):
+        self.subs += 1
+        if self.task is None or self.task.done():
+            self.tick = asyncio.Event()
+            self.task = asyncio.create_task(self._loop())
+        seen = 0
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                if self.version != seen:
+                    seen = self.version
+                    yield self.frame
+                    continue
+                try:
+                    await asyncio.wait_for(self.tick.wait(), 15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.subs -= 1
 
-# ---------- Pagina LIVE pentru /health (auto-refresh în browser) ----------
+health_feed = HealthFeed()
+
+@app.get("/stream")
+async def stream():
+    return StreamingResponse(health_feed.frames(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ---------- Pagina LIVE pentru /health (push prin /stream) ----------
 @app.get("/live/health", response_class=HTMLResponse)
-def live_health(interval: int = 2000) -> str:
+def live_health() -> str:
     """
-    Vizualizare live pentru /health.
-    Exemplu: http://localhost:8081/live/health?interval=1500
+    Vizualizare live pentru /health, alimentată prin /stream (SSE).
+    Exemplu: http://localhost:8081/live/health
     """
-    return f"""<!doctype html>
+    return """<!doctype html>
 <html lang="en">
 <head>
 <meta charset="utf-8" />
 <title>edge-node /health (live)</title>
 <style>
-  html,body {{ background:#0f1115; color:#e8e6e3; font:14px/1.4 ui-monospace, SFMono-Regular, Menlo, Consolas, monospace; margin:0; }}
-  header {{ padding:10px 14px; border-bottom:1px solid #24262c; }}
-  #info span {{ opacity:.8; margin-right:12px; }}
-  pre {{ margin:0; padding:14px; white-space:pre-wrap; word-break:break-word; }}
-  .ok {{ color:#6ee7a2; }} .err {{ color:#f87171; }}
+  html,body { background:#0f1115; color:#e8e6e3; font:14px/1.4 ui-monospace, SFMono-Regular, Menlo, Consolas, monospace; margin:0; }
+  header { padding:10px 14px; border-bottom:1px solid #24262c; }
+  #info span { opacity:.8; margin-right:12px; }
+  pre { margin:0; padding:14px; white-space:pre-wrap; word-break:break-word; }
+  .ok { color:#6ee7a2; } .err { color:#f87171; }
 </style>
 </head>
 <body>
   <header>
     <div id="info">
-      <span>Polling: <b id="iv">{interval}</b> ms</span>
+      <span>Push: <b id="st">connecting…</b></span>
       <span>Last update: <b id="lu">-</b></span>
-      <span>Status: <b id="st">-</b></span>
     </div>
   </header>
   <pre id="out">loading…</pre>
@@ -127,30 +1123,24 @@ def live_health(interval: int = 2000) -> str:
 const out = document.getElementById('out');
 const lu  = document.getElementById('lu');
 const st  = document.getElementById('st');
-const iv  = parseInt(new URLSearchParams(location.search).get('interval') || '{interval}', 10);
-
-async function tick() {{
-  try {{
-    const r = await fetch('/health', {{ cache:'no-store' }});
-    st.textContent = r.status + ' ' + r.statusText;
-    st.className = (r.ok ? 'ok':'err');
-    const j = await r.json();
-    out.textContent = JSON.stringify(j, null, 2);
-    lu.textContent = new Date().toLocaleTimeString();
-  }} catch (e) {{
-    st.textContent = 'error';
-    st.className = 'err';
-    out.textContent = String(e);
-  }}
-}}
-tick();
-setInterval(tick, iv);
+
+const es = new EventSource('/stream');
+es.onopen  = () => { st.textContent = 'connected'; st.className = 'ok'; };
+es.onerror = () => { st.textContent = 'reconnecting…'; st.className = 'err'; };
+es.addEventListener('health', (ev) => {
+  out.textContent = JSON.stringify(JSON.parse(ev.data), null, 2);
+  lu.textContent = new Date().toLocaleTimeString();
+});
 </script>
 </body>
 </html>"""
 
 def start_background():
     threading.Thread(target=run_mqtt,   daemon=True).start()
-    threading.Thread(target=poster_loop, daemon=True).start()
-
-start_background()
+    threading.Thread(target=flusher_loop, daemon=True).start()
+    threading.Thread(target=rollup_loop, daemon=True).start()
+    threading.Thread(target=rules_loop, daemon=True).start()
+    for _ in range(PARSE_WORKERS):
+        threading.Thread(target=parse_loop, daemon=True).start()
+    for _ in range(POST_CONCURRENCY):
+        threading.Thread(target=poster_loop, daemon=True).start()
@@ -0,0 +1,138 @@
+# edge-node/test_spool.py — rulează din edge/: python -m pytest -q
+import importlib.util, os, tempfile
+
+os.environ.setdefault("SPOOL_DIR", tempfile.mkdtemp())
+
+import pytest
+
+# încărcat sub alt nume: cloud/app.py și edge/app.py pot rula în aceeași sesiune pytest
+_spec = importlib.util.spec_from_file_location("edge_app", os.path.join(os.path.dirname(__file__), "app.py"))
+edge = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(edge)
+
+def line(i: int) -> bytes:
+    return b'{"id": "m%d", "sensor": "env"}\n' % i
+
+def segment(spool, lines) -> int:
+    """Adaugă liniile, sigilează segmentul și întoarce seq-ul lui."""
+    for i in lines:
+        assert spool.append(line(i))
+    seq = spool.active_seq
+    spool.seal()
+    return seq
+
+@pytest.fixture
+def spool_dir(tmp_path):
+    return str(tmp_path)
+
+def new_spool(directory, max_bytes=1 << 20, policy="drop_oldest"):
+    return edge.Spool(directory, max_bytes, policy)
+
+def test_claim_read_ack(spool_dir):
+    spool = new_spool(spool_dir)
+    seq = segment(spool, range(3))
+    assert spool.claim(timeout=0) == seq
+    assert spool.read(seq) == line(0) + line(1) + line(2)
+    spool.ack(seq)
+    assert spool.claim(timeout=0) is None
+    assert not os.path.exists(spool._path(seq, "seg"))
+    assert spool.bytes == 0
+
+def test_restart_recovers_unacked_and_open_segments(spool_dir):
+    spool = new_spool(spool_dir)
+    inflight = segment(spool, range(2))
+    queued = segment(spool, range(2, 4))
+    assert spool.claim(timeout=0) == inflight          # în zbor la oprire, neconfirmat
+    assert spool.append(line(4))
+    open_seq = spool.active_seq
+    spool.active.write(b'{"id": "partial')             # oprire în mijlocul unei linii
+    spool.active.flush()
+
+    restarted = new_spool(spool_dir)
+    assert list(restarted.sealed) == [inflight, queued, open_seq]
+    assert restarted.read(open_seq) == line(4)           # linia incompletă e tăiată
+    assert restarted.next_seq == open_seq + 1
+    assert restarted.bytes == sum(os.path.getsize(restarted._path(s, "seg")) for s in restarted.sealed)
+
+def test_release_returns_segment_to_front_and_acks_out_of_order(spool_dir):
+    spool = new_spool(spool_dir)
+    first, second, third = (segment(spool, [i]) for i in range(3))
+    assert [spool.claim(timeout=0), spool.claim(timeout=0)] == [first, second]
+    spool.ack(second)                                    # POST-uri concurente: ack în altă ordine
+    spool.release(first)                                 # POST eșuat: retry înaintea celorlalte
+    assert spool.claim(timeout=0) == first
+    assert spool.claim(timeout=0) == third
+    assert spool.inflight == {first, third}
+
+def test_quarantine_keeps_rejected_segment_as_bad(spool_dir):
+    spool = new_spool(spool_dir)
+    seq = segment(spool, range(2))
+    before = edge.metrics["spool_quarantined"]
+    assert spool.claim(timeout=0) == seq
+    spool.quarantine(seq)
+    assert os.path.exists(spool._path(seq, "bad"))
+    assert not os.path.exists(spool._path(seq, "seg"))
+    assert (spool.bytes, spool.inflight) == (0, set())
+    assert edge.metrics["spool_quarantined"] == before + 1
+    assert seq not in new_spool(spool_dir).sealed          # nu e retrimis după restart
+
+def test_full_spool_drops_oldest_segment(spool_dir):
+    size = len(line(0)) * 2
+    spool = new_spool(spool_dir, max_bytes=size * 2)
+    oldest = segment(spool, range(2))
+    newer = segment(spool, range(2, 4))
+    assert spool.append(line(4))
+    assert oldest not in spool.sealed and newer in spool.sealed
+    assert not os.path.exists(spool._path(oldest, "seg"))
+
+def test_full_spool_rejects_with_reject_policy(spool_dir):
+    spool = new_spool(spool_dir, max_bytes=len(line(0)) * 2, policy="reject")
+    segment(spool, range(2))
+    assert not spool.append(line(2))
+
+def test_write_error_cuts_partial_line_and_seals(spool_dir):
+    spool = new_spool(spool_dir)
+    assert spool.append(line(0))
+    seq, real = spool.active_seq, spool.active
+
+    class DiskFull:
+        def write(self, data):
+            real.write(data[:5])
+            raise OSError(28, "No space left on device")
+
+        def __getattr__(self, name):
+            return getattr(real, name)
+
+    spool.active = DiskFull()
+    assert not spool.append(line(1))
+    assert list(spool.sealed) == [seq]
+    assert spool.read(seq) == line(0)
+
+def test_epoch_persists_and_changes_after_spool_reset(tmp_path):
+    first = new_spool(str(tmp_path / "a"))
+    assert new_spool(str(tmp_path / "a")).epoch == first.epoch
+    assert new_spool(str(tmp_path / "b")).epoch != first.epoch     # spool nou => seq de la 1, altă epocă
+
+def test_next_seq_recovered_after_all_segments_acked(spool_dir):
+    spool = new_spool(spool_dir)
+    for i in range(3):
+        seq = segment(spool, [i])
+        assert spool.claim(timeout=0) == seq
+        spool.ack(seq)
+    assert os.listdir(spool_dir).count("next_seq") == 1
+    restarted = new_spool(spool_dir)
+    assert restarted.next_seq == seq + 1                             # nu refolosește seq-urile confirmate
+    assert restarted.epoch == spool.epoch
+
+def test_low_seq_tracks_oldest_pending_segment(spool_dir):
+    spool = new_spool(spool_dir)
+    assert spool.low_seq() == spool.next_seq
+    first, second = segment(spool, [0]), segment(spool, [1])
+    assert spool.append(line(2))
+    assert spool.claim(timeout=0) == first
+    assert spool.low_seq() == first                                  # în zbor
+    spool.ack(first)
+    assert spool.low_seq() == second
+    assert spool.claim(timeout=0) == second
+    spool.quarantine(second)                                         # pierdut: nu mai ține low-ul pe loc
+    assert spool.low_seq() == spool.active_seq
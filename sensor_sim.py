@@ -1,65 +1,343 @@
-import json, random, time, uuid, os
+"""
+Generator de încărcare: N dispozitive virtuale cu identitate stabilă (productId/locationId),
+camioane cu trasee GPS realiste între depozite, publicate pe MQTT la o rată agregată țintă.
+
+Programare open-loop: mesajul k are momentul planificat t0 + k/rate, indiferent cât de repede
+răspunde sistemul. Latența de trimitere se măsoară față de momentul planificat, deci o
+întârziere nu „ascunde” mesajele care ar fi trebuit trimise între timp (fără coordinated omission).
+
+    python sensor_sim.py                                        # 9 dispozitive, 1 msg/s, ca înainte
+    python sensor_sim.py --devices 600 --rate 5000 --duration 60 --qos 1
+    python sensor_sim_http.py --devices 600 --rate 20000 --batch 500   # direct în cloud /ingest
+"""
+import argparse, asyncio, json, math, os, random, threading, time, uuid
+from array import array
 from datetime import datetime, timezone
-import paho.mqtt.client as mqtt
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 MQTT_HOST = os.getenv("MQTT_HOST", "localhost")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 CLIENT_ID = f"sim-{uuid.uuid4().hex[:8]}"
 
-PRODUCT_IDS  = ["SKU-1001","SKU-1002","SKU-2003"]
-LOCATION_IDS = ["WH-RO-CLUJ","WH-RO-B","TRUCK-42"]
+SIM_DEVICES = int(os.getenv("SIM_DEVICES", "9"))
+SIM_RATE = float(os.getenv("SIM_RATE", "1"))               # mesaje/s, agregat pe toate dispozitivele
+SIM_DURATION_SEC = float(os.getenv("SIM_DURATION_SEC", "0"))  # 0 = până la Ctrl+C
+SIM_SEED = int(os.getenv("SIM_SEED", "42"))                # aceleași identități la fiecare rulare
+
+TOPICS = {"gps": "sc/telemetry/gps", "stock": "sc/telemetry/stock", "env": "sc/telemetry/env"}
+SENSORS = ("gps", "stock", "env")
+
+# depozitele = locationId-urile staționare și capetele traseelor camioanelor
+DEPOTS = {
+    "WH-RO-CLUJ": (46.7712, 23.6236),
+    "WH-RO-B":    (44.4268, 26.1025),
+    "WH-RO-IASI": (47.1585, 27.6014),
+    "WH-RO-TM":   (45.7489, 21.2087),
+    "WH-RO-CT":   (44.1598, 28.6348),
+    "WH-RO-BV":   (45.6427, 25.5887),
+    "WH-RO-CV":   (44.3302, 23.7949),
+    "WH-RO-SB":   (45.7983, 24.1256),
+}
+DEPOT_IDS = list(DEPOTS)
+M_PER_DEG_LAT = 111_320.0
 
 def now_iso(): return datetime.now(timezone.utc).isoformat()
 
-def gen_gps():
-    base_lat, base_lon = 46.77, 23.59
-    return {
-        "lat": round(base_lat + random.uniform(-0.01, 0.01), 6),
-        "lon": round(base_lon + random.uniform(-0.01, 0.01), 6),
-        "speed_kmh": round(random.uniform(0, 70), 1)
-    }
-
-def gen_stock():
-    level = max(0, int(random.gauss(120, 20)))
-    return {"level": level, "reorder_point": 80, "safety_stock": 40}
-
-def gen_env():
-    temp = round(random.uniform(2, 12), 1)  # >8°C = alertă lanț rece
-    hum  = round(random.uniform(30, 80), 1)
-    return {"temp_c": temp, "humidity_pct": hum}
-
-def make_payload(sensor_type):
-    return {
-        "id": str(uuid.uuid4()),
-        "ts": now_iso(),               # moment generare la sursă
-        "productId": random.choice(PRODUCT_IDS),
-        "locationId": random.choice(LOCATION_IDS),
-        "sensor": sensor_type,
-        "data": (
-            gen_gps()   if sensor_type=="gps"   else
-            gen_stock() if sensor_type=="stock" else
-            gen_env()
-        )
-    }
+# -------------------------- Dispozitive virtuale --------------------------
+class Device:
+    """
+    Un dispozitiv cu tip de senzor și identitate fixe; starea evoluează cu timpul simulat
+    (nivelul stocului scade și se reface, temperatura derivă în jurul setpoint-ului,
+    camionul merge spre un depozit, staționează, apoi pleacă spre altul).
+    """
+    __slots__ = ("index", "sensor", "topic", "productId", "locationId", "rng", "last_t",
+                 "lat", "lon", "speed", "dest", "dwell_until", "level", "temp", "hum")
+
+    def __init__(self, index: int, n_products: int, seed: int):
+        self.index = index
+        self.rng = rng = random.Random(seed * 1_000_003 + index)
+        self.sensor = SENSORS[index % len(SENSORS)]
+        self.topic = TOPICS[self.sensor]
+        self.productId = f"SKU-{1001 + (index // len(SENSORS)) % n_products}"
+        self.last_t: Optional[float] = None
+        home = DEPOT_IDS[index % len(DEPOT_IDS)]
+        if self.sensor == "gps":
+            self.locationId = f"TRUCK-{index // len(SENSORS) + 1:03d}"
+            self.lat, self.lon = DEPOTS[home]
+            self.dest = rng.choice([d for d in DEPOT_IDS if d != home])
+            self.speed = rng.uniform(50, 80)
+            self.dwell_until = 0.0
+        else:
+            self.locationId = home
+            self.level = rng.randint(120, 220)
+            self.temp = rng.uniform(3.0, 6.0)
+            self.hum = rng.uniform(40, 60)
+
+    def payload(self, t: float) -> Dict[str, Any]:
+        """Payload-ul pentru momentul planificat t (secunde, ceas monoton)."""
+        dt = 0.0 if self.last_t is None else max(0.0, t - self.last_t)
+        self.last_t = t
+        data = (self._gps(t, dt) if self.sensor == "gps" else
+                self._stock() if self.sensor == "stock" else
+                self._env(dt))
+        return {
+            "id": str(uuid.uuid4()),
+            "ts": now_iso(),               # moment generare la sursă
+            "productId": self.productId,
+            "locationId": self.locationId,
+            "sensor": self.sensor,
+            "data": data,
+        }
+
+    def _gps(self, t: float, dt: float) -> Dict[str, Any]:
+        rng = self.rng
+        if t < self.dwell_until:
+            self.speed = 0.0
+        else:
+            # viteza: mers aleator mărginit, ca într-un trafic real
+            self.speed = min(95.0, max(30.0, (self.speed or 50.0) + rng.gauss(0, 3)))
+            dest_lat, dest_lon = DEPOTS[self.dest]
+            dy = (dest_lat - self.lat) * M_PER_DEG_LAT
+            dx = (dest_lon - self.lon) * M_PER_DEG_LAT * math.cos(math.radians(self.lat))
+            remaining = math.hypot(dx, dy)
+            step = self.speed / 3.6 * dt
+            if step >= remaining:
+                # sosire: staționare 1–5 minute, apoi următoarea destinație
+                self.lat, self.lon = dest_lat, dest_lon
+                self.dwell_until = t + rng.uniform(60, 300)
+                self.dest = rng.choice([d for d in DEPOT_IDS if d != self.dest])
+                self.speed = 0.0
+            elif remaining > 0:
+                self.lat += step * dy / remaining / M_PER_DEG_LAT
+                self.lon += step * dx / remaining / (M_PER_DEG_LAT * math.cos(math.radians(self.lat)))
+        noise = 5.0 / M_PER_DEG_LAT                       # ~5 m zgomot GPS
+        return {
+            "lat": round(self.lat + rng.gauss(0, noise), 6),
+            "lon": round(self.lon + rng.gauss(0, noise), 6),
+            "speed_kmh": round(max(0.0, self.speed + rng.gauss(0, 1)) if self.speed else 0.0, 1),
+        }
+
+    def _stock(self) -> Dict[str, Any]:
+        rng = self.rng
+        self.level = max(0, self.level - rng.choice((0, 0, 1, 1, 2, 3)))
+        if self.level < 40 and rng.random() < 0.05:       # reaprovizionare
+            self.level += rng.randint(120, 200)
+        return {"level": self.level, "reorder_point": 80, "safety_stock": 40}
+
+    def _env(self, dt: float) -> Dict[str, Any]:
+        rng = self.rng
+        # revenire spre 5°C + zgomot; rar, o ușă deschisă (>8°C = alertă lanț rece)
+        self.temp += (5.0 - self.temp) * min(1.0, 0.05 * dt) + rng.gauss(0, 0.2)
+        if rng.random() < 0.01:
+            self.temp += rng.uniform(3, 6)
+        self.hum = min(90.0, max(20.0, self.hum + rng.gauss(0, 0.5)))
+        return {"temp_c": round(self.temp, 1), "humidity_pct": round(self.hum, 1)}
+
+def make_devices(n: int, n_products: int, seed: int) -> List[Device]:
+    return [Device(i, n_products, seed) for i in range(n)]
+
+# -------------------------- Statistici (latență față de momentul planificat) --------------------------
+def percentiles(values, qs=(0.5, 0.9, 0.99, 0.999)) -> Dict[str, float]:
+    if not values:
+        return {}
+    s = sorted(values)
+    out = {f"p{q * 100:g}": round(s[min(len(s) - 1, int(q * len(s)))] * 1000, 3) for q in qs}
+    out["max"] = round(s[-1] * 1000, 3)
+    return out
+
+class Stats:
+    """Contoare + latențe; `done` poate fi apelat și din thread-ul de rețea paho."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scheduled = 0
+        self.sent = 0
+        self.errors = 0
+        self.window = array("d")      # latențe de la ultimul raport
+        self.all = array("d")
+        self.start()
+
+    def start(self, t0: Optional[float] = None):
+        """Începutul programării (după conectare), ca rata realizată să nu includă setup-ul."""
+        self.t0 = self.last_done = time.perf_counter() if t0 is None else t0
+        self.last_report = (self.t0, 0, 0)
+
+    def done(self, intended: List[float], now: Optional[float] = None):
+        now = time.perf_counter() if now is None else now
+        lat = array("d", (now - t for t in intended))
+        with self.lock:
+            self.sent += len(lat)
+            self.last_done = max(self.last_done, now)
+            self.window.extend(lat)
+            self.all.extend(lat)
+
+    def failed(self, n: int = 1):
+        with self.lock:
+            self.errors += n
+
+    def report(self, pending: int = 0) -> str:
+        now = time.perf_counter()
+        with self.lock:
+            window, self.window = self.window, array("d")
+            sent, scheduled, errors = self.sent, self.scheduled, self.errors
+        t_prev, sched_prev, sent_prev = self.last_report
+        self.last_report = (now, scheduled, sent)
+        dt = max(now - t_prev, 1e-9)
+        p = percentiles(window, (0.5, 0.99))
+        return (f"[SIM] t={now - self.t0:.0f}s offered={(scheduled - sched_prev) / dt:.0f}/s "
+                f"sent={(sent - sent_prev) / dt:.0f}/s pending={pending} errors={errors} "
+                f"lat_ms p50={p.get('p50', 0)} p99={p.get('p99', 0)} max={p.get('max', 0)}")
+
+    def summary(self, **extra) -> Dict[str, Any]:
+        with self.lock:
+            elapsed = self.last_done - self.t0          # până la ultima confirmare
+            out = {
+                **extra,
+                "elapsed_sec": round(elapsed, 3),
+                "scheduled": self.scheduled,
+                "sent": self.sent,
+                "errors": self.errors,
+                "achieved_rate": round(self.sent / elapsed, 1) if elapsed > 0 else 0.0,
+                "latency_ms": percentiles(self.all),
+            }
+        return out
+
+# -------------------------- Programare open-loop --------------------------
+async def run_open_loop(devices: List[Device], rate: float, duration: float, stats: Stats,
+                        emit: Callable[[List[Tuple[float, Device]]], None],
+                        pending: Callable[[], int] = lambda: 0,
+                        report_sec: float = 5.0, tick_sec: float = 0.005):
+    """
+    Emite mesajul k (dispozitivul k % N) la t0 + k/rate. La fiecare tick se emit toate
+    mesajele ajunse la termen, cu momentul lor planificat; `emit` nu trebuie să blocheze.
+    """
+    n = len(devices)
+    total = int(rate * duration) if duration > 0 else math.inf
+    t0 = time.perf_counter()
+    stats.start(t0)
+    next_report = t0 + report_sec
+    k = 0
+    while k < total:
+        now = time.perf_counter()
+        due = min(int((now - t0) * rate) + 1, total)
+        if due > k:
+            emit([(t0 + i / rate, devices[i % n]) for i in range(k, due)])
+            with stats.lock:
+                stats.scheduled += due - k
+            k = due
+        if now >= next_report:
+            print(stats.report(pending()), flush=True)
+            next_report += report_sec
+        await asyncio.sleep(max(0.0, min(tick_sec, t0 + k / rate - time.perf_counter())))
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description=description)
+    ap.add_argument("--devices", type=int, default=SIM_DEVICES, help="dispozitive virtuale")
+    ap.add_argument("--products", type=int, default=50, help="productId-uri distincte")
+    ap.add_argument("--rate", type=float, default=SIM_RATE, help="mesaje/s agregat")
+    ap.add_argument("--duration", type=float, default=SIM_DURATION_SEC, help="secunde (0 = nelimitat)")
+    ap.add_argument("--seed", type=int, default=SIM_SEED)
+    ap.add_argument("--report-sec", type=float, default=5.0)
+    ap.add_argument("--summary", help="scrie sumarul final (JSON) în acest fișier")
+    ap.add_argument("--print", dest="print_payloads", action="store_true", help="afișează fiecare payload")
+    return ap
+
+def finish(stats: Stats, args, **extra) -> Dict[str, Any]:
+    summary = stats.summary(devices=args.devices, rate_target=args.rate, **extra)
+    print("[SIM] summary " + json.dumps(summary), flush=True)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+# -------------------------- MQTT --------------------------
+class MqttSink:
+    """
+    Publică pe K conexiuni MQTT (dispozitivul i pe conexiunea i % K). La QoS 0 latența
+    se închide când publish() a pus mesajul în buffer-ul clientului; la QoS 1/2 la PUBACK/PUBCOMP.
+    """
+    def __init__(self, host: str, port: int, clients: int, qos: int, inflight: int,
+                 stats: Stats, print_payloads: bool = False):
+        import paho.mqtt.client as mqtt
+        self.qos, self.stats, self.print_payloads = qos, stats, print_payloads
+        self.lock = threading.Lock()
+        self.pending: Dict[Tuple[int, int], float] = {}
+        self.early = set()            # PUBACK sosit înainte să înregistrăm mid-ul
+        self.clients = []
+        for ci in range(clients):
+            client = mqtt.Client(client_id=f"{CLIENT_ID}-{ci}", clean_session=True)
+            client.max_inflight_messages_set(inflight)
+            client.on_publish = lambda c, userdata, mid, ci=ci: self._acked(ci, mid)
+            client.connect(host, port, keepalive=30)
+            client.loop_start()
+            self.clients.append(client)
+
+    def _acked(self, ci: int, mid: int):
+        if self.qos == 0:
+            return
+        key = (ci, mid)
+        with self.lock:
+            intended = self.pending.pop(key, None)
+            if intended is None:
+                self.early.add(key)
+                return
+        self.stats.done([intended])
+
+    def emit(self, due: List[Tuple[float, Device]]):
+        acked = []
+        for i, (intended, dev) in enumerate(due):
+            payload = dev.payload(intended)
+            ci = dev.index % len(self.clients)
+            info = self.clients[ci].publish(dev.topic, json.dumps(payload), qos=self.qos, retain=False)
+            if self.print_payloads:
+                print(f"[PUB] {dev.topic} {payload}")
+            if info.rc != 0:
+                self.stats.failed()
+            elif self.qos == 0:
+                acked.append(intended)
+            else:
+                key = (ci, info.mid)
+                with self.lock:
+                    if key in self.early:
+                        self.early.discard(key)
+                        acked.append(intended)
+                    else:
+                        self.pending[key] = intended
+        if acked:
+            self.stats.done(acked)
+
+    def inflight(self) -> int:
+        return len(self.pending)
+
+    def close(self):
+        for client in self.clients:
+            client.loop_stop(); client.disconnect()
 
 def main():
-    client = mqtt.Client(client_id=CLIENT_ID, clean_session=True)
-    client.connect(MQTT_HOST, MQTT_PORT, keepalive=30)
-    client.loop_start()
-    topics = {"gps":"sc/telemetry/gps","stock":"sc/telemetry/stock","env":"sc/telemetry/env"}
-    print(f"[SIM] Connected to MQTT {MQTT_HOST}:{MQTT_PORT} as {CLIENT_ID}")
+    ap = base_parser("Generator de încărcare MQTT (open-loop)")
+    ap.add_argument("--host", default=MQTT_HOST)
+    ap.add_argument("--port", type=int, default=MQTT_PORT)
+    ap.add_argument("--clients", type=int, default=1, help="conexiuni MQTT paralele")
+    ap.add_argument("--qos", type=int, choices=(0, 1, 2), default=0)
+    ap.add_argument("--inflight", type=int, default=1000, help="mesaje QoS>0 neconfirmate per conexiune")
+    args = ap.parse_args()
 
+    stats = Stats()
+    devices = make_devices(args.devices, args.products, args.seed)
+    sink = MqttSink(args.host, args.port, args.clients, args.qos, args.inflight, stats, args.print_payloads)
+    print(f"[SIM] Connected to MQTT {args.host}:{args.port} as {CLIENT_ID} "
+          f"devices={args.devices} rate={args.rate}/s clients={args.clients} qos={args.qos}")
     try:
-        while True:
-            sensor = random.choice(list(topics.keys()))
-            payload = make_payload(sensor)
-            client.publish(topics[sensor], json.dumps(payload), qos=0, retain=False)
-            print(f"[PUB] {topics[sensor]} {payload}")
-            time.sleep(random.uniform(1.0, 2.0))
+        asyncio.run(run_open_loop(devices, args.rate, args.duration, stats, sink.emit,
+                                  sink.inflight, args.report_sec))
+        if args.qos:
+            deadline = time.time() + 5                # ultimele confirmări
+            while sink.inflight() and time.time() < deadline:
+                time.sleep(0.05)
     except KeyboardInterrupt:
         pass
     finally:
-        client.loop_stop(); client.disconnect()
+        sink.close()
+        finish(stats, args, mode="mqtt", qos=args.qos, clients=args.clients)
 
 if __name__ == "__main__":
     main()
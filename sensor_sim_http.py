@@ -0,0 +1,167 @@
+"""
+Modul HTTP al generatorului de încărcare: aceleași dispozitive și aceeași programare open-loop
+ca sensor_sim.py, dar batch-urile merg direct în cloud prin POST /ingest (fără broker/edge).
+
+Latența per mesaj = sfârșitul POST-ului care l-a dus - momentul planificat, deci include
+așteptarea în batch și după o conexiune liberă.
+
+    python sensor_sim_http.py --url http://localhost:8001/ingest --devices 600 --rate 20000 --batch 500
+"""
+import asyncio, gzip, json, os, time
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from sensor_sim import Device, Stats, base_parser, finish, make_devices, run_open_loop
+
+CLOUD_INGEST_URL = os.getenv("CLOUD_INGEST_URL", "http://localhost:8001/ingest")
+
+# -------------------------- Client HTTP/1.1 keep-alive minimal --------------------------
+class Connection:
+    """O conexiune persistentă; suficient pentru răspunsurile JSON ale /ingest (Content-Length)."""
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def post(self, path: str, body: bytes, headers: dict) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = [f"POST {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        head += [f"{k}: {v}" for k, v in headers.items()]
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        length, close = None, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                close = True
+        if length is None:
+            await self.reader.read()
+            close = True
+        else:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+class HttpSink:
+    """
+    Strânge mesajele în batch-uri ({"items": [...]}, opțional gzip) tăiate la `batch` items sau
+    după `linger_sec`; fiecare batch e un task care ia o conexiune din pool. Programarea nu
+    așteaptă după POST-uri (open-loop): backlog-ul crește, iar latența îl arată.
+    """
+    def __init__(self, url: str, batch: int, linger_sec: float, concurrency: int, use_gzip: bool,
+                 stats: Stats, print_payloads: bool = False):
+        parts = urlsplit(url)
+        self.path = parts.path or "/ingest"
+        self.batch, self.linger_sec, self.use_gzip = batch, linger_sec, use_gzip
+        self.stats, self.print_payloads = stats, print_payloads
+        self.pool: asyncio.Queue = asyncio.Queue()
+        for _ in range(concurrency):
+            self.pool.put_nowait(Connection(parts.hostname or "localhost", parts.port or 80))
+        self.buffer: List[Tuple[float, dict]] = []
+        self.tasks = set()
+        self.queued = 0               # mesaje tăiate în batch-uri, încă netrimise
+
+    def emit(self, due: List[Tuple[float, Device]]):
+        for intended, dev in due:
+            payload = dev.payload(intended)
+            payload["_edge"] = {"topic": dev.topic}     # cloud-ul ia topic-ul din metadatele edge
+            if self.print_payloads:
+                print(f"[PUB] {dev.topic} {payload}")
+            self.buffer.append((intended, payload))
+        while len(self.buffer) >= self.batch:
+            self._cut(self.batch)
+
+    def _cut(self, n: int):
+        chunk, self.buffer = self.buffer[:n], self.buffer[n:]
+        self.queued += len(chunk)
+        task = asyncio.get_running_loop().create_task(self._send(chunk))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, chunk: List[Tuple[float, dict]]):
+        body = json.dumps({"items": [p for _, p in chunk]}).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.use_gzip:
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        conn = await self.pool.get()
+        try:
+            status = await conn.post(self.path, body, headers)
+        except Exception as e:
+            conn.close()
+            status = None
+            print(f"[SIM] POST error: {e}")
+        finally:
+            self.pool.put_nowait(conn)
+            self.queued -= len(chunk)
+        if status is not None and status < 300:
+            self.stats.done([t for t, _ in chunk])
+        else:
+            self.stats.failed(len(chunk))
+            if status is not None:
+                print(f"[SIM] POST status={status} items={len(chunk)}")
+
+    async def linger_loop(self):
+        while True:
+            await asyncio.sleep(self.linger_sec / 2)
+            if self.buffer and time.perf_counter() - self.buffer[0][0] >= self.linger_sec:
+                self._cut(len(self.buffer))
+
+    async def drain(self):
+        if self.buffer:
+            self._cut(len(self.buffer))
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+    def pending(self) -> int:
+        return len(self.buffer) + self.queued
+
+async def run(args, stats: Stats):
+    devices = make_devices(args.devices, args.products, args.seed)
+    sink = HttpSink(args.url, args.batch, args.linger, args.concurrency, args.gzip, stats, args.print_payloads)
+    linger = asyncio.create_task(sink.linger_loop())
+    try:
+        await run_open_loop(devices, args.rate, args.duration, stats, sink.emit, sink.pending, args.report_sec)
+        await sink.drain()
+    finally:
+        linger.cancel()
+
+def main():
+    ap = base_parser("Generator de încărcare HTTP (open-loop, POST /ingest)")
+    ap.add_argument("--url", default=CLOUD_INGEST_URL)
+    ap.add_argument("--batch", type=int, default=500, help="items per POST")
+    ap.add_argument("--linger", type=float, default=0.2, help="vârsta maximă a unui batch parțial (s)")
+    ap.add_argument("--concurrency", type=int, default=4, help="conexiuni / POST-uri simultane")
+    ap.add_argument("--gzip", action="store_true", help="Content-Encoding: gzip")
+    args = ap.parse_args()
+
+    stats = Stats()
+    print(f"[SIM] POST {args.url} devices={args.devices} rate={args.rate}/s batch={args.batch} "
+          f"concurrency={args.concurrency}")
+    try:
+        asyncio.run(run(args, stats))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        finish(stats, args, mode="http", batch=args.batch, concurrency=args.concurrency, gzip=args.gzip)
+
+if __name__ == "__main__":
+    main()